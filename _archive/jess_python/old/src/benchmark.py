@@ -0,0 +1,251 @@
+import copy
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+from gcode_compact import GcodeCompactor
+from gcode_parser import strip_comments
+from marlin_port import MarlinPort
+from planner.cust_types import IMandrelParameters, ITowParameters
+from planner.planner import buildLayer, helicalLayerGeometry, writeWind
+from plotter.plot import plot_gcode
+from toolpath_file import iter_program_lines
+
+BENCHMARK_STAGES = ("plan", "plot", "send")
+
+# Winds scaled from input.json, each stretching one thing the planner and plotter scale with
+BENCHMARK_FIXTURES: Dict[str, Dict[str, Any]] = {
+    "base": {},
+    "long-mandrel": {"wind_length_scale": 8},
+    "wide-mandrel": {"diameter_scale": 3},
+    "many-layers": {"layer_count": 12},
+    "fine-pattern": {"pattern_number": 5},
+}
+
+BASE_WIND_PATH = Path(__file__).with_name("input.json")
+
+# Lines of each program the send stage streams. A whole program takes minutes even emulated.
+DEFAULT_SEND_LINES = 2000
+# The fastest link Marlin offers, so the sender's own overhead is what limits the send stage
+SEND_BAUD_RATE = 1000000
+
+# Throughput may fall, and peak memory rise, by this fraction before it counts as a regression
+REGRESSION_TOLERANCE = 0.1
+
+
+def scale_wind(
+    wind: Dict[str, Any],
+    wind_length_scale: float = 1,
+    diameter_scale: float = 1,
+    layer_count: Optional[int] = None,
+    pattern_number: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    A copy of a wind definition with a longer or wider mandrel, more layers or another pattern.
+
+    Layers are repeated in order to make up `layer_count`. Helical layers take the pattern
+    number nearest `pattern_number` that divides their circuit count, so that they still plan.
+    """
+    scaled = copy.deepcopy(wind)
+    scaled["mandrelParameters"]["windLength"] *= wind_length_scale
+    scaled["mandrelParameters"]["diameter"] *= diameter_scale
+    if layer_count is not None:
+        layers = scaled["layers"]
+        scaled["layers"] = [copy.deepcopy(layers[index % len(layers)]) for index in range(layer_count)]
+
+    for layer in scaled["layers"]:
+        if layer["windType"] != "helical":
+            continue
+        geometry = helicalLayerGeometry({
+            "parameters": buildLayer(layer),
+            "mandrelParameters": IMandrelParameters(**scaled["mandrelParameters"]),
+            "towParameters": ITowParameters(**scaled["towParameters"]),
+        })
+        num_circuits = geometry["numCircuits"]
+        wanted = layer["patternNumber"] if pattern_number is None else pattern_number
+        divisors = [number for number in range(1, num_circuits + 1) if num_circuits % number == 0]
+        if divisors:
+            layer["patternNumber"] = min(divisors, key=lambda number: (abs(number - wanted), number))
+    return scaled
+
+
+def _benchmark_plan(wind_path: Path, gcode_path: Path) -> int:
+    with open(wind_path, "r") as f:
+        wind = json.load(f)
+    with open(gcode_path, "w") as sink, redirect_stdout(io.StringIO()):
+        return writeWind(wind, sink)
+
+
+def _benchmark_plot(gcode_path: Path) -> int:
+    with open(gcode_path, "r") as f:
+        gcode = f.read().split("\n")
+    plot_gcode(gcode)
+    return len(gcode)
+
+
+def _benchmark_send(gcode_path: Path, send_lines: int) -> int:
+    """
+    Stream the start of a program to an emulated Marlin as `run` would, moves taking no time.
+    """
+    # Needs a pseudo-terminal, so only where the send stage runs
+    from marlin_emulator import MarlinEmulator, MarlinEmulatorThread
+
+    compactor = GcodeCompactor()
+    commands = compactor.compact_lines(islice(strip_comments(iter_program_lines(gcode_path)), send_lines))
+    emulator_thread = MarlinEmulatorThread(MarlinEmulator(baud_rate=SEND_BAUD_RATE, time_scale=0))
+    with redirect_stdout(io.StringIO()):
+        marlin = MarlinPort(emulator_thread.open(), streaming=True)
+        marlin.initialize()
+        if marlin.send_lines(commands):
+            marlin.wait_until_done()
+        marlin.reset()
+    emulator_thread.close()
+    return compactor.report.lines_out
+
+
+def _run_stage(stage: str, wind_path: Path, gcode_path: Path, send_lines: int) -> Dict[str, Any]:
+    """
+    Run one stage in a fresh worker process, timing it and reading the process's peak memory.
+    """
+    # Unix only, so not imported with the constants the command line reads
+    import resource
+
+    start_time = time.perf_counter()
+    if stage == "plan":
+        lines = _benchmark_plan(wind_path, gcode_path)
+    elif stage == "plot":
+        lines = _benchmark_plot(gcode_path)
+    else:
+        lines = _benchmark_send(gcode_path, send_lines)
+    wall_s = time.perf_counter() - start_time
+
+    # Kilobytes on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_memory_mb = peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {"lines": lines, "wall_s": wall_s, "peak_memory_mb": peak_memory_mb}
+
+
+def run_benchmarks(
+    fixtures: Sequence[str] = tuple(BENCHMARK_FIXTURES),
+    stages: Sequence[str] = BENCHMARK_STAGES,
+    repeat: int = 3,
+    send_lines: int = DEFAULT_SEND_LINES,
+) -> Dict[str, Any]:
+    """
+    Time each stage on each fixture and record its throughput and peak memory.
+
+    Every run is in a new process, so peak memory is the stage's own, and the best of `repeat`
+    runs is kept. Plot and send read the G-code the plan stage wrote, so plan always runs.
+    """
+    with open(BASE_WIND_PATH, "r") as f:
+        base_wind = json.load(f)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir, ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for fixture in fixtures:
+            wind_path = Path(work_dir) / f"{fixture}.json"
+            gcode_path = Path(work_dir) / f"{fixture}.gcode"
+            with open(wind_path, "w") as f:
+                json.dump(scale_wind(base_wind, **BENCHMARK_FIXTURES[fixture]), f)
+
+            for stage in BENCHMARK_STAGES:
+                is_measured = stage in stages
+                if not is_measured and stage != "plan":
+                    continue
+                # One after another, so that runs do not compete for the CPU
+                runs = [
+                    executor.submit(_run_stage, stage, wind_path, gcode_path, send_lines).result()
+                    for _ in range(repeat if is_measured else 1)
+                ]
+                if not is_measured:
+                    continue
+
+                wall_s = min(run["wall_s"] for run in runs)
+                result = {
+                    "fixture": fixture,
+                    "stage": stage,
+                    "lines": runs[0]["lines"],
+                    "wall_s": wall_s,
+                    "lines_per_second": runs[0]["lines"] / wall_s if wall_s > 0 else 0.0,
+                    "peak_memory_mb": min(run["peak_memory_mb"] for run in runs),
+                    "runs_wall_s": [run["wall_s"] for run in runs],
+                }
+                print(
+                    f"{fixture:<14} {stage:<5} {result['lines']:>8} lines in {wall_s:7.3f} s: "
+                    f"{result['lines_per_second']:>10.0f} lines/s, peak {result['peak_memory_mb']:.0f} MB"
+                )
+                results.append(result)
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "send_lines": send_lines,
+        "fixtures": {fixture: BENCHMARK_FIXTURES[fixture] for fixture in fixtures},
+        "results": results,
+    }
+
+
+def write_benchmarks(benchmarks: Dict[str, Any], path: Union[str, Path]):
+    with open(path, "w") as f:
+        json.dump(benchmarks, f, indent=2)
+
+
+def read_benchmarks(path: Union[str, Path]) -> Dict[str, Any]:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+class BenchmarkComparison:
+    def __init__(self, fixture: str, stage: str, baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float):
+        self.fixture = fixture
+        self.stage = stage
+        # Fractional changes, positive when the current run is faster or uses more memory
+        self.throughput_change = current["lines_per_second"] / baseline["lines_per_second"] - 1
+        self.memory_change = current["peak_memory_mb"] / baseline["peak_memory_mb"] - 1
+        self.lines_changed = current["lines"] != baseline["lines"]
+        self.is_slower = self.throughput_change < -tolerance
+        self.uses_more_memory = self.memory_change > tolerance
+
+    @property
+    def is_regression(self) -> bool:
+        return self.is_slower or self.uses_more_memory
+
+    def describe(self) -> str:
+        flags = []
+        if self.is_slower:
+            flags.append("SLOWER")
+        if self.uses_more_memory:
+            flags.append("MORE MEMORY")
+        if self.lines_changed:
+            flags.append("line count changed")
+        return (
+            f"{self.fixture:<14} {self.stage:<5} throughput {self.throughput_change * 100:+6.1f}%, "
+            f"peak memory {self.memory_change * 100:+6.1f}%  {', '.join(flags)}"
+        ).rstrip()
+
+
+def compare_benchmarks(
+    baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = REGRESSION_TOLERANCE
+) -> List[BenchmarkComparison]:
+    """
+    Compare every fixture and stage measured in both runs, in the current run's order.
+    """
+    baseline_results = {(result["fixture"], result["stage"]): result for result in baseline["results"]}
+    return [
+        BenchmarkComparison(
+            result["fixture"], result["stage"], baseline_results[(result["fixture"], result["stage"])], result, tolerance
+        )
+        for result in current["results"]
+        if (result["fixture"], result["stage"]) in baseline_results
+    ]
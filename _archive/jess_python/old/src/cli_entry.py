@@ -1,29 +1,147 @@
 import argparse
+import io
 import json
-from marlin_port import MarlinPort
-from planner.planner import planWind
-from plotter.plot import plot_gcode
+import os
+from contextlib import redirect_stdout
+import numpy as np
+from benchmark import (
+    BENCHMARK_FIXTURES,
+    BENCHMARK_STAGES,
+    DEFAULT_SEND_LINES,
+    REGRESSION_TOLERANCE,
+    compare_benchmarks,
+    read_benchmarks,
+    run_benchmarks,
+    write_benchmarks,
+)
+from gcode_compact import DEFAULT_AXIS_DIGITS, GcodeCompactor, compact_gcode_file, parse_axis_digits
+from marlin_port import MARLIN_BAUD_RATE, MARLIN_BLOCK_BUFFER_SIZE, MARLIN_BUFSIZE, MARLIN_RX_BUFFER_SIZE, MarlinPort
+from planner.cust_types import IMandrelParameters, ITowParameters
+from planner.planner import writeWind, writeWindToolpath
+from planner.estimate import estimateWind
+from planner.layer_cache import LayerCache, default_cache_dir
+from planner.machine_profile import MachineProfile
+from planner.motion_model import MarlinMotionConfig, simulate_marlin_time
+from planner.sweep import (
+    SWEEP_FIELDS,
+    SWEEP_INTEGER_FIELDS,
+    SWEEP_OBJECTIVES,
+    parseSweepValues,
+    sweepHelicalLayer,
+    writeSweepCsv,
+    writeSweepJson,
+)
+from planner.toolpath import Toolpath, layer_ranges, profile_toolpath
+from run_journal import JOURNAL_SUFFIX, CheckpointTracker, RunJournal, read_resume_checkpoint
+from sender_metrics import JsonLinesMetricsFile, MetricsEndpoint, summarize_metrics
+from plotter.coverage import CoverageSimulator
+from plotter.plot import load_gcode, plot_toolpath
+from plotter.tiles import TilePyramid, write_tile_pyramid
+from toolpath_file import (
+    TOOLPATH_FILE_SUFFIX,
+    export_gcode,
+    is_toolpath_file,
+    iter_program_lines,
+    read_program,
+    write_toolpath_file,
+)
 import sys
+import threading
 from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
 
+if TYPE_CHECKING:
+    # Only imported when emulating, since pseudo-terminals need a Unix host
+    from marlin_emulator import MarlinEmulator
 
-def run_gcode(file: str, port: str, verbose: bool):
+
+def run_gcode(
+    file: str,
+    port: Optional[str],
+    verbose: bool,
+    streaming: bool = False,
+    buffer_size: int = MARLIN_BUFSIZE,
+    rx_buffer_bytes: int = MARLIN_RX_BUFFER_SIZE,
+    emulator: Optional["MarlinEmulator"] = None,
+    metrics_file: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+    journal: Optional[str] = None,
+    resume: bool = False,
+    compactor: Optional[GcodeCompactor] = None,
+):
     """
-    Run a G-code file on the machine.
+    Run a G-code file on the machine, or on an emulated Marlin if one is given instead of a port.
+
+    Sender metrics are appended to `metrics_file` as JSON lines and served on `metrics_port`,
+    when given, every second while the job runs. Progress is journaled to `journal` the same
+    way, and with `resume` the run starts from the last checkpoint the journal reached.
+    Commands are shortened by `compactor` on their way to the machine, if one is given.
     """
-    marlin = MarlinPort(port, verbose)
-    marlin.initialize()
+    start_index = 0
+    if resume:
+        try:
+            checkpoint = read_resume_checkpoint(journal, file)
+        except (OSError, ValueError) as error:
+            print(f"Cannot resume: {str(error)}")
+            return
+        if checkpoint is None:
+            print("The journal has no checkpoint yet, starting from the beginning")
+        else:
+            start_index = checkpoint.command_index
+            x, y, z = checkpoint.position
+            print(f"Resuming from {checkpoint.label}, at line {checkpoint.source_line}")
+            print(f"The machine must be at carriage {x} mm, delivery head {z} degrees, mandrel {y % 360} degrees")
+            try:
+                input("Press Enter when it is...")
+            except EOFError:
+                pass
 
-    with open(file, "r") as f:
-        data = f.read()
+    # Layers are announced as their commands are read, a queue's length ahead of the machine
+    tracker = CheckpointTracker(iter_program_lines(file), start_index, on_layer=print)
+    # One line out for every command in, so the journal's command counts still hold
+    commands = tracker if compactor is None else compactor.compact_lines(tracker)
+
+    metrics_sinks = []
+    run_journal = None
+    if journal is not None:
+        run_journal = RunJournal(journal, file, tracker)
+        metrics_sinks.append(run_journal)
+    if metrics_file is not None:
+        metrics_sinks.append(JsonLinesMetricsFile(metrics_file))
+    if metrics_port is not None:
+        endpoint = MetricsEndpoint(metrics_port)
+        metrics_sinks.append(endpoint)
+        print(f"Serving sender metrics on http://127.0.0.1:{endpoint.port}/metrics")
+
+    emulator_thread = None
+    if emulator is not None:
+        from marlin_emulator import MarlinEmulatorThread, print_emulator_stats
+
+        emulator_thread = MarlinEmulatorThread(emulator)
+        port = emulator_thread.open()
+        print(f"Emulating Marlin on '{port}'")
 
-    print(f"Sending commands from '{file}'")
+    marlin = MarlinPort(
+        port,
+        verbose,
+        streaming=streaming,
+        buffer_size=buffer_size,
+        rx_buffer_bytes=rx_buffer_bytes,
+        metrics_sinks=metrics_sinks,
+    )
+    marlin.initialize()
+
+    print(f"Sending '{file}'")
 
     # Handle keypress events
     def keypress_handler():
         print('Press "Space" to pause/resume...')
         while True:
-            key = input()
+            try:
+                key = input()
+            except EOFError:
+                # No terminal to read from, as under CI
+                return
             if key == " ":
                 if marlin.is_paused():
                     print("Resuming machine...")
@@ -33,77 +151,568 @@ def run_gcode(file: str, port: str, verbose: bool):
                     marlin.pause()
 
     # Run the keypress handler in a separate thread
-    import threading
     threading.Thread(target=keypress_handler, daemon=True).start()
 
-    # Queue commands
-    for command in data.strip().split("\n"):
-        marlin.queue_command(command)
+    # Commands are read as the machine takes them, so the first goes out at once and only a
+    # bounded number are ever held in memory
+    is_finished = False
+    try:
+        if marlin.send_lines(commands):
+            marlin.wait_until_done()
+            is_finished = True
+    except KeyboardInterrupt:
+        print("Cancelling, the commands Marlin already has will still run")
+        marlin.cancel()
+
+    for line in summarize_metrics(marlin.metrics_snapshot()):
+        print(line)
+    if compactor is not None:
+        print(compactor.report.describe(MARLIN_BAUD_RATE))
+
+    # Also writes the last metrics snapshot
+    marlin.reset()
+    if run_journal is not None and is_finished:
+        run_journal.finish()
+    for sink in metrics_sinks:
+        sink.close()
+
+    if emulator_thread is not None:
+        emulator_thread.wait_until_idle()
+        print_emulator_stats(emulator_thread.stats)
+        emulator_thread.close()
+
+
+def emulate_marlin(emulator: "MarlinEmulator"):
+    """
+    Emulate Marlin on a pseudo-terminal until interrupted, for a sender to connect to.
+    """
+    from marlin_emulator import MarlinEmulatorThread, print_emulator_stats
+
+    emulator_thread = MarlinEmulatorThread(emulator)
+    port = emulator_thread.open()
+    print(f"Emulating Marlin on '{port}', press Ctrl+C to stop")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+    print_emulator_stats(emulator_thread.stats)
+    emulator_thread.close()
+
+
+class MotionTimePrinter:
+    """
+    Layer callback that prints the Marlin motion model's view of each planned layer.
+    """
+
+    def __init__(self, config: MarlinMotionConfig):
+        self.config = config
+        # The planner writes three header lines before the first layer
+        self.lines_before_layer = 3
+
+    def __call__(self, toolpath: Toolpath):
+        for report in simulate_marlin_time(toolpath, self.config):
+            if report.num_blocks == 0:
+                continue
+            print(
+                f"Marlin time model: {report.planner_time_s} seconds with acceleration, "
+                f"{report.streamed_time_s} seconds streamed over serial"
+            )
+            print(
+                f"{report.link_bound_blocks} of {report.num_blocks} blocks limited by the serial link, "
+                f"{report.short_blocks} shorter than the minimum segment time"
+            )
+            for start, stop in report.link_bound_runs:
+                print(
+                    f"  Link-bound lines {self.lines_before_layer + start + 1}"
+                    f"-{self.lines_before_layer + stop}"
+                )
+        self.lines_before_layer += len(toolpath)
 
 
-def generate_gcode(file: str, output: str, verbose: bool):
+def generate_gcode(
+    file: str,
+    output: str,
+    verbose: bool,
+    collapse_tolerance: Optional[float] = None,
+    motion_config: Optional[MarlinMotionConfig] = None,
+    jobs: int = 1,
+    layer_cache: Optional[LayerCache] = None,
+    compactor: Optional[GcodeCompactor] = None,
+    machine_profile: Optional[MachineProfile] = None,
+):
     """
-    Generate G-code from a .wind file.
+    Generate G-code from a .wind file, or a binary toolpath if the output ends in .fwtp.
+
+    Coordinates are put on the step grid of `machine_profile`, if one is given. G-code is
+    rewritten by `compactor` once planned, if one is given.
     """
     with open(file, "r") as f:
         wind_definition = json.load(f)
 
-    wind_commands = planWind(wind_definition, verbose)
+    layer_callback = None
+    if motion_config is not None:
+        layer_callback = MotionTimePrinter(motion_config)
 
-    with open(output, "w") as f:
-        f.write("\n".join(wind_commands))
+    if output.endswith(TOOLPATH_FILE_SUFFIX):
+        num_commands = writeWindToolpath(
+            wind_definition,
+            output,
+            verbose,
+            collapse_tolerance,
+            layerCallback=layer_callback,
+            jobs=jobs,
+            layerCache=layer_cache,
+            machineProfile=machine_profile,
+        )
+    else:
+        with open(output, "w") as f:
+            num_commands = writeWind(
+                wind_definition,
+                f,
+                verbose,
+                collapse_tolerance,
+                layerCallback=layer_callback,
+                jobs=jobs,
+                layerCache=layer_cache,
+                machineProfile=machine_profile,
+            )
 
-    print(f"Wrote {len(wind_commands)} commands to '{output}'")
+    if layer_cache is not None:
+        print(f"Layer cache: {layer_cache.hits} hits, {layer_cache.misses} misses")
 
+    print(f"Wrote {num_commands} commands to '{output}'")
 
-def visualize_gcode(file: str, output: str):
+    if compactor is not None:
+        if output.endswith(TOOLPATH_FILE_SUFFIX):
+            print("Binary toolpaths are not compacted, only G-code is")
+        else:
+            print(compact_gcode_file(output, compactor).describe(MARLIN_BAUD_RATE))
+
+
+def estimate_wind(file: str):
     """
-    Visualize the contents of a G-code file as a PNG.
+    Estimate the time and tow usage of a .wind file without generating G-code.
+
+    Planned programs, as G-code or binary toolpaths, are measured move by move instead.
+    """
+    if is_toolpath_file(file):
+        estimate_program(file)
+        return
+
+    with open(file, "r") as f:
+        try:
+            wind_definition = json.load(f)
+        except json.JSONDecodeError:
+            estimate_program(file)
+            return
+
+    estimate = estimateWind(wind_definition)
+
+    for layer_index, layer in enumerate(estimate.layers):
+        print(f"Layer {layer_index + 1} of {len(wind_definition['layers'])}: {layer.windType.value}")
+        if layer.numCircuits is not None:
+            print(f"Circuits: {layer.numCircuits}")
+        if not layer.patternValid:
+            print("WARNING: Circuit number not divisible by pattern number, layer will be skipped")
+        print(f"Layer time estimate: {layer.timeS} seconds")
+        print(f"Layer tow required: {layer.towLengthM} meters")
+        print("-" * 80)
+
+    print(f"\nTotal time estimate: {estimate.totalTimeS} seconds")
+    print(f"Total tow required: {estimate.totalTowLengthM} meters")
+
+
+def estimate_program(file: str):
+    """
+    Measure the time and tow usage of each layer of a planned program.
+    """
+    program = read_program(file)
+    if program.header is None:
+        print("Did not find the winding parameters in the header")
+        return
+
+    toolpath = program.toolpath
+    row_times_s, row_tow_lengths_mm = profile_toolpath(toolpath, program.header["mandrel"]["diameter"])
+
+    for name, start, stop in layer_ranges(toolpath):
+        print(name)
+        print(f"Layer time estimate: {row_times_s[start:stop].sum()} seconds")
+        print(f"Layer tow required: {row_tow_lengths_mm[start:stop].sum() / 1000} meters")
+        print("-" * 80)
+
+    print(f"\nTotal time estimate: {row_times_s.sum()} seconds")
+    print(f"Total tow required: {row_tow_lengths_mm.sum() / 1000} meters")
+
+
+def export_program(file: str, output: str):
+    """
+    Convert a planned program to G-code, or to a binary toolpath if the output ends in .fwtp.
+    """
+    program = read_program(file)
+
+    if output.endswith(TOOLPATH_FILE_SUFFIX):
+        write_toolpath_file(output, program.toolpath, program.header)
+    else:
+        with open(output, "w") as f:
+            export_gcode(program.toolpath, f)
+
+    print(f"Wrote {len(program.toolpath)} commands to '{output}'")
+
+
+def sweep_helical_layer(
+    file: str,
+    grid: Dict[str, List[float]],
+    objective: str,
+    output_format: str,
+    output: Optional[str],
+    layer: Optional[int],
+    jobs: int,
+):
+    """
+    Estimate a helical layer over a grid of parameters and write the ranked results.
     """
     with open(file, "r") as f:
-        file_contents = f.read()
+        wind_definition = json.load(f)
 
-    stream = plot_gcode(file_contents.split("\n"))
+    layer_index = None if layer is None else layer - 1
+    points = sweepHelicalLayer(wind_definition, grid, objective, layer_index, jobs)
+    write_points = writeSweepCsv if output_format == "csv" else writeSweepJson
 
-    if stream is None:
+    if output is None:
+        write_points(points, sys.stdout)
+        return
+
+    with open(output, "w", newline="") as f:
+        write_points(points, f)
+
+    num_valid = sum(point.patternValid for point in points)
+    print(f"Wrote {len(points)} sweep points ({num_valid} with valid patterns) to '{output}'")
+
+
+def simulate_coverage(
+    file: str,
+    axial_resolution_mm: float,
+    angular_resolution_degrees: float,
+    maps_output: Optional[str],
+    jobs: int,
+):
+    """
+    Plan a .wind file and report how its tow covers the mandrel.
+    """
+    with open(file, "r") as f:
+        wind_definition = json.load(f)
+
+    simulator = CoverageSimulator(
+        IMandrelParameters(**wind_definition["mandrelParameters"]),
+        ITowParameters(**wind_definition["towParameters"]),
+        axial_resolution_mm,
+        angular_resolution_degrees,
+    )
+
+    # Only the coverage is reported, so the G-code and planner estimates are discarded
+    with open(os.devnull, "w") as sink, redirect_stdout(io.StringIO()):
+        writeWind(wind_definition, sink, layerCallback=simulator.add_toolpath, jobs=jobs)
+
+    for layer in simulator.layers:
+        print(layer.name)
+        print(f"Coverage: {layer.coverage_fraction * 100:.2f}% of the mandrel ({layer.nominal_tow_count} {'ply' if layer.nominal_tow_count == 1 else 'plies'} nominal)")
+        print(f"Gaps: {layer.gap_fraction * 100:.2f}%, overlaps: {layer.overlap_fraction * 100:.2f}%")
+        print("-" * 80)
+
+    print("\nTotal thickness (mean / max):")
+    for zone, thickness in simulator.end_zone_thickness_mm().items():
+        print(f"  {zone}: {thickness['mean']:.3f} / {thickness['max']:.3f} mm")
+
+    if maps_output is not None:
+        np.savez_compressed(
+            maps_output,
+            thickness_mm=simulator.thickness_mm,
+            layer_tow_counts=np.array([layer.tow_counts for layer in simulator.layers]),
+            layer_names=np.array([layer.name for layer in simulator.layers]),
+        )
+        print(f"\nWrote coverage maps to '{maps_output}'")
+
+
+def visualize_gcode(file: str, output: str):
+    """
+    Visualize the contents of a G-code file as a PNG.
+    """
+    parsed = load_gcode(file)
+    if parsed is None:
         print("No image to write")
         return
 
+    stream = plot_toolpath(*parsed)
+
     with open(output, "wb") as output_file:
         output_file.write(stream.getvalue())
 
     print(f"The PNG file was created at '{output}'")
 
 
+def visualize_gcode_tiles(
+    file: str,
+    output_dir: str,
+    pixels_per_mm: float,
+    tile_size: int,
+    max_zoom: Optional[int],
+    cache_dir: Optional[str],
+    jobs: int,
+):
+    """
+    Render a G-code file as a tile pyramid, from a one-tile overview up to full resolution.
+    """
+    parsed = load_gcode(file)
+    if parsed is None:
+        print("No image to write")
+        return
+
+    pyramid = TilePyramid.from_toolpath(
+        *parsed, pixels_per_mm=pixels_per_mm, tile_size=tile_size, cache_dir=cache_dir
+    )
+    last_zoom = pyramid.max_zoom if max_zoom is None else min(max_zoom, pyramid.max_zoom)
+    num_tiles = write_tile_pyramid(pyramid, Path(output_dir), last_zoom, jobs)
+
+    print(f"Wrote {num_tiles} tiles for zoom levels 0-{last_zoom} to '{output_dir}'")
+
+
+def run_benchmark_suite(
+    fixtures: List[str],
+    stages: List[str],
+    repeat: int,
+    send_lines: int,
+    output: Optional[str],
+    baseline: Optional[str],
+    tolerance: float,
+) -> bool:
+    """
+    Benchmark planning, plotting and sending, optionally saving the results and comparing them
+    to a baseline. Returns False if anything regressed.
+    """
+    benchmarks = run_benchmarks(fixtures, stages, repeat, send_lines)
+
+    if output is not None:
+        write_benchmarks(benchmarks, output)
+        print(f"Wrote benchmark results to '{output}'")
+
+    if baseline is None:
+        return True
+    return print_benchmark_comparison(read_benchmarks(baseline), benchmarks, tolerance)
+
+
+def print_benchmark_comparison(baseline: Dict, current: Dict, tolerance: float) -> bool:
+    """
+    Print how each benchmark changed since the baseline. Returns False if anything regressed.
+    """
+    comparisons = compare_benchmarks(baseline, current, tolerance)
+    print(f"\nCompared with the baseline from {baseline['created']}:")
+    for comparison in comparisons:
+        print(comparison.describe())
+
+    regressions = [comparison for comparison in comparisons if comparison.is_regression]
+    if regressions:
+        print(f"\n{len(regressions)} of {len(comparisons)} benchmarks regressed by more than {tolerance * 100:.0f}%")
+    else:
+        print(f"\nNo regressions beyond {tolerance * 100:.0f}% in {len(comparisons)} benchmarks")
+    return not regressions
+
+
+def add_emulator_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--block-buffer", type=int, default=MARLIN_BLOCK_BUFFER_SIZE, help="Emulated planner buffer length (BLOCK_BUFFER_SIZE)")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiply emulated move times by this (0 runs moves instantly)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the emulator waits before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of numbered lines the emulator rejects as corrupted")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the emulator's injected errors")
+
+
+def parse_steps_per_unit(text: str) -> MachineProfile:
+    return MachineProfile([float(value) for value in text.split(",")])
+
+
+def add_axis_digits_argument(parser: argparse.ArgumentParser):
+    default = ",".join(str(digits) for digits in DEFAULT_AXIS_DIGITS)
+    parser.add_argument("--axis-digits", type=parse_axis_digits, default=DEFAULT_AXIS_DIGITS, help=f"Decimal places kept for X, Y and Z when compacting (defaults to {default})")
+
+
 def main():
     parser = argparse.ArgumentParser(description="CLI for Filament Winder")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # Run Command
     run_parser = subparsers.add_parser("run", help="Run a G-code file on the machine")
-    run_parser.add_argument("file", type=str, help="G-code file to run")
-    run_parser.add_argument("--port", "-p", type=str, required=True, help="Serial port to connect to")
+    run_parser.add_argument("file", type=str, help="G-code or binary toolpath (.fwtp) file to run")
+    run_target = run_parser.add_mutually_exclusive_group(required=True)
+    run_target.add_argument("--port", "-p", type=str, help="Serial port to connect to")
+    run_target.add_argument("--emulate", action="store_true", help="Run on an emulated Marlin instead of the machine")
     run_parser.add_argument("--verbose", "-v", action="store_true", help="Log every command?")
+    run_parser.add_argument("--stream", action="store_true", help="Keep several numbered, checksummed commands in flight instead of waiting for each 'ok'")
+    run_parser.add_argument("--buffer-size", type=int, default=MARLIN_BUFSIZE, help="Marlin's command queue length (BUFSIZE) for --stream")
+    run_parser.add_argument("--rx-buffer", type=int, default=MARLIN_RX_BUFFER_SIZE, help="Marlin's serial receive buffer in bytes (RX_BUFFER_SIZE) for --stream")
+    run_parser.add_argument("--metrics-file", type=str, default=None, help="Append sender metrics to this file as JSON lines every second")
+    run_parser.add_argument("--journal", type=str, default=None, help=f"Journal progress to this file (defaults to the file name plus {JOURNAL_SUFFIX})")
+    run_parser.add_argument("--no-journal", action="store_true", help="Do not journal progress")
+    run_parser.add_argument("--resume", action="store_true", help="Start from the last layer or pass the journal shows was completed")
+    run_parser.add_argument("--metrics-port", type=int, default=None, help="Serve sender metrics on this local HTTP port, at /metrics for Prometheus")
+    run_parser.add_argument("--no-compact", action="store_true", help="Send commands as written, without dropping unchanged axes or rounding")
+    run_parser.add_argument("--modal-g0", action="store_true", help="Leave out repeated G0/G1 codes, for Marlin built with GCODE_MOTION_MODES")
+    add_axis_digits_argument(run_parser)
+    add_emulator_arguments(run_parser)
+
+    # Emulate Command
+    emulate_parser = subparsers.add_parser("emulate", help="Emulate Marlin on a pseudo-terminal, for testing senders without the machine")
+    emulate_parser.add_argument("--buffer-size", type=int, default=MARLIN_BUFSIZE, help="Command queue length (BUFSIZE)")
+    emulate_parser.add_argument("--rx-buffer", type=int, default=MARLIN_RX_BUFFER_SIZE, help="Serial receive buffer in bytes (RX_BUFFER_SIZE)")
+    emulate_parser.add_argument("--baud-rate", type=int, default=MARLIN_BAUD_RATE, help="Speed the serial link is emulated at")
+    emulate_parser.add_argument("--motion-modes", action="store_true", help="Accept moves without a G0/G1 code, like Marlin built with GCODE_MOTION_MODES")
+    add_emulator_arguments(emulate_parser)
 
     # Plan Command
     plan_parser = subparsers.add_parser("plan", help="Generate G-code from a .wind file")
     plan_parser.add_argument("file", type=str, help="Wind definition (.wind) file")
-    plan_parser.add_argument("--output", "-o", type=str, required=True, help="Output file for G-code")
+    plan_parser.add_argument("--output", "-o", type=str, required=True, help="Output file for G-code, or for a binary toolpath if it ends in .fwtp")
     plan_parser.add_argument("--verbose", "-v", action="store_true", help="Include comments explaining segmented moves?")
+    plan_parser.add_argument("--collapse-tolerance", type=float, default=None, help="Merge segmented moves that deviate by at most this many mm/degrees")
+    plan_parser.add_argument("--marlin-time", action="store_true", help="Estimate each layer's time with a model of Marlin's motion planner")
+    plan_parser.add_argument("--jobs", "-j", type=int, default=1, help="Plan layers in this many processes (0 for one per CPU core)")
+    plan_parser.add_argument("--cache-dir", type=Path, default=default_cache_dir(), help="Directory to cache planned layers in")
+    plan_parser.add_argument("--no-cache", action="store_true", help="Plan every layer, without reading or writing the layer cache")
+    plan_parser.add_argument("--lookahead", type=int, default=16, help="Marlin planner buffer size (BLOCK_BUFFER_SIZE) for --marlin-time")
+    plan_parser.add_argument("--compact", action="store_true", help="Drop unchanged axes and round coordinates in the G-code written")
+    plan_parser.add_argument("--steps-per-unit", dest="machine_profile", metavar="STEPS_PER_UNIT", type=parse_steps_per_unit, default=None, help="Put coordinates on the step grid, given the machine's steps per mm for X and per degree for Y and Z as in Marlin's DEFAULT_AXIS_STEPS_PER_UNIT or M92, e.g. 80,8.889,8.889 (defaults to writing coordinates as planned)")
+    add_axis_digits_argument(plan_parser)
+
+    # Estimate Command
+    estimate_parser = subparsers.add_parser("estimate", help="Estimate time and tow usage of a .wind file without planning it")
+    estimate_parser.add_argument("file", type=str, help="Wind definition (.wind) file, or a planned G-code or .fwtp file to measure")
+
+    # Export Command
+    export_parser = subparsers.add_parser("export", help="Convert between G-code and binary toolpath (.fwtp) files")
+    export_parser.add_argument("file", type=str, help="G-code or binary toolpath file")
+    export_parser.add_argument("--output", "-o", type=str, required=True, help="Output file, written as a binary toolpath if it ends in .fwtp")
+
+    # Sweep Command
+    sweep_parser = subparsers.add_parser("sweep", help="Estimate a helical layer over ranges of its parameters")
+    sweep_parser.add_argument("file", type=str, help="Wind definition (.wind) file")
+    sweep_values_help = "Values to try, as start:stop:step (inclusive) or a comma-separated list"
+    sweep_parser.add_argument("--wind-angle", dest="windAngle", type=str, help=sweep_values_help)
+    sweep_parser.add_argument("--pattern-number", dest="patternNumber", type=str, help=sweep_values_help)
+    sweep_parser.add_argument("--lead-in-mm", dest="leadInMM", type=str, help=sweep_values_help)
+    sweep_parser.add_argument("--lock-degrees", dest="lockDegrees", type=str, help=sweep_values_help)
+    sweep_parser.add_argument("--lead-out-degrees", dest="leadOutDegrees", type=str, help=sweep_values_help)
+    sweep_parser.add_argument("--layer", type=int, default=None, help="Layer number to sweep (defaults to the first helical layer)")
+    sweep_parser.add_argument("--objective", choices=list(SWEEP_OBJECTIVES), default="time", help="What to rank the results by, smallest first")
+    sweep_parser.add_argument("--format", choices=["csv", "json"], default="csv", help="Output format")
+    sweep_parser.add_argument("--output", "-o", type=str, default=None, help="Output file (defaults to stdout)")
+    sweep_parser.add_argument("--jobs", "-j", type=int, default=1, help="Evaluate points in this many processes (0 for one per CPU core)")
+
+    # Coverage Command
+    coverage_parser = subparsers.add_parser("coverage", help="Simulate how the tow of a .wind file covers the mandrel")
+    coverage_parser.add_argument("file", type=str, help="Wind definition (.wind) file")
+    coverage_parser.add_argument("--axial-resolution", type=float, default=1.0, help="Grid cell length along the mandrel, in mm")
+    coverage_parser.add_argument("--angular-resolution", type=float, default=1.0, help="Grid cell size around the mandrel, in degrees")
+    coverage_parser.add_argument("--maps", type=str, default=None, help="Save thickness and per-layer tow count maps to this .npz file")
+    coverage_parser.add_argument("--jobs", "-j", type=int, default=1, help="Plan layers in this many processes (0 for one per CPU core)")
 
     # Plot Command
     plot_parser = subparsers.add_parser("plot", help="Visualize the contents of a G-code file")
-    plot_parser.add_argument("file", type=str, help="G-code file to visualize")
-    plot_parser.add_argument("--output", "-o", type=str, required=True, help="PNG file to output")
+    plot_parser.add_argument("file", type=str, help="G-code or binary toolpath (.fwtp) file to visualize")
+    plot_output = plot_parser.add_mutually_exclusive_group(required=True)
+    plot_output.add_argument("--output", "-o", type=str, help="PNG file to output")
+    plot_output.add_argument("--tiles", type=str, help="Directory to write a zoomable tile pyramid to, as {zoom}/{column}_{row}.png")
+    plot_parser.add_argument("--pixels-per-mm", type=float, default=1.0, help="Full resolution of the tile pyramid")
+    plot_parser.add_argument("--tile-size", type=int, default=256, help="Tile width and height in pixels")
+    plot_parser.add_argument("--max-zoom", type=int, default=None, help="Stop the tile pyramid at this zoom level")
+    plot_parser.add_argument("--tile-cache", type=str, default=None, help="Directory to cache rendered tiles in")
+    plot_parser.add_argument("--jobs", "-j", type=int, default=1, help="Render tiles in this many processes (0 for one per CPU core)")
+
+    # Benchmark Command
+    benchmark_parser = subparsers.add_parser("benchmark", help="Measure planning, plotting and sending speed and memory on scaled copies of input.json")
+    benchmark_parser.add_argument("--fixtures", type=str, default=",".join(BENCHMARK_FIXTURES), help=f"Comma-separated fixtures to run, of {', '.join(BENCHMARK_FIXTURES)}")
+    benchmark_parser.add_argument("--stages", type=str, default=",".join(BENCHMARK_STAGES), help=f"Comma-separated stages to measure, of {', '.join(BENCHMARK_STAGES)}")
+    benchmark_parser.add_argument("--repeat", type=int, default=3, help="Runs of each stage, of which the fastest is kept")
+    benchmark_parser.add_argument("--send-lines", type=int, default=DEFAULT_SEND_LINES, help="Lines of each program to send to the emulated Marlin")
+    benchmark_parser.add_argument("--output", "-o", type=str, default=None, help="Save the results to this JSON file, to use as a baseline later")
+    benchmark_parser.add_argument("--baseline", type=str, default=None, help="Compare the results to this saved JSON file, failing if any regressed")
+    benchmark_parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Fraction throughput may fall or peak memory rise by before it is a regression")
+
+    # Compare Benchmarks Command
+    compare_parser = subparsers.add_parser("compare-benchmarks", help="Compare two saved benchmark results, failing if any regressed")
+    compare_parser.add_argument("baseline", type=str, help="Benchmark results to compare against")
+    compare_parser.add_argument("current", type=str, help="Benchmark results to check")
+    compare_parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Fraction throughput may fall or peak memory rise by before it is a regression")
 
     args = parser.parse_args()
 
     if args.command == "run":
-        run_gcode(args.file, args.port, args.verbose)
+        emulator = None
+        if args.emulate:
+            from marlin_emulator import MarlinEmulator
+
+            emulator = MarlinEmulator(
+                args.buffer_size, args.block_buffer, args.rx_buffer, time_scale=args.time_scale,
+                latency_s=args.latency, error_rate=args.error_rate, seed=args.seed, motion_modes=args.modal_g0,
+            )
+        if args.resume and args.no_journal:
+            parser.error("--resume needs the journal, so cannot be used with --no-journal")
+        journal = None if args.no_journal else (args.journal or args.file + JOURNAL_SUFFIX)
+        compactor = None if args.no_compact else GcodeCompactor(args.axis_digits, modal=args.modal_g0)
+        run_gcode(
+            args.file, args.port, args.verbose, args.stream, args.buffer_size, args.rx_buffer, emulator,
+            args.metrics_file, args.metrics_port, journal, args.resume, compactor,
+        )
+    elif args.command == "emulate":
+        from marlin_emulator import MarlinEmulator
+
+        emulate_marlin(MarlinEmulator(
+            args.buffer_size, args.block_buffer, args.rx_buffer, args.baud_rate, args.time_scale,
+            args.latency, args.error_rate, seed=args.seed, motion_modes=args.motion_modes,
+        ))
     elif args.command == "plan":
-        generate_gcode(args.file, args.output, args.verbose)
+        layer_cache = None if args.no_cache else LayerCache(args.cache_dir)
+        motion_config = MarlinMotionConfig(block_buffer_size=args.lookahead) if args.marlin_time else None
+        # Kept to one G0/G1 per move, so every tool reading G-code back can still read it
+        compactor = GcodeCompactor(args.axis_digits, drop_noops=True) if args.compact else None
+        generate_gcode(
+            args.file, args.output, args.verbose, args.collapse_tolerance, motion_config, args.jobs, layer_cache, compactor,
+            args.machine_profile,
+        )
+    elif args.command == "estimate":
+        estimate_wind(args.file)
+    elif args.command == "export":
+        export_program(args.file, args.output)
+    elif args.command == "sweep":
+        grid = {}
+        for field in SWEEP_FIELDS:
+            if getattr(args, field) is None:
+                continue
+            try:
+                grid[field] = parseSweepValues(getattr(args, field), field in SWEEP_INTEGER_FIELDS)
+            except ValueError as error:
+                parser.error(f"{field}: {str(error)}")
+        sweep_helical_layer(args.file, grid, args.objective, args.format, args.output, args.layer, args.jobs)
+    elif args.command == "coverage":
+        simulate_coverage(args.file, args.axial_resolution, args.angular_resolution, args.maps, args.jobs)
     elif args.command == "plot":
-        visualize_gcode(args.file, args.output)
+        if args.tiles is not None:
+            visualize_gcode_tiles(
+                args.file, args.tiles, args.pixels_per_mm, args.tile_size, args.max_zoom, args.tile_cache, args.jobs
+            )
+        else:
+            visualize_gcode(args.file, args.output)
+    elif args.command == "benchmark":
+        fixtures = args.fixtures.split(",")
+        stages = args.stages.split(",")
+        for name, values, allowed in (("fixture", fixtures, BENCHMARK_FIXTURES), ("stage", stages, BENCHMARK_STAGES)):
+            unknown = [value for value in values if value not in allowed]
+            if unknown:
+                parser.error(f"Unknown {name} '{unknown[0]}', expected one of {', '.join(allowed)}")
+        if not run_benchmark_suite(fixtures, stages, args.repeat, args.send_lines, args.output, args.baseline, args.tolerance):
+            sys.exit(1)
+    elif args.command == "compare-benchmarks":
+        if not print_benchmark_comparison(read_benchmarks(args.baseline), read_benchmarks(args.current), args.tolerance):
+            sys.exit(1)
 
 
 if __name__ == "__main__":
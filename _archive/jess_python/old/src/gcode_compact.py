@@ -0,0 +1,185 @@
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from gcode_format import ENumberStyle, format_number
+
+# Decimal places kept for the carriage (mm), mandrel and delivery head (degrees). At 1/16
+# microstepping a direct-driven 1.8 degree motor moves 0.1125 degrees a step, so hundredths
+# of a degree are well inside a step, and the carriage keeps microns whatever its drive.
+DEFAULT_AXIS_DIGITS = (3, 2, 2)
+FEED_RATE_DIGITS = 1
+
+_AXIS_LETTERS = "XYZ"
+
+
+class CompactionReport:
+    def __init__(self):
+        self.lines_in = 0
+        self.lines_out = 0
+        # Counting a newline per line, as sent
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+    @property
+    def fraction_saved(self) -> float:
+        return self.bytes_saved / self.bytes_in if self.bytes_in else 0.0
+
+    def describe(self, baud_rate: int) -> str:
+        # 10 bits on the wire per byte at 8N1
+        seconds_saved = self.bytes_saved * 10 / baud_rate
+        return (
+            f"Compaction: {self.bytes_in} bytes cut to {self.bytes_out} ({self.fraction_saved * 100:.1f}% less), "
+            f"about {seconds_saved:.1f} seconds less on a {baud_rate} baud link"
+        )
+
+
+class GcodeCompactor:
+    """
+    Shortens G-code commands for the serial link without changing the motion they describe.
+
+    Moves keep only the axes whose rounded value changed, with each axis rounded to
+    `axis_digits` decimal places and trailing zeros removed, and a feed rate only when it
+    changed. G92 is sent as it is, since rounding it would shift every later move. Any other
+    command, such as G28 or a G92 without axes, may move the machine or change what its
+    coordinates mean, so the values sent before it are forgotten, and moves are sent as they
+    are between G91 and G90, since relative moves repeat on purpose.
+
+    With `modal` on, a move repeating the previous move's G0 or G1 leaves it out, which Marlin
+    only accepts when built with GCODE_MOTION_MODES.
+
+    Every command gives exactly one line, a move left with nothing to do becoming a bare "G0",
+    unless `drop_noops` is on. Comments must already be removed.
+    """
+
+    def __init__(
+        self,
+        axis_digits: Sequence[int] = DEFAULT_AXIS_DIGITS,
+        modal: bool = False,
+        drop_noops: bool = False,
+    ):
+        self.axis_digits = tuple(axis_digits)
+        self.modal = modal
+        self.drop_noops = drop_noops
+        self.report = CompactionReport()
+
+        # The values last sent, as written, or None before the first
+        self._axes: List[Optional[str]] = [None, None, None]
+        self._feed_rate: Optional[str] = None
+        self._motion_code: Optional[str] = None
+        self._is_relative = False
+
+    def compact(self, command: str) -> Optional[str]:
+        """
+        The compact form of one command, or None if it is dropped.
+        """
+        words = command.split()
+        code = words[0].upper() if words else ""
+        if code in ("G90", "G91"):
+            self._is_relative = code == "G91"
+        compacted = None
+        if code in ("G0", "G1", "G92") and not self._is_relative:
+            compacted = self._compact_axis_command(command, code, words[1:])
+        if compacted is None:
+            self._forget()
+            compacted = command
+
+        self.report.lines_in += 1
+        self.report.bytes_in += len(command) + 1
+        if compacted == "" and self.drop_noops:
+            return None
+        compacted = compacted or "G0"
+        self.report.lines_out += 1
+        self.report.bytes_out += len(compacted) + 1
+        return compacted
+
+    def compact_lines(self, commands: Iterable[str]) -> Iterator[str]:
+        for command in commands:
+            compacted = self.compact(command)
+            if compacted is not None:
+                yield compacted
+
+    def _forget(self):
+        self._axes = [None, None, None]
+        self._feed_rate = None
+        self._motion_code = None
+
+    def _compact_axis_command(self, command: str, code: str, words: List[str]) -> Optional[str]:
+        """
+        The compact move, "" for a move that does nothing, the command itself for a G92 setting
+        axes, or None for a command that cannot be followed.
+        """
+        values = {}
+        for word in words:
+            letter = word[0].upper()
+            if letter not in "XYZF" or letter in values:
+                return None
+            try:
+                values[letter] = float(word[1:])
+            except ValueError:
+                return None
+
+        if code == "G92" and not any(letter in values for letter in _AXIS_LETTERS):
+            return None
+
+        parts = []
+        for axis, letter in enumerate(_AXIS_LETTERS):
+            if letter not in values:
+                continue
+            value = format_number(values[letter], self.axis_digits[axis], ENumberStyle.TRIMMED)
+            if value != self._axes[axis]:
+                parts.append(f"{letter}{value}")
+            self._axes[axis] = value
+
+        if code == "G92":
+            return command
+        if "F" in values:
+            feed_rate = format_number(values["F"], FEED_RATE_DIGITS, ENumberStyle.TRIMMED)
+            if feed_rate != self._feed_rate:
+                parts.append(f"F{feed_rate}")
+                self._feed_rate = feed_rate
+
+        if not parts:
+            return ""
+        if self.modal and code == self._motion_code:
+            return " ".join(parts)
+        self._motion_code = code
+        return " ".join([code] + parts)
+
+
+def parse_axis_digits(text: str) -> Tuple[int, ...]:
+    """
+    Parse decimal places for the three axes, written like "3,2,2".
+    """
+    digits = tuple(int(value) for value in text.split(","))
+    if len(digits) != len(_AXIS_LETTERS) or min(digits) < 0:
+        raise ValueError(f"Expected three decimal places, one per axis, not '{text}'")
+    return digits
+
+
+def compact_gcode_file(path: Union[str, Path], compactor: GcodeCompactor) -> CompactionReport:
+    """
+    Compact a G-code file in place, keeping its comments, such as the header the plotter reads.
+
+    Lines are read and written one at a time, through a temporary file next to it.
+    """
+    path = Path(path)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(path, "r") as source, open(temporary_path, "w") as target:
+        is_first = True
+        for line in source:
+            line = line.rstrip("\r\n")
+            command = line.split(";", 1)[0].strip()
+            if command:
+                line = compactor.compact(command)
+                if line is None:
+                    continue
+            if not is_first:
+                target.write("\n")
+            target.write(line)
+            is_first = False
+    os.replace(temporary_path, path)
+    return compactor.report
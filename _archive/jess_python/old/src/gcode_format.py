@@ -0,0 +1,157 @@
+from enum import Enum
+from typing import List, Sequence, Tuple
+import numpy as np
+
+
+class ENumberStyle(Enum):
+    # The repr of the value rounded to `digits` places, as written by `helpers.strip_precision`
+    SHORTEST = 'shortest'
+    # Always exactly `digits` places
+    FIXED = 'fixed'
+    # `digits` places with trailing zeros (and a bare decimal point) removed
+    TRIMMED = 'trimmed'
+
+
+def format_number(value: float, digits: int = 6, style: ENumberStyle = ENumberStyle.SHORTEST) -> str:
+    """
+    Format a single G-code number.
+
+    Args:
+        value (float): The number to format.
+        digits (int, optional): The number of decimal places to keep, at least 0. Defaults to 6.
+        style (ENumberStyle, optional): How to write the number. Defaults to SHORTEST.
+
+    Returns:
+        str: The formatted number.
+    """
+    if style == ENumberStyle.SHORTEST:
+        return str(round(value, digits))
+
+    fixed = f"{value:.{digits}f}"
+    if style == ENumberStyle.FIXED:
+        return fixed
+
+    if "." in fixed:
+        fixed = fixed.rstrip("0").rstrip(".")
+    return "0" if fixed == "-0" else fixed
+
+
+def _prepare_column(
+    values: np.ndarray, digits: int, style: ENumberStyle
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Work out how many decimal places `%.*f` needs to reproduce `format_number` for each value.
+
+    Returns the values to print, the places, and a mask of values that have to go through
+    `format_number` instead: values too close to a rounding tie for the float arithmetic to be
+    trusted, and, for the SHORTEST style, values whose repr is not plain positional notation.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if style == ENumberStyle.FIXED:
+        return values, np.full(len(values), digits, dtype=np.int64), np.zeros(len(values), dtype=bool)
+
+    if style == ENumberStyle.TRIMMED:
+        values = _without_negative_zeros(values, digits)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        scaled = np.abs(values) * 10.0**digits
+        rounded = np.rint(scaled)
+        is_near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= 4 * np.spacing(scaled)
+        needs_fallback = ~np.isfinite(scaled) | is_near_tie | (rounded >= 2.0**53)
+        rounded[needs_fallback] = 0
+
+    units = rounded.astype(np.int64)
+    trailing_zeros = np.zeros(len(values), dtype=np.int64)
+    for place in range(1, digits + 1):
+        trailing_zeros += units % (10**place) == 0
+    places = digits - trailing_zeros
+
+    if style == ENumberStyle.SHORTEST:
+        if digits == 0:
+            # Whole numbers are still written with a ".0", so print the rounded value
+            values = np.rint(values)
+        places = np.maximum(places, 1)
+        # repr switches to exponent notation below 1e-4, and its shortest digits can differ
+        # from the fixed expansion once the float spacing is coarser than the last digit
+        needs_fallback |= (units != 0) & (units < 10.0 ** (digits - 4))
+        needs_fallback |= np.abs(values) >= 10.0 ** (15 - digits)
+
+    return values, places, needs_fallback
+
+
+def format_numbers(
+    values: np.ndarray, digits: int = 6, style: ENumberStyle = ENumberStyle.SHORTEST
+) -> List[str]:
+    """
+    Format an array of numbers, giving the same strings as `format_number` on each element.
+    """
+    values, places, needs_fallback = _prepare_column(values, digits, style)
+
+    numbers = ["%.*f" % pair for pair in zip(places.tolist(), values.tolist())]
+    for index in np.flatnonzero(needs_fallback).tolist():
+        numbers[index] = format_number(float(values[index]), digits, style)
+    return numbers
+
+
+def format_axis_lines(
+    command: str,
+    axes: Sequence[Tuple[str, np.ndarray]],
+    digits: int = 6,
+    style: ENumberStyle = ENumberStyle.SHORTEST,
+) -> List[str]:
+    """
+    Turn columns of coordinates into G-code lines in bulk.
+
+    Args:
+        command (str): The command word that starts each line, e.g. "G0".
+        axes (Sequence[Tuple[str, np.ndarray]]): (letter, values) pairs, written in that order.
+        digits (int, optional): The number of decimal places to keep. Defaults to 6.
+        style (ENumberStyle, optional): How to write the numbers. Defaults to SHORTEST.
+
+    Returns:
+        List[str]: One line per row, e.g. "G0 X1.5 Y2.0 Z0.0".
+    """
+    if not axes:
+        return []
+
+    template = command + "".join(f" {letter}%.*f" for letter, _ in axes)
+    columns = []
+    rows_needing_fallback = np.zeros(len(axes[0][1]), dtype=bool)
+
+    for _, values in axes:
+        values, places, needs_fallback = _prepare_column(values, digits, style)
+        rows_needing_fallback |= needs_fallback
+        columns.append(places.tolist())
+        columns.append(values.tolist())
+
+    lines = [template % row for row in zip(*columns)]
+
+    for row in np.flatnonzero(rows_needing_fallback).tolist():
+        lines[row] = command + "".join(
+            f" {letter}{format_number(float(values[row]), digits, style)}" for letter, values in axes
+        )
+    return lines
+
+
+def format_g0_lines(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    digits: int = 6,
+    style: ENumberStyle = ENumberStyle.SHORTEST,
+) -> List[str]:
+    """
+    Fast path for the common full three-axis move, "G0 X… Y… Z…".
+    """
+    return format_axis_lines("G0", (("X", x), ("Y", y), ("Z", z)), digits, style)
+
+
+def _without_negative_zeros(values: np.ndarray, digits: int) -> np.ndarray:
+    """
+    Replace values that round to zero with a positive zero, so they are not written as "-0".
+    """
+    with np.errstate(invalid="ignore", over="ignore"):
+        rounds_to_zero = np.abs(values) * 10.0**digits < 0.5
+    if rounds_to_zero.any():
+        values = np.where(rounds_to_zero, 0.0, values)
+    return values
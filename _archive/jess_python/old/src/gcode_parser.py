@@ -0,0 +1,382 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import ast
+import mmap
+import warnings
+import numpy as np
+from planner.toolpath import (
+    ALL_AXES_PRESENT,
+    AXIS_INTEGER_FLAGS,
+    AXIS_LETTERS,
+    AXIS_PRESENT_FLAGS,
+    FEED_INTEGER_FLAG,
+    EToolpathOpcode,
+    Toolpath,
+)
+
+HEADER_PREFIX = "; Parameters "
+
+# Lines are parsed in blocks of about this many bytes, which bounds the scratch memory
+BLOCK_BYTES = 1 << 22
+
+# Bytes that may appear in a full three-axis float move, "G0 X1.5 Y-2.25 Z0.0"
+_BULK_MOVE_BYTES = np.zeros(256, dtype=bool)
+_BULK_MOVE_BYTES[list(b"0123456789.- GXYZ")] = True
+
+# Turns the letters and line breaks of bulk moves into separators, leaving only numbers
+_LETTERS_TO_SPACES = np.arange(256, dtype=np.uint8)
+_LETTERS_TO_SPACES[list(b"GXYZ\r\n")] = ord(" ")
+
+# One parsed row: opcode, flags, x, y, z and feed rate (NaN when absent), and text
+TParsedRow = Tuple[int, int, float, float, float, float, Optional[str]]
+
+
+class ParsedGcode:
+    def __init__(
+        self,
+        toolpath: Toolpath,
+        line_numbers: np.ndarray,
+        header: Optional[Dict[str, Any]],
+        num_lines: int,
+    ):
+        # Every command and comment as toolpath rows, with the modal position filled in
+        self.toolpath = toolpath
+        # The 1-based source line of each toolpath row. A move with a feed rate becomes two
+        # rows on the same line, and blank lines have no row at all.
+        self.line_numbers = line_numbers
+        # The winding parameters from a "; Parameters {...}" first line, if there is one
+        self.header = header
+        self.num_lines = num_lines
+
+    def row_of_line(self, line_number: int) -> int:
+        """
+        The first toolpath row at or after a 1-based source line, or len(toolpath) if none.
+        """
+        return int(np.searchsorted(self.line_numbers, line_number, side="left"))
+
+
+def parse_header(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the winding parameters from a planner header line.
+
+    The header is a Python literal, so it is read with `ast.literal_eval` and never run.
+
+    Args:
+        line (str): The first line of a G-code file.
+
+    Returns:
+        Optional[Dict[str, Any]]: The parameters, or None if the line is not a header.
+
+    Raises:
+        ValueError: If the line is a header but its parameters are not a literal dict.
+    """
+    line = line.strip()
+    if not line.startswith(HEADER_PREFIX):
+        return None
+
+    try:
+        parameters = ast.literal_eval(line[len(HEADER_PREFIX):].strip())
+    except (SyntaxError, ValueError) as error:
+        raise ValueError(f"Malformed header parameters: {error}") from error
+    if not isinstance(parameters, dict):
+        raise ValueError(f"Header parameters must be a dict, got {type(parameters).__name__}")
+    return parameters
+
+
+def parse_gcode_file(path: Union[str, Path]) -> ParsedGcode:
+    """
+    Parse a G-code file, memory-mapped rather than read into memory.
+    """
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            # Empty files cannot be mapped
+            return parse_gcode_bytes(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parse_gcode_bytes(data)
+
+
+def parse_gcode_lines(lines: List[str]) -> ParsedGcode:
+    return parse_gcode_bytes("\n".join(lines).encode("utf-8"))
+
+
+def strip_comments(lines: Iterable[str]) -> Iterator[str]:
+    """
+    The commands in G-code lines, as they are read, without comments, surrounding whitespace
+    or blank lines.
+    """
+    for line in lines:
+        command = line.split(";", 1)[0].strip()
+        if command:
+            yield command
+
+
+def parse_gcode_bytes(data: Union[bytes, mmap.mmap]) -> ParsedGcode:
+    """
+    Parse G-code into a toolpath.
+
+    G0, G0 F and G92 lines become moves, feed rates and position resets, and comment lines
+    become comments. Any other command, or one with words the toolpath cannot hold, is
+    kept verbatim as a raw row, as is any G1. Numbers written without a decimal point are
+    flagged as ints, so rendering the toolpath gives back planner output line for line.
+
+    Full three-axis float moves, which make up nearly all of a planned wind, are found and
+    converted to numbers a block at a time without decoding them. Every other line goes
+    through a per-line parser.
+
+    Args:
+        data (Union[bytes, mmap.mmap]): The contents of a G-code file.
+
+    Returns:
+        ParsedGcode: The toolpath, the source line of each row, and the header.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    bulk_blocks = []
+    rows: List[TParsedRow] = []
+    row_line_numbers: List[int] = []
+
+    # Blocks end on a line break, so no line is split between two of them
+    num_lines = 0
+    block_start = 0
+    while block_start < len(buffer):
+        block_end = data.find(b"\n", block_start + BLOCK_BYTES - 1) + 1 or len(buffer)
+        line_starts, line_ends = _split_lines(buffer, block_start, block_end)
+
+        is_bulk, bulk_values = _parse_bulk_moves(buffer, line_starts, line_ends)
+        bulk_blocks.append((np.flatnonzero(is_bulk) + num_lines + 1, bulk_values))
+
+        for line_index in np.flatnonzero(~is_bulk).tolist():
+            line = bytes(buffer[line_starts[line_index]:line_ends[line_index]])
+            for row in _parse_line(line.decode("utf-8", errors="replace")):
+                rows.append(row)
+                row_line_numbers.append(num_lines + line_index + 1)
+
+        num_lines += len(line_starts)
+        block_start = block_end
+
+    header = None
+    if num_lines:
+        first_line = bytes(buffer[:data.find(b"\n") + 1 or len(buffer)])
+        header = parse_header(first_line.decode("utf-8", errors="replace"))
+
+    toolpath, line_numbers = _assemble(bulk_blocks, rows, row_line_numbers)
+    return ParsedGcode(toolpath, line_numbers, header, num_lines)
+
+
+def _split_lines(buffer: np.ndarray, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The [start, end) byte ranges of the lines in buffer[start:end], without line breaks.
+    """
+    line_ends = np.flatnonzero(buffer[start:end] == ord("\n")) + start
+    if len(line_ends) == 0 or line_ends[-1] != end - 1:
+        # The last line of the file has no line break
+        line_ends = np.append(line_ends, end)
+    line_starts = np.concatenate(([start], line_ends[:-1] + 1))
+
+    # Tolerate CRLF line endings
+    has_length = line_ends > line_starts
+    has_carriage_return = np.zeros(len(line_ends), dtype=bool)
+    has_carriage_return[has_length] = buffer[line_ends[has_length] - 1] == ord("\r")
+    return line_starts, line_ends - has_carriage_return
+
+
+def _parse_bulk_moves(
+    buffer: np.ndarray, line_starts: np.ndarray, line_ends: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find and convert the lines of a block that are exactly "G0 X<float> Y<float> Z<float>".
+
+    Returns a mask of those lines and their (n, 3) coordinates. Lines that do not fit the
+    pattern byte for byte are left to the per-line parser.
+    """
+    num_lines = len(line_starts)
+    if num_lines == 0:
+        return np.zeros(0, dtype=bool), np.empty((0, 3))
+
+    block = buffer[line_starts[0]:line_ends[-1]]
+    offset = int(line_starts[0])
+    starts = line_starts - offset
+    ends = line_ends - offset
+
+    def count_in_lines(positions: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        return np.searchsorted(positions, upper, side="left") - np.searchsorted(positions, lower, side="left")
+
+    def byte_at(positions: np.ndarray) -> np.ndarray:
+        if len(block) == 0:
+            return np.zeros(num_lines, dtype=np.uint8)
+        return block[np.clip(positions, 0, len(block) - 1)]
+
+    # "G0 X", exactly three spaces, and nothing but bulk move bytes
+    is_bulk = ends - starts >= len("G0 X0. Y0. Z0.")
+    for index, character in enumerate(b"G0 X"):
+        is_bulk &= byte_at(starts + index) == character
+
+    spaces = np.flatnonzero(block == ord(" "))
+    is_bulk &= count_in_lines(spaces, starts, ends) == 3
+    other_bytes = np.flatnonzero(~_BULK_MOVE_BYTES[block] & (block != ord("\n")) & (block != ord("\r")))
+    is_bulk &= count_in_lines(other_bytes, starts, ends) == 0
+
+    # The Y and Z words follow the second and third spaces
+    first_space = np.minimum(np.searchsorted(spaces, starts, side="left"), max(len(spaces) - 3, 0))
+    if len(spaces) >= 3:
+        second_spaces = spaces[first_space + 1]
+        third_spaces = spaces[first_space + 2]
+    else:
+        second_spaces = third_spaces = starts
+    is_bulk &= byte_at(second_spaces + 1) == ord("Y")
+    is_bulk &= byte_at(third_spaces + 1) == ord("Z")
+
+    # Minus signs only directly after an axis letter
+    minus_signs = np.flatnonzero(block == ord("-"))
+    misplaced_signs = minus_signs[~np.isin(byte_at(minus_signs - 1), list(b"XYZ"))]
+    is_bulk &= count_in_lines(misplaced_signs, starts, ends) == 0
+
+    # Every number must have exactly one decimal point, so all three are floats
+    dots = np.flatnonzero(block == ord("."))
+    is_bulk &= count_in_lines(dots, starts + 3, second_spaces) == 1
+    is_bulk &= count_in_lines(dots, second_spaces, third_spaces) == 1
+    is_bulk &= count_in_lines(dots, third_spaces, ends) == 1
+
+    bulk_lines = np.flatnonzero(is_bulk)
+    if len(bulk_lines) == 0:
+        return is_bulk, np.empty((0, 3))
+
+    # Keep only the bytes of bulk lines, each followed by its line break
+    boundaries = np.zeros(len(block) + 1, dtype=np.int8)
+    boundaries[starts[bulk_lines]] += 1
+    boundaries[ends[bulk_lines]] -= 1
+    in_bulk_line = np.cumsum(boundaries[:-1], dtype=np.int8).astype(bool)
+    in_bulk_line[np.minimum(ends[bulk_lines], len(block) - 1)] = True
+
+    text = _LETTERS_TO_SPACES[block[in_bulk_line]].tobytes()
+    with warnings.catch_warnings():
+        # NumPy only warns when it cannot read a number to its end
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            numbers = np.fromstring(text, dtype=np.float64, sep=" ")
+        except (DeprecationWarning, ValueError):
+            numbers = np.empty(0)
+    if len(numbers) != 4 * len(bulk_lines):
+        # Something like "X1.2.3" slipped through, so leave the whole block to the slow path
+        return np.zeros(num_lines, dtype=bool), np.empty((0, 3))
+    return is_bulk, numbers.reshape(-1, 4)[:, 1:]
+
+
+def _parse_number(token: str) -> Union[int, float]:
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def _parse_line(line: str) -> List[TParsedRow]:
+    """
+    Parse one line that is not a bulk move into zero, one or two rows.
+    """
+    nan = float("nan")
+    stripped = line.strip()
+    if not stripped:
+        return []
+
+    if stripped.startswith(";"):
+        text = stripped[1:]
+        if text.startswith(" "):
+            text = text[1:]
+        return [(EToolpathOpcode.COMMENT, 0, nan, nan, nan, nan, text)]
+
+    # Marlin ignores everything after a semicolon
+    command = stripped.split(";", 1)[0].strip()
+    raw_row = [(EToolpathOpcode.RAW, 0, nan, nan, nan, nan, command)]
+
+    words = command.split()
+    name = words[0].upper()
+    if name not in ("G0", "G92"):
+        return raw_row
+
+    values: Dict[str, Union[int, float]] = {}
+    for word in words[1:]:
+        letter = word[0].upper()
+        if letter not in "XYZF" or letter in values:
+            return raw_row
+        try:
+            values[letter] = _parse_number(word[1:])
+        except ValueError:
+            return raw_row
+
+    rows = []
+    feed_rate = values.pop("F", None)
+    if feed_rate is not None:
+        if name == "G92":
+            return raw_row
+        flags = FEED_INTEGER_FLAG if isinstance(feed_rate, int) else 0
+        rows.append((EToolpathOpcode.FEED_RATE, flags, nan, nan, nan, float(feed_rate), None))
+
+    if values:
+        flags = 0
+        position = [nan, nan, nan]
+        for axis_index, letter in enumerate(AXIS_LETTERS):
+            if letter in values:
+                flags |= AXIS_PRESENT_FLAGS[axis_index]
+                if isinstance(values[letter], int):
+                    flags |= AXIS_INTEGER_FLAGS[axis_index]
+                position[axis_index] = float(values[letter])
+        opcode = EToolpathOpcode.SET_POSITION if name == "G92" else EToolpathOpcode.MOVE
+        rows.append((opcode, flags, *position, nan, None))
+    elif not rows:
+        # A bare G0 or G92
+        return raw_row
+    return rows
+
+
+def _forward_fill(values: np.ndarray, initial: float) -> np.ndarray:
+    """
+    Replace every NaN with the last value before it, or `initial` if there is none.
+    """
+    is_given = ~np.isnan(values)
+    last_given = np.where(is_given, np.arange(len(values)), -1)
+    np.maximum.accumulate(last_given, out=last_given)
+    return np.where(last_given >= 0, values[last_given], initial)
+
+
+def _assemble(
+    bulk_blocks: List[Tuple[np.ndarray, np.ndarray]],
+    rows: List[TParsedRow],
+    row_line_numbers: List[int],
+) -> Tuple[Toolpath, np.ndarray]:
+    """
+    Merge bulk moves and per-line rows back into file order and fill in the modal state.
+    """
+    nan = float("nan")
+    bulk_line_numbers = np.concatenate([lines for lines, _ in bulk_blocks] or [np.empty(0, dtype=np.int64)])
+    bulk_values = np.concatenate([values for _, values in bulk_blocks] or [np.empty((0, 3))])
+    num_bulk = len(bulk_line_numbers)
+
+    if rows:
+        opcodes, flags, x, y, z, feed, texts = zip(*rows)
+    else:
+        opcodes, flags, x, y, z, feed, texts = ((),) * 7
+
+    line_numbers = np.concatenate((bulk_line_numbers, np.asarray(row_line_numbers, dtype=np.int64)))
+    # A stable sort keeps the rows a single line was split into in order
+    order = np.argsort(line_numbers, kind="stable")
+
+    def merged(bulk_column: np.ndarray, row_column, dtype) -> np.ndarray:
+        return np.concatenate((bulk_column.astype(dtype), np.asarray(row_column, dtype=dtype)))[order]
+
+    opcodes = merged(np.full(num_bulk, EToolpathOpcode.MOVE), opcodes, np.uint8)
+    flags = merged(np.full(num_bulk, ALL_AXES_PRESENT), flags, np.uint8)
+    x = _forward_fill(merged(bulk_values[:, 0], x, np.float64), 0.0)
+    y = _forward_fill(merged(bulk_values[:, 1], y, np.float64), 0.0)
+    z = _forward_fill(merged(bulk_values[:, 2], z, np.float64), 0.0)
+    feed = _forward_fill(merged(np.full(num_bulk, nan), feed, np.float64), 0.0)
+
+    # Where each per-line row ended up after sorting
+    new_rows = np.empty(len(order), dtype=np.int64)
+    new_rows[order] = np.arange(len(order))
+    text = {
+        int(new_rows[num_bulk + index]): row_text
+        for index, row_text in enumerate(texts)
+        if row_text is not None
+    }
+
+    toolpath = Toolpath.from_columns(opcodes, flags, x, y, z, feed, text)
+    return toolpath, line_numbers[order]
@@ -0,0 +1,422 @@
+import asyncio
+import math
+import os
+import pty
+import random
+import threading
+import tty
+from typing import Dict, List, Optional
+from marlin_port import MARLIN_BAUD_RATE, MARLIN_BLOCK_BUFFER_SIZE, MARLIN_BUFSIZE, MARLIN_RX_BUFFER_SIZE
+
+# Marlin's defaults for the host keepalive interval and the feed rate used before the first F
+# word, from Configuration.h and Configuration_adv.h
+MARLIN_KEEPALIVE_INTERVAL_S = 2.0
+MARLIN_DEFAULT_FEED_RATE = 1500
+
+# Bits on the wire per byte at 8N1
+_BITS_PER_BYTE = 10
+
+
+class EmulatorStats:
+    def __init__(self):
+        self.lines_received = 0
+        self.commands_executed = 0
+        self.moves_executed = 0
+        # Time the moves took, before time_scale is applied
+        self.machine_time_s = 0.0
+        # Lines rejected for a bad line number or checksum, injected errors included
+        self.line_errors = 0
+        self.injected_errors = 0
+        # Lines dropped because they arrived with the receive buffer full
+        self.rx_overflows = 0
+        # Times the planner ran dry in the middle of a job, and for how long in total
+        self.starvation_events = 0
+        self.starved_s = 0.0
+        self.busy_messages = 0
+        self.pauses = 0
+
+
+def checksum(line: str) -> int:
+    value = 0
+    for byte in line.encode("utf-8"):
+        value ^= byte
+    return value
+
+
+def parse_words(command: str) -> Dict[str, float]:
+    """
+    The parameters of a command as letter to value, e.g. {"X": 1.0, "F": 600.0} for "G0 X1 F600".
+    """
+    words = {}
+    for word in command.split()[1:]:
+        try:
+            words[word[0].upper()] = float(word[1:])
+        except (ValueError, IndexError):
+            pass
+    return words
+
+
+class MarlinEmulator:
+    """
+    asyncio model of Marlin's serial protocol and motion queue, on a local pseudo-terminal.
+
+    Connect a sender to `port_path` as if it were the RAMPS board. Lines are received at
+    `baud_rate`, into a receive buffer of `rx_buffer_bytes` that drops lines which do not fit.
+    Numbered lines are checked like Marlin checks them, and a fraction `error_rate` of them are
+    rejected as if corrupted on the wire. Accepted lines wait in a command queue of `bufsize`
+    commands, and each is acknowledged with "ok" once processed: moves when they fit in the
+    `block_buffer_size` planner buffer, M0 once the machine is stopped and M108 has arrived.
+
+    Moves execute one after another, each taking its length over its feed rate, as the
+    planner's profiler models them, scaled by `time_scale` (0 runs them instantly). Every
+    response is delayed by `latency_s`. While blocked, the emulator sends Marlin's busy
+    keepalive every `busy_interval_s`. Lines of bare axis words repeat the last G0 or G1 only
+    with `motion_modes` on, like Marlin built with GCODE_MOTION_MODES.
+    """
+
+    def __init__(
+        self,
+        bufsize: int = MARLIN_BUFSIZE,
+        block_buffer_size: int = MARLIN_BLOCK_BUFFER_SIZE,
+        rx_buffer_bytes: int = MARLIN_RX_BUFFER_SIZE,
+        baud_rate: int = MARLIN_BAUD_RATE,
+        time_scale: float = 1.0,
+        latency_s: float = 0.0,
+        error_rate: float = 0.0,
+        busy_interval_s: float = MARLIN_KEEPALIVE_INTERVAL_S,
+        seed: Optional[int] = None,
+        record_commands: bool = False,
+        motion_modes: bool = False,
+    ):
+        self.bufsize = bufsize
+        self.block_buffer_size = block_buffer_size
+        self.rx_buffer_bytes = rx_buffer_bytes
+        self.baud_rate = baud_rate
+        self.time_scale = time_scale
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.busy_interval_s = busy_interval_s
+        self.motion_modes = motion_modes
+        self.random = random.Random(seed)
+
+        self.stats = EmulatorStats()
+        # Every command executed, in order, when record_commands is on
+        self.executed_commands: Optional[List[str]] = [] if record_commands else None
+
+        self.port_path: Optional[str] = None
+        self.position = [0.0, 0.0, 0.0]
+        self.feed_rate = MARLIN_DEFAULT_FEED_RATE
+        self.motion_code = "G0"
+        self.last_line_number = 0
+        self.rx_bytes = 0
+
+        self._master: Optional[int] = None
+        self._slave: Optional[int] = None
+        self._received = bytearray()
+        self._unsent = bytearray()
+        self._is_writer_registered = False
+        self._wire: Optional[asyncio.Queue] = None
+        self._rx_lines: Optional[asyncio.Queue] = None
+        self._commands: Optional[asyncio.Queue] = None
+        self._planner: Optional[asyncio.Queue] = None
+        self._resume: Optional[asyncio.Event] = None
+        self._idle_since: Optional[float] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> str:
+        """
+        Open the pseudo-terminal and start processing. Returns the path to connect to.
+        """
+        self._master, self._slave = pty.openpty()
+        # No echo or newline translation, like a USB serial port
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.port_path = os.ttyname(self._slave)
+
+        self._wire = asyncio.Queue()
+        self._rx_lines = asyncio.Queue()
+        self._commands = asyncio.Queue(self.bufsize)
+        self._planner = asyncio.Queue(self.block_buffer_size)
+        self._resume = asyncio.Event()
+
+        asyncio.get_running_loop().add_reader(self._master, self._on_readable)
+        self._tasks = [
+            asyncio.create_task(self._receive_lines()),
+            asyncio.create_task(self._parse_lines()),
+            asyncio.create_task(self._process_commands()),
+            asyncio.create_task(self._execute_moves()),
+        ]
+        return self.port_path
+
+    async def stop(self):
+        loop = asyncio.get_running_loop()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        loop.remove_reader(self._master)
+        if self._is_writer_registered:
+            loop.remove_writer(self._master)
+            self._is_writer_registered = False
+        os.close(self._master)
+        os.close(self._slave)
+
+    async def wait_until_idle(self):
+        """
+        Wait until every received command has been processed and every move executed.
+        """
+        while not (self._wire.empty() and self._rx_lines.empty() and self.rx_bytes == 0):
+            await asyncio.sleep(0.01)
+        await self._commands.join()
+        await self._planner.join()
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        self._received += data
+        while True:
+            end = self._received.find(b"\n")
+            if end < 0:
+                return
+            line = self._received[:end].decode("utf-8", errors="replace")
+            del self._received[:end + 1]
+            self._wire.put_nowait(line)
+
+    def _respond(self, line: str):
+        if self.latency_s > 0:
+            asyncio.get_running_loop().call_later(self.latency_s, self._write, line)
+        else:
+            self._write(line)
+
+    def _write(self, line: str):
+        self._unsent += f"{line}\n".encode("utf-8")
+        self._flush()
+
+    def _flush(self):
+        loop = asyncio.get_running_loop()
+        try:
+            written = os.write(self._master, self._unsent)
+            del self._unsent[:written]
+        except BlockingIOError:
+            pass
+        # Whatever the sender has not read yet goes out when the terminal has room again
+        if self._unsent and not self._is_writer_registered:
+            loop.add_writer(self._master, self._flush)
+            self._is_writer_registered = True
+        elif not self._unsent and self._is_writer_registered:
+            loop.remove_writer(self._master)
+            self._is_writer_registered = False
+
+    async def _receive_lines(self):
+        """
+        Deliver lines into the receive buffer at the speed of the serial link.
+        """
+        loop = asyncio.get_running_loop()
+        arrival_time = loop.time()
+        while True:
+            line = await self._wire.get()
+            num_bytes = len(line) + 1
+            arrival_time = max(arrival_time, loop.time()) + num_bytes * _BITS_PER_BYTE / self.baud_rate
+            await asyncio.sleep(arrival_time - loop.time())
+
+            self.stats.lines_received += 1
+            if self.rx_bytes + num_bytes > self.rx_buffer_bytes:
+                # Marlin has nowhere to put the bytes, so the line never reaches it
+                self.stats.rx_overflows += 1
+                continue
+
+            # The emergency parser sees M108 as it arrives, even with the command queue full
+            if line.strip().split("*")[0].split()[-1:] == ["M108"]:
+                self._resume.set()
+
+            self.rx_bytes += num_bytes
+            self._rx_lines.put_nowait(line)
+
+    async def _parse_lines(self):
+        """
+        Check lines out of the receive buffer and into the command queue, as it has room.
+        """
+        while True:
+            line = await self._rx_lines.get()
+            command = self._check_line(line.strip())
+            if command is not None:
+                await self._commands.put(command)
+            self.rx_bytes -= len(line) + 1
+
+    def _check_line(self, line: str) -> Optional[str]:
+        """
+        The command in a received line, or None if Marlin would reject or ignore the line.
+        """
+        if not line.startswith("N"):
+            if line.startswith("M110"):
+                self.last_line_number = int(parse_words(line).get("N", 0))
+            return line or None
+
+        numbered, _, received_checksum = line.partition("*")
+        line_number_word, _, command = numbered.partition(" ")
+        try:
+            line_number = int(line_number_word[1:])
+        except ValueError:
+            line_number = -1
+
+        # M110 sets the line number, whatever it was before
+        if command.startswith("M110"):
+            self.last_line_number = int(parse_words(command).get("N", line_number))
+            return command
+
+        if line_number != self.last_line_number + 1:
+            self._reject(f"Line Number is not Last Line Number+1, Last Line: {self.last_line_number}")
+            return None
+        if not received_checksum or not received_checksum.isdigit() or int(received_checksum) != checksum(numbered):
+            self._reject(f"checksum mismatch, Last Line: {self.last_line_number}")
+            return None
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            self.stats.injected_errors += 1
+            self._reject(f"checksum mismatch, Last Line: {self.last_line_number}")
+            return None
+
+        self.last_line_number = line_number
+        return command
+
+    def _reject(self, error: str):
+        self.stats.line_errors += 1
+        self._respond(f"Error:{error}")
+        self._respond(f"Resend: {self.last_line_number + 1}")
+        self._respond("ok")
+
+    async def _wait_busy(self, awaitable, message: str):
+        """
+        Wait for something, sending Marlin's busy keepalive for as long as it takes.
+        """
+        waiting = asyncio.ensure_future(awaitable)
+        while True:
+            done, _ = await asyncio.wait({waiting}, timeout=self.busy_interval_s)
+            if done:
+                return waiting.result()
+            self.stats.busy_messages += 1
+            self._respond(message)
+
+    async def _process_commands(self):
+        while True:
+            command = await self._commands.get()
+            code = command.split()[0].upper() if command.split() else ""
+            if code[:1] in ("X", "Y", "Z", "F"):
+                if self.motion_modes:
+                    code = self.motion_code
+                    command = f"{code} {command}"
+                else:
+                    self._respond(f'echo:Unknown command: "{command}"')
+
+            if code in ("G0", "G1"):
+                self.motion_code = code
+                await self._plan_move(parse_words(command))
+            elif code == "G92":
+                await self._wait_busy(self._planner.join(), "echo:busy: processing")
+                words = parse_words(command)
+                for axis, letter in enumerate("XYZ"):
+                    if letter in words:
+                        self.position[axis] = words[letter]
+            elif code in ("M0", "M1"):
+                await self._pause_for_user()
+            elif code == "M400":
+                await self._wait_busy(self._planner.join(), "echo:busy: processing")
+
+            self.stats.commands_executed += 1
+            if self.executed_commands is not None:
+                self.executed_commands.append(command)
+            self._respond("ok")
+            self._commands.task_done()
+
+    async def _plan_move(self, words: Dict[str, float]):
+        if words.get("F", 0) > 0:
+            self.feed_rate = words["F"]
+
+        target = [words.get(letter, self.position[axis]) for axis, letter in enumerate("XYZ")]
+        length = math.dist(self.position, target)
+        self.position = target
+        # Marlin drops moves that go nowhere
+        if length == 0:
+            return
+
+        duration_s = length / self.feed_rate * 60
+        await self._wait_busy(self._planner.put(duration_s), "echo:busy: processing")
+
+    async def _pause_for_user(self):
+        # M0 lets the machine finish its moves before it stops
+        await self._wait_busy(self._planner.join(), "echo:busy: processing")
+        self.stats.pauses += 1
+        self._resume.clear()
+        self._respond("//action:notification Click to Resume...")
+        await self._wait_busy(self._resume.wait(), "echo:busy: paused for user")
+        # Stopping on purpose is not starving
+        self._idle_since = None
+        self._respond("//action:notification 3D Printer Ready.")
+
+    async def _execute_moves(self):
+        loop = asyncio.get_running_loop()
+        finish_time = loop.time()
+        while True:
+            if self._planner.empty() and self.stats.moves_executed > 0:
+                self._idle_since = loop.time()
+            duration_s = await self._planner.get()
+
+            if self._idle_since is not None:
+                self.stats.starvation_events += 1
+                self.stats.starved_s += loop.time() - self._idle_since
+                self._idle_since = None
+
+            finish_time = max(finish_time, loop.time()) + duration_s * self.time_scale
+            await asyncio.sleep(finish_time - loop.time())
+            self.stats.moves_executed += 1
+            self.stats.machine_time_s += duration_s
+            self._planner.task_done()
+
+
+class MarlinEmulatorThread:
+    """
+    Runs a `MarlinEmulator` on an event loop in its own thread, for use from blocking code.
+    """
+
+    def __init__(self, emulator: MarlinEmulator):
+        self.emulator = emulator
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def stats(self) -> EmulatorStats:
+        return self.emulator.stats
+
+    def open(self) -> str:
+        """
+        Start the emulator and return the path of its pseudo-terminal.
+        """
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(self.emulator.start(), self.loop).result()
+
+    def wait_until_idle(self):
+        asyncio.run_coroutine_threadsafe(self.emulator.wait_until_idle(), self.loop).result()
+
+    def close(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.emulator.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
+
+
+def print_emulator_stats(stats: EmulatorStats):
+    print(
+        f"Emulated Marlin executed {stats.commands_executed} commands and {stats.moves_executed} moves, "
+        f"{stats.machine_time_s:.1f} seconds of machine time"
+    )
+    print(
+        f"Planner ran dry {stats.starvation_events} times mid-job, for {stats.starved_s:.2f} seconds; "
+        f"{stats.busy_messages} busy messages, {stats.pauses} pauses"
+    )
+    if stats.line_errors or stats.rx_overflows:
+        print(
+            f"Rejected {stats.line_errors} lines ({stats.injected_errors} injected errors), "
+            f"dropped {stats.rx_overflows} lines on receive buffer overflow"
+        )
@@ -1,136 +1,647 @@
+import asyncio
 import serial
 import threading
-from queue import Queue
-from typing import Optional
+import time
+from collections import deque
+from concurrent.futures import Future
+from enum import Enum
+from typing import Any, Coroutine, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
 from helpers import is_object
+from sender_metrics import LatencyHistogram
 
+# Marlin's defaults for the command queue length and the serial receive buffer, in Configuration_adv.h
+MARLIN_BUFSIZE = 4
+MARLIN_RX_BUFFER_SIZE = 128
+MARLIN_BAUD_RATE = 115200
+# Marlin's default planner buffer length, BLOCK_BUFFER_SIZE in Configuration_adv.h
+MARLIN_BLOCK_BUFFER_SIZE = 16
 
-class MarlinPort:
-    def __init__(self, port_path: str, verbose: bool = False, baud_rate: int = 115200):
-        self.port_path = port_path
-        self.verbose = verbose
-        self.baud_rate = baud_rate
+# Numbered lines kept for answering resend requests
+RESEND_HISTORY_LINES = 256
 
-        self.is_initialized = False
-        self.port: Optional[serial.Serial] = None
-        self.command_queue = Queue()
-        self.has_command_waiting = False
+# Commands the sender holds before `put_commands` waits, and how many are handed over at once
+SENDER_QUEUE_LINES = 1024
+SENDER_BATCH_LINES = 64
 
-        self.pausing = False
-        self.paused = False
-        self.resuming = False
 
-    def initialize(self):
-        if self.is_initialized:
-            return
+class ESenderState(Enum):
+    CLOSED = "closed"
+    # Sending commands as fast as the window allows
+    STREAMING = "streaming"
+    # M0 sent, waiting for Marlin to finish what it has and stop
+    PAUSING = "pausing"
+    PAUSED = "paused"
+    # M108 sent, waiting for Marlin to carry on
+    RESUMING = "resuming"
 
-        self.has_command_waiting = False
 
-        self.port = serial.Serial(
-            port=self.port_path,
-            baudrate=self.baud_rate,
-            timeout=1,
-            write_timeout=1
-        )
+# The states each state can move to
+SENDER_TRANSITIONS = {
+    ESenderState.CLOSED: {ESenderState.STREAMING},
+    ESenderState.STREAMING: {ESenderState.PAUSING, ESenderState.CLOSED},
+    ESenderState.PAUSING: {ESenderState.PAUSED, ESenderState.CLOSED},
+    ESenderState.PAUSED: {ESenderState.RESUMING, ESenderState.CLOSED},
+    ESenderState.RESUMING: {ESenderState.STREAMING, ESenderState.CLOSED},
+}
 
-        if not self.port.is_open:
-            try:
-                self.port.open()
-            except serial.SerialException as error:
-                if is_object(error):
-                    raise Exception(f"Error opening port: {str(error)}")
-                raise
 
-        print(f"Port '{self.port_path}' opened at {self.baud_rate} baud.")
-        self.is_initialized = True
+def frame_command(line_number: int, command: str) -> str:
+    """
+    Number a command and append its checksum, e.g. "N12 G0 X1*91".
 
-        # Start a thread to read responses from the serial port
-        threading.Thread(target=self._read_serial, daemon=True).start()
-        self._try_next_command()
+    The checksum is the XOR of every byte before the "*", as Marlin computes it.
+    """
+    numbered = f"N{line_number} {command}"
+    checksum = 0
+    for byte in numbered.encode("utf-8"):
+        checksum ^= byte
+    return f"{numbered}*{checksum}"
 
-    def reset(self):
-        self.has_command_waiting = False
-        self.command_queue = Queue()
-        self.is_initialized = False
+
+class StreamStats:
+    def __init__(self):
+        self.commands_sent = 0
+        self.commands_acknowledged = 0
+        self.bytes_sent = 0
+        self.resent_lines = 0
+        # Queued commands Marlin has accepted, in order, not counting rejected lines
+        self.commands_completed = 0
+        # From the first command sent to the last acknowledgement
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        # Time from writing each command to its "ok"
+        self.ack_latency = LatencyHistogram()
+        # Commands in flight just after each send
+        self.in_flight_sum = 0
+        self.max_in_flight = 0
+        # From the first busy keepalive of a command to its "ok", so at least as long as
+        # Marlin's keepalive interval less than the real time busy
+        self.busy_s = 0.0
+        self.busy_messages = 0
+        # From Marlin reporting it has stopped to it carrying on
+        self.paused_s = 0.0
+        # Marlin acknowledged everything sent while more commands were waiting to go
+        self.marlin_drained_events = 0
+        # The sender had room to send but nothing queued, and more commands came later
+        self.host_starved_events = 0
+
+    @property
+    def elapsed_s(self) -> float:
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    @property
+    def commands_per_second(self) -> float:
+        return self.commands_acknowledged / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_sent / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    @property
+    def mean_in_flight(self) -> float:
+        return self.in_flight_sum / self.commands_sent if self.commands_sent else 0.0
+
+
+class MarlinSender:
+    """
+    asyncio core that streams commands to Marlin over an open serial port.
+
+    All of its state is owned by the event loop it is started on, so its methods must be
+    called from that loop. Responses are read as soon as the port has data, rather than by
+    polling it. In stop-and-wait mode each command waits for the "ok" of the one before. With
+    `streaming` on, up to `buffer_size` commands are kept in flight at once, as long as they
+    fit in Marlin's `rx_buffer_bytes` receive buffer, so the planner is never left waiting on
+    a serial round trip. Streamed commands are numbered and checksummed, and any Marlin asks
+    for again with "Resend:" are sent again from a short history.
+
+    Commands given to `put_commands` are held in a queue of at most `queue_limit`, so a
+    producer feeding it a long program waits for the machine instead of reading ahead.
+
+    Every `metrics_interval_s`, and once more when the job is cancelled or finished, a
+    snapshot of the stream's metrics is written to each of `metrics_sinks`.
+    """
+
+    def __init__(
+        self,
+        port: serial.Serial,
+        verbose: bool = False,
+        streaming: bool = False,
+        buffer_size: int = MARLIN_BUFSIZE,
+        rx_buffer_bytes: int = MARLIN_RX_BUFFER_SIZE,
+        metrics_sinks: Sequence[Any] = (),
+        metrics_interval_s: float = 1.0,
+        queue_limit: int = SENDER_QUEUE_LINES,
+    ):
+        self.port = port
+        self.verbose = verbose
+        self.streaming = streaming
+        self.buffer_size = buffer_size
+        self.rx_buffer_bytes = rx_buffer_bytes
+        self.queue_limit = queue_limit
+        self.metrics_sinks = list(metrics_sinks)
+        self.metrics_interval_s = metrics_interval_s
+
+        self.state = ESenderState.CLOSED
+        self.commands: Deque[str] = deque()
+        # Commands sent and not yet acknowledged, oldest first, as (line number, bytes sent,
+        # time sent, whether it was queued). Unnumbered commands, like the pause and resume
+        # commands, have no line number.
+        self.in_flight: Deque[Tuple[Optional[int], int, float, bool]] = deque()
+        self.in_flight_bytes = 0
+        self.next_line_number = 1
+        self.sent_lines: Dict[int, str] = {}
+        self.resend_queue: Deque[int] = deque()
+        # "Resend:" requests still to come for lines sent after the one Marlin rejected
+        self.stale_resends = 0
+        self.stats = StreamStats()
+
+        self._received = bytearray()
+        self._read_task: Optional[asyncio.Task] = None
+        self._is_reader_registered = False
+        self._done: Optional[asyncio.Event] = None
+        self._queue_room: Optional[asyncio.Event] = None
+        self._metrics_task: Optional[asyncio.Task] = None
+        self._busy_since: Optional[float] = None
+        self._paused_since: Optional[float] = None
+        self._is_starved = False
+        # Marlin reported an error, so the next "ok" is for a rejected line
+        self._is_rejecting = False
+
+    async def start(self):
+        self._done = asyncio.Event()
+        self._done.set()
+        self._queue_room = asyncio.Event()
+        self._queue_room.set()
+        loop = asyncio.get_running_loop()
+
+        try:
+            # Wake up whenever the port has data, with reads that never block
+            self.port.timeout = 0
+            loop.add_reader(self.port.fileno(), self._on_readable)
+            self._is_reader_registered = True
+        except (AttributeError, NotImplementedError, serial.SerialException):
+            # Ports without a file descriptor to watch are read in a worker thread instead
+            self.port.timeout = None
+            self._read_task = asyncio.create_task(self._read_in_thread())
+
+        if self.metrics_sinks:
+            self._metrics_task = asyncio.create_task(self._export_metrics_periodically())
+
+        self._transition(ESenderState.STREAMING)
+        if self.streaming:
+            # Numbered lines start again from 1
+            self._send("M110 N0", None, False)
+        self._pump()
 
     def queue_command(self, line: str):
-        self.command_queue.put(line)
-        self._try_next_command()
+        if self._is_starved:
+            self.stats.host_starved_events += 1
+            self._is_starved = False
+        self.commands.append(line)
+        self._done.clear()
+        self._pump()
+
+    async def put_commands(self, lines: Sequence[str]) -> bool:
+        """
+        Queue commands, waiting whenever the queue is full until the machine catches up.
+
+        Returns False, without queueing the rest, if the job is cancelled meanwhile.
+        """
+        for line in lines:
+            while len(self.commands) >= self.queue_limit and self.state != ESenderState.CLOSED:
+                self._queue_room.clear()
+                await self._queue_room.wait()
+            if self.state == ESenderState.CLOSED:
+                return False
+            self.queue_command(line)
+        return True
 
     def pause(self):
-        if self.paused or self.pausing or self.resuming:
+        if self.state != ESenderState.STREAMING:
             print("Cannot pause when already paused or resuming!")
             return
-        self.pausing = True
-        self._write_command("M0")
-
-    def complete_pause(self):
-        self.pausing = False
-        self.paused = True
-        print("Machine paused.")
-
-    def is_paused(self) -> bool:
-        return self.paused or self.pausing
+        self._transition(ESenderState.PAUSING)
+        self._send("M0", None, False)
 
     def resume(self):
-        if not self.paused or self.resuming:
+        if self.state != ESenderState.PAUSED:
             print("Cannot resume when already resuming or not paused!")
             return
-        self.resuming = True
-        self._write_command("M108")
+        self._transition(ESenderState.RESUMING)
+        self._send("M108", None, False)
+
+    def is_paused(self) -> bool:
+        return self.state in (ESenderState.PAUSING, ESenderState.PAUSED)
 
-    def complete_resume(self):
-        if not self.paused or not self.resuming:
-            print("Cannot complete resume while not paused or resuming!")
+    async def wait_until_done(self):
+        """
+        Wait until every queued command has been sent and acknowledged, or the job cancelled.
+        """
+        await self._done.wait()
+
+    async def cancel(self):
+        """
+        Drop every command not yet sent and stop reading. Commands Marlin already has still run.
+        """
+        self.commands.clear()
+        self._queue_room.set()
+        self.resend_queue.clear()
+        self.in_flight.clear()
+        self.in_flight_bytes = 0
+        if self.state != ESenderState.CLOSED:
+            self._transition(ESenderState.CLOSED)
+
+        if self._is_reader_registered:
+            asyncio.get_running_loop().remove_reader(self.port.fileno())
+            self._is_reader_registered = False
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+            self._metrics_task = None
+            self.export_metrics()
+        self._done.set()
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """
+        The stream's metrics so far, as plain JSON-compatible values.
+        """
+        stats = self.stats
+        now = time.perf_counter()
+        paused_s = stats.paused_s
+        if self._paused_since is not None:
+            paused_s += now - self._paused_since
+        return {
+            "timestamp": time.time(),
+            "state": self.state.value,
+            "mode": f"streaming up to {self.buffer_size} commands at once" if self.streaming else "stop-and-wait",
+            "window": self.buffer_size if self.streaming else 1,
+            # Time an average command takes to send at 10 bits per byte
+            "wire_s_per_command": (
+                stats.bytes_sent / stats.commands_sent * 10 / self.port.baudrate if stats.commands_sent else 0.0
+            ),
+            "elapsed_s": stats.elapsed_s,
+            "commands_sent": stats.commands_sent,
+            "commands_acknowledged": stats.commands_acknowledged,
+            "commands_completed": stats.commands_completed,
+            "bytes_sent": stats.bytes_sent,
+            "resent_lines": stats.resent_lines,
+            "commands_per_second": stats.commands_per_second,
+            "bytes_per_second": stats.bytes_per_second,
+            "queued_commands": len(self.commands),
+            "in_flight": len(self.in_flight),
+            "in_flight_bytes": self.in_flight_bytes,
+            "mean_in_flight": stats.mean_in_flight,
+            "max_in_flight": stats.max_in_flight,
+            "busy_s": stats.busy_s,
+            "busy_messages": stats.busy_messages,
+            "paused_s": paused_s,
+            "marlin_drained_events": stats.marlin_drained_events,
+            "host_starved_events": stats.host_starved_events,
+            "ack_latency": stats.ack_latency.to_dict(),
+        }
+
+    def export_metrics(self):
+        snapshot = self.metrics_snapshot()
+        for sink in self.metrics_sinks:
+            sink.write(snapshot)
+
+    async def _export_metrics_periodically(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval_s)
+            self.export_metrics()
+
+    def _transition(self, state: ESenderState):
+        if state not in SENDER_TRANSITIONS[self.state]:
+            raise RuntimeError(f"Sender cannot go from {self.state.value} to {state.value}")
+        if state == ESenderState.PAUSED:
+            self._paused_since = time.perf_counter()
+        elif state in (ESenderState.STREAMING, ESenderState.CLOSED) and self._paused_since is not None:
+            self.stats.paused_s += time.perf_counter() - self._paused_since
+            self._paused_since = None
+        self.state = state
+
+    def _is_done(self) -> bool:
+        return not self.commands and not self.resend_queue and not self.in_flight
+
+    def _on_readable(self):
+        try:
+            data = self.port.read(self.port.in_waiting or 1)
+        except serial.SerialException as error:
+            print(f"Serial read error: {str(error)}")
+            asyncio.get_running_loop().remove_reader(self.port.fileno())
+            self._is_reader_registered = False
             return
-        self.pausing = False
-        self.paused = False
-        self.resuming = False
-        self._try_next_command()
+        self._receive(data)
 
-    def _read_serial(self):
-        while self.is_initialized and self.port and self.port.is_open:
+    async def _read_in_thread(self):
+        loop = asyncio.get_running_loop()
+        while True:
             try:
-                line = self.port.readline().decode("utf-8").strip()
-                if line:
-                    self._process_serial_response_line(line)
+                data = await loop.run_in_executor(None, lambda: self.port.read(self.port.in_waiting or 1))
             except serial.SerialException as error:
                 print(f"Serial read error: {str(error)}")
-                break
+                return
+            self._receive(data)
+
+    def _receive(self, data: bytes):
+        self._received += data
+        while True:
+            end = self._received.find(b"\n")
+            if end < 0:
+                return
+            line = self._received[:end].decode("utf-8", errors="replace").strip()
+            del self._received[:end + 1]
+            if line:
+                self._process_serial_response_line(line)
 
     def _process_serial_response_line(self, line: str):
-        if line == "ok":
-            self.has_command_waiting = False
-            self._try_next_command()
-        elif line in ["echo:busy: processing", "echo:busy: paused for user"]:
-            pass  # Do nothing
+        if line.startswith("ok"):
+            self._acknowledge()
+            self._pump()
+        elif line.startswith("Resend:") or line.startswith("rs "):
+            line_number = line[len("Resend:"):] if line.startswith("Resend:") else line[len("rs "):]
+            self._request_resend(int(line_number.strip().lstrip("N")))
+        elif line.startswith("Error:") and "Last Line" in line:
+            # Followed by a resend request
+            self._is_rejecting = True
+            if self.verbose:
+                print(f"Marlin rejected a line: '{line}'")
+        elif line == "echo:busy: processing":
+            self.stats.busy_messages += 1
+            if self._busy_since is None:
+                self._busy_since = time.perf_counter()
+        elif line == "echo:busy: paused for user":
+            self.stats.busy_messages += 1
         elif line == "//action:notification Click to Resume...":
-            self.complete_pause()
+            if self.state != ESenderState.PAUSING:
+                print("Saw pause response while not pausing!")
+                return
+            self._transition(ESenderState.PAUSED)
+            print("Machine paused.")
         elif line == "//action:notification 3D Printer Ready.":
-            if not self.resuming:
+            if self.state != ESenderState.RESUMING:
                 print("Saw resume response while not resuming!")
                 return
-            self.complete_resume()
+            self._transition(ESenderState.STREAMING)
+            self._pump()
         else:
             print(f"Got unexpected response: '{line}'")
 
-    def _try_next_command(self):
-        if self.has_command_waiting or self.command_queue.empty() or self.paused:
+    def _acknowledge(self):
+        if not self.in_flight:
+            print("Got an 'ok' with no command waiting for one")
             return
+        _, num_bytes, sent_time, is_queued = self.in_flight.popleft()
+        self.in_flight_bytes -= num_bytes
+        if self._is_rejecting:
+            self._is_rejecting = False
+        elif is_queued:
+            self.stats.commands_completed += 1
+        now = time.perf_counter()
+        self.stats.commands_acknowledged += 1
+        self.stats.end_time = now
+        self.stats.ack_latency.add(now - sent_time)
+        if self._busy_since is not None:
+            self.stats.busy_s += now - self._busy_since
+            self._busy_since = None
+        if not self.in_flight and (self.commands or self.resend_queue):
+            self.stats.marlin_drained_events += 1
+        if self._is_done():
+            self._done.set()
 
-        command_to_send = self.command_queue.get()
-        # Check for comments
-        if command_to_send.startswith(";"):
-            print(command_to_send[1:].strip())
-            self._try_next_command()
+    def _request_resend(self, line_number: int):
+        if self.stale_resends > 0:
+            # Marlin asks again for every line it dropped after the bad one
+            self.stale_resends -= 1
+            return
+        if line_number not in self.sent_lines:
+            print(f"Marlin asked for line {line_number} again, which is not in the resend history")
             return
 
         if self.verbose:
-            print(f"Sending '{command_to_send}'")
+            print(f"Resending from line {line_number}")
+        self.stale_resends = sum(
+            1 for sent_line, _, _, _ in self.in_flight if sent_line is not None and sent_line > line_number
+        )
+        self.resend_queue = deque(range(line_number, self.next_line_number))
+        self._done.clear()
 
-        self.has_command_waiting = True
-        self._write_command(command_to_send)
+    def _has_room(self, num_bytes: int) -> bool:
+        if not self.in_flight:
+            return True
+        if not self.streaming:
+            return False
+        return (
+            len(self.in_flight) < self.buffer_size
+            and self.in_flight_bytes + num_bytes <= self.rx_buffer_bytes
+        )
+
+    def _pump(self):
+        """
+        Send queued commands while the state and the window allow.
+        """
+        while self.state == ESenderState.STREAMING:
+            if self.resend_queue:
+                line_number = self.resend_queue[0]
+                command = self.sent_lines[line_number]
+                if not self._has_room(len(frame_command(line_number, command)) + 1):
+                    return
+                self.resend_queue.popleft()
+                self.stats.resent_lines += 1
+                self._send(command, line_number, True)
+                continue
+
+            if not self.commands:
+                if self._is_done():
+                    self._done.set()
+                if self.stats.start_time is not None and self._has_room(0):
+                    self._is_starved = True
+                return
+
+            command = self.commands[0]
+            # Lines with no command are dropped without a trip to the machine
+            if not command.partition(";")[0].strip():
+                self.commands.popleft()
+                self._queue_room.set()
+                continue
+
+            line_number = self.next_line_number if self.streaming else None
+            wire_command = command if line_number is None else frame_command(line_number, command)
+            if not self._has_room(len(wire_command) + 1):
+                return
+
+            self.commands.popleft()
+            self._queue_room.set()
+            if line_number is not None:
+                self.next_line_number += 1
+                self.sent_lines[line_number] = command
+                self.sent_lines.pop(line_number - RESEND_HISTORY_LINES, None)
+
+            if self.verbose:
+                print(f"Sending '{command}'")
+            self._send(command, line_number, True)
+
+    def _send(self, command: str, line_number: Optional[int], is_queued: bool):
+        """
+        Write a command, numbered if a line number is given, and track it until its "ok".
+
+        Commands from the queue count towards `commands_completed` once accepted, unlike the
+        sender's own line number reset and its pause and resume commands.
+        """
+        wire_command = command if line_number is None else frame_command(line_number, command)
+        num_bytes = len(wire_command) + 1
+
+        now = time.perf_counter()
+        self.in_flight.append((line_number, num_bytes, now, is_queued))
+        self.in_flight_bytes += num_bytes
+        self._done.clear()
+
+        if self.stats.start_time is None:
+            self.stats.start_time = now
+        self.stats.commands_sent += 1
+        self.stats.bytes_sent += num_bytes
+        self.stats.in_flight_sum += len(self.in_flight)
+        self.stats.max_in_flight = max(self.stats.max_in_flight, len(self.in_flight))
+        self._write_command(wire_command)
 
     def _write_command(self, command: str):
         if self.port and self.port.is_open:
             self.port.write(f"{command}\n".encode("utf-8"))
+
+
+class MarlinPort:
+    """
+    Blocking front end to `MarlinSender`, safe to call from any thread.
+
+    The sender runs on an event loop in its own thread, which is the only thread that ever
+    touches the port or the sender's state. Calls are handed over to that loop.
+    """
+
+    def __init__(
+        self,
+        port_path: str,
+        verbose: bool = False,
+        baud_rate: int = MARLIN_BAUD_RATE,
+        streaming: bool = False,
+        buffer_size: int = MARLIN_BUFSIZE,
+        rx_buffer_bytes: int = MARLIN_RX_BUFFER_SIZE,
+        metrics_sinks: Sequence[Any] = (),
+        metrics_interval_s: float = 1.0,
+    ):
+        self.port_path = port_path
+        self.verbose = verbose
+        self.baud_rate = baud_rate
+        self.streaming = streaming
+        self.buffer_size = buffer_size
+        self.rx_buffer_bytes = rx_buffer_bytes
+        self.metrics_sinks = metrics_sinks
+        self.metrics_interval_s = metrics_interval_s
+
+        self.is_initialized = False
+        self.port: Optional[serial.Serial] = None
+        self.sender: Optional[MarlinSender] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def initialize(self):
+        if self.is_initialized:
+            return
+
+        self.port = serial.Serial(
+            port=self.port_path,
+            baudrate=self.baud_rate,
+            timeout=1,
+            write_timeout=1
+        )
+
+        if not self.port.is_open:
+            try:
+                self.port.open()
+            except serial.SerialException as error:
+                if is_object(error):
+                    raise Exception(f"Error opening port: {str(error)}")
+                raise
+
+        print(f"Port '{self.port_path}' opened at {self.baud_rate} baud.")
+
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.sender = MarlinSender(
+            self.port,
+            self.verbose,
+            self.streaming,
+            self.buffer_size,
+            self.rx_buffer_bytes,
+            self.metrics_sinks,
+            self.metrics_interval_s,
+        )
+        self._run(self.sender.start()).result()
+        self.is_initialized = True
+
+    def reset(self):
+        """
+        Cancel the job, stop the event loop and close the port.
+        """
+        if not self.is_initialized:
+            return
+        self.cancel()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.port.close()
+        self.is_initialized = False
+
+    @property
+    def stats(self) -> StreamStats:
+        return self.sender.stats
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        async def snapshot():
+            return self.sender.metrics_snapshot()
+        return self._run(snapshot()).result()
+
+    def queue_command(self, line: str):
+        self.loop.call_soon_threadsafe(self.sender.queue_command, line)
+
+    def send_lines(self, lines: Iterable[str], batch_size: int = SENDER_BATCH_LINES) -> bool:
+        """
+        Queue commands from a file, generator or any other iterable as the sender has room,
+        blocking meanwhile, so only a bounded number are ever held in memory.
+
+        Returns False if the job was cancelled before every command was queued.
+        """
+        batch: List[str] = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) == batch_size:
+                if not self._run(self.sender.put_commands(batch)).result():
+                    return False
+                batch = []
+        return not batch or self._run(self.sender.put_commands(batch)).result()
+
+    def wait_until_done(self):
+        """
+        Block until every queued command has been sent and acknowledged.
+        """
+        self._run(self.sender.wait_until_done()).result()
+
+    def cancel(self):
+        self._run(self.sender.cancel()).result()
+
+    def pause(self):
+        self.loop.call_soon_threadsafe(self.sender.pause)
+
+    def is_paused(self) -> bool:
+        return self.sender.is_paused()
+
+    def resume(self):
+        self.loop.call_soon_threadsafe(self.sender.resume)
+
+    def _run(self, coroutine: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
@@ -1,4 +1,4 @@
-from typing import Union, List, Dict, TypedDict, Optional
+from typing import Union, List, Dict, TypedDict, Optional, Tuple
 from enum import Enum
 
 
@@ -110,3 +110,13 @@ AxisLookup: Dict[ECoordinateAxes, str] = {
     ECoordinateAxes.MANDREL: 'Y',
     ECoordinateAxes.DELIVERY_HEAD: 'Z'
 }
+
+
+AxisOrder: Tuple[ECoordinateAxes, ...] = (
+    ECoordinateAxes.CARRIAGE,
+    ECoordinateAxes.MANDREL,
+    ECoordinateAxes.DELIVERY_HEAD
+)
+
+
+AxisIndex: Dict[ECoordinateAxes, int] = {axis: index for index, axis in enumerate(AxisOrder)}
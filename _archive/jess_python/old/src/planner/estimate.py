@@ -0,0 +1,204 @@
+from typing import Dict, List, Optional, Tuple
+from .cust_types import (
+    IMandrelParameters,
+    ITowParameters,
+    IWindParameters,
+    ELayerType,
+)
+from .planner import buildLayer, helicalLayerGeometry, hoopLayerGeometry
+
+# Largest relative difference between these estimates and the totals the full planner reports.
+# The planner sums the same straight moves segment by segment, so only rounding differs.
+ESTIMATE_RELATIVE_TOLERANCE = 1e-9
+
+
+class LayerEstimate:
+    def __init__(
+        self,
+        windType: ELayerType,
+        timeS: float,
+        towLengthM: float,
+        numCircuits: Optional[int] = None,
+        patternValid: bool = True,
+    ):
+        self.windType = windType
+        self.timeS = timeS
+        self.towLengthM = towLengthM
+        self.numCircuits = numCircuits
+        self.patternValid = patternValid
+
+
+class WindEstimate:
+    def __init__(self, layers: List[LayerEstimate]):
+        self.layers = layers
+
+    @property
+    def totalTimeS(self) -> float:
+        return sum(layer.timeS for layer in self.layers)
+
+    @property
+    def totalTowLengthM(self) -> float:
+        return sum(layer.towLengthM for layer in self.layers)
+
+
+def moveCost(
+    carriageMM: float,
+    mandrelDegrees: float,
+    deliveryHeadDegrees: float,
+    mandrelDiameter: float,
+    feedRate: float,
+) -> Tuple[float, float]:
+    """
+    Time (s) and tow length (mm) of one straight move, using the planner's profiler model.
+    """
+    timeS = (carriageMM**2 + mandrelDegrees**2 + deliveryHeadDegrees**2) ** 0.5 / feedRate * 60
+    arcLengthMM = mandrelDegrees / 360 * mandrelDiameter * 3.14159
+    towLengthMM = (carriageMM**2 + arcLengthMM**2) ** 0.5
+    return timeS, towLengthMM
+
+
+def estimateWind(windingParameters: IWindParameters) -> WindEstimate:
+    """
+    Estimate the time and tow usage of every layer of a wind without planning any moves.
+
+    Follows planWind's layer handling, including stopping after a terminal hoop layer.
+    """
+    mandrelParameters = IMandrelParameters(**windingParameters["mandrelParameters"])
+    towParameters = ITowParameters(**windingParameters["towParameters"])
+    feedRate = windingParameters["defaultFeedRate"]
+
+    layerEstimates = []
+    for layerDefinition in windingParameters["layers"]:
+        layer = buildLayer(layerDefinition)
+        layerEstimates.append(estimateLayer({
+            "parameters": layer,
+            "mandrelParameters": mandrelParameters,
+            "towParameters": towParameters,
+        }, feedRate))
+        if layer.windType == ELayerType.HOOP and layer.terminal:
+            break
+
+    return WindEstimate(layerEstimates)
+
+
+def estimateLayer(layerParameters: Dict, feedRate: float) -> LayerEstimate:
+    windType = layerParameters["parameters"].windType
+
+    if windType == ELayerType.HOOP:
+        return estimateHoopLayer(layerParameters, feedRate)
+    if windType == ELayerType.HELICAL:
+        return estimateHelicalLayer(layerParameters, feedRate)
+    return estimateSkipLayer(layerParameters, feedRate)
+
+
+def _sumMoves(moves: List[Tuple[float, float, float, float]], mandrelDiameter: float, feedRate: float) -> Tuple[float, float]:
+    """
+    Total the cost of (count, carriage, mandrel, delivery head) move groups.
+    """
+    totalTimeS = 0
+    totalTowLengthMM = 0
+    for count, carriageMM, mandrelDegrees, deliveryHeadDegrees in moves:
+        timeS, towLengthMM = moveCost(
+            carriageMM, mandrelDegrees, deliveryHeadDegrees, mandrelDiameter, feedRate
+        )
+        totalTimeS += count * timeS
+        totalTowLengthMM += count * towLengthMM
+    return totalTimeS, totalTowLengthMM
+
+
+def _zeroAxesMove(currentAngleDegrees: float) -> Tuple[float, float, float, float]:
+    # zero_axes rewinds the mandrel forward to the next whole turn
+    return (1, 0, 360 - currentAngleDegrees % 360, 0)
+
+
+def estimateHoopLayer(layerParameters: Dict, feedRate: float) -> LayerEstimate:
+    geometry = hoopLayerGeometry(layerParameters)
+    windLength = layerParameters["mandrelParameters"].windLength
+
+    moves = [
+        (1, 0, geometry["lockDegrees"], 0),
+        (1, 0, 0, geometry["windAngle"]),
+        (1, windLength, geometry["farMandrelPositionDegrees"] - geometry["lockDegrees"], 0),
+        (1, 0, geometry["farLockPositionDegrees"] - geometry["farMandrelPositionDegrees"], geometry["windAngle"]),
+    ]
+    if not layerParameters["parameters"].terminal:
+        moves += [
+            (1, 0, 0, geometry["windAngle"]),
+            (1, windLength, geometry["nearMandrelPositionDegrees"] - geometry["farLockPositionDegrees"], 0),
+            (1, 0, geometry["nearLockPositionDegrees"] - geometry["nearMandrelPositionDegrees"], geometry["windAngle"]),
+            _zeroAxesMove(geometry["nearLockPositionDegrees"]),
+        ]
+
+    timeS, towLengthMM = _sumMoves(moves, layerParameters["mandrelParameters"].diameter, feedRate)
+    return LayerEstimate(ELayerType.HOOP, timeS, towLengthMM / 1000)
+
+
+def estimateHelicalLayer(layerParameters: Dict, feedRate: float) -> LayerEstimate:
+    """
+    Estimate a helical layer from the per-pass move pattern of planHelicalLayer.
+
+    Every pass repeats the same lead-in and main moves, so each kind of move is costed once and
+    multiplied by how often it occurs. Only the final mandrel angle, which sets the length of
+    the closing zero_axes move, is accumulated pass by pass in the planner's order.
+    """
+    parameters = layerParameters["parameters"]
+    geometry = helicalLayerGeometry(layerParameters)
+    numCircuits = geometry["numCircuits"]
+    patternNumber = parameters.patternNumber
+
+    if patternNumber <= 0 or numCircuits % patternNumber != 0:
+        return LayerEstimate(ELayerType.HELICAL, 0, 0, numCircuits, False)
+
+    windLength = layerParameters["mandrelParameters"].windLength
+    numberOfPatterns = geometry["numberOfPatterns"]
+    numPasses = 2 * patternNumber * numberOfPatterns
+    passStartAngle = geometry["deliveryHeadPassStartAngle"]
+    deliveryHeadAngle = geometry["deliveryHeadAngleDegrees"]
+    turnaroundDegrees = (
+        parameters.lockDegrees - parameters.leadOutDegrees - (geometry["passRotationDegrees"] % 360)
+    )
+    inPatternDegrees = geometry["patternStepDegrees"] * numCircuits / patternNumber
+
+    mandrelPositionDegrees = 0
+    for patternIndex in range(numberOfPatterns):
+        for inPatternIndex in range(patternNumber):
+            for passIndex in range(2):
+                mandrelPositionDegrees += geometry["leadInDegrees"]
+                mandrelPositionDegrees += geometry["mainPassDegrees"]
+                mandrelPositionDegrees += turnaroundDegrees
+            mandrelPositionDegrees += inPatternDegrees
+        mandrelPositionDegrees += geometry["patternStepDegrees"]
+    mandrelPositionDegrees += parameters.lockDegrees
+
+    moves = [
+        # Per pass: tilt to the pass start angle, lead in, then the main pass
+        (numPasses, 0, 0, passStartAngle),
+        (numPasses, parameters.leadInMM, geometry["leadInDegrees"], deliveryHeadAngle - passStartAngle),
+        (numPasses, windLength - parameters.leadInMM, geometry["mainPassDegrees"], 0),
+        # Turnarounds into the next pass, with the pattern bookkeeping folded in
+        (numPasses // 2, 0, turnaroundDegrees, deliveryHeadAngle),
+        (numberOfPatterns * (patternNumber - 1), 0, turnaroundDegrees + inPatternDegrees, deliveryHeadAngle),
+        (max(numberOfPatterns - 1, 0), 0, turnaroundDegrees + inPatternDegrees + geometry["patternStepDegrees"], deliveryHeadAngle),
+    ]
+    if numPasses > 0:
+        moves.append((
+            1,
+            0,
+            turnaroundDegrees + inPatternDegrees + geometry["patternStepDegrees"] + parameters.lockDegrees,
+            deliveryHeadAngle,
+        ))
+    else:
+        moves.append((1, 0, parameters.lockDegrees, 0))
+    moves.append(_zeroAxesMove(mandrelPositionDegrees))
+
+    timeS, towLengthMM = _sumMoves(moves, layerParameters["mandrelParameters"].diameter, feedRate)
+    return LayerEstimate(ELayerType.HELICAL, timeS, towLengthMM / 1000, numCircuits, True)
+
+
+def estimateSkipLayer(layerParameters: Dict, feedRate: float) -> LayerEstimate:
+    timeS, towLengthMM = _sumMoves(
+        [(1, 0, layerParameters["parameters"].mandrelRotation, 0)],
+        layerParameters["mandrelParameters"].diameter,
+        feedRate,
+    )
+    return LayerEstimate(ELayerType.SKIP, timeS, towLengthMM / 1000)
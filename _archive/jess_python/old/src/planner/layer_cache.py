@@ -0,0 +1,135 @@
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import zipfile
+import numpy as np
+from .toolpath import Toolpath
+
+# Entries from a different layout are ignored rather than misread
+CACHE_FORMAT_VERSION = 1
+
+
+def default_cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "filament-winder" / "layers"
+
+
+def cache_key(inputs: Dict[str, Any]) -> str:
+    """
+    Hash everything that determines a planned layer into a hex digest.
+
+    Ints and floats hash differently on purpose, since the planner writes them differently.
+    """
+    def encode(value: Any) -> Any:
+        if isinstance(value, Enum):
+            return value.value
+        return vars(value)
+
+    serialized = json.dumps(inputs, sort_keys=True, default=encode)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class LayerCache:
+    """
+    Content-addressed store of planned layer toolpaths in a local directory.
+
+    Each entry is an .npz file named after its key, holding the toolpath columns and a JSON
+    metadata blob. Reading an entry refreshes its modification time, and whenever the
+    directory grows past `max_bytes` the entries least recently used are deleted.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.npz"
+
+    def load(self, key: str) -> Optional[Tuple[Toolpath, Dict[str, Any]]]:
+        """
+        Get a cached toolpath and its metadata, or None if there is no usable entry.
+        """
+        path = self._entry_path(key)
+        try:
+            with np.load(path) as entry:
+                metadata = json.loads(str(entry["metadata"]))
+                if metadata.get("format") != CACHE_FORMAT_VERSION:
+                    raise ValueError(f"Unsupported cache entry format {metadata.get('format')}")
+                toolpath = Toolpath.from_columns(
+                    entry["opcodes"],
+                    entry["flags"],
+                    entry["x"],
+                    entry["y"],
+                    entry["z"],
+                    entry["feed"],
+                    {int(row): text for row, text in metadata["text"].items()},
+                )
+            os.utime(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Missing, unreadable and stale entries alike are replanned and overwritten
+            self.misses += 1
+            return None
+
+        toolpath.start_position = metadata["start_position"]
+        toolpath.position = metadata["position"]
+        toolpath.feed_rate = metadata["feed_rate"]
+        self.hits += 1
+        return toolpath, metadata["data"]
+
+    def store(self, key: str, toolpath: Toolpath, data: Dict[str, Any]) -> None:
+        """
+        Save a toolpath with JSON-serializable data, then evict entries over the size bound.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        metadata = {
+            "format": CACHE_FORMAT_VERSION,
+            "text": {str(row): text for row, text in toolpath.text.items()},
+            "start_position": toolpath.start_position,
+            "position": toolpath.position,
+            "feed_rate": toolpath.feed_rate,
+            "data": data,
+        }
+
+        # Write under a temporary name so readers never see a partial entry
+        path = self._entry_path(key)
+        temporary_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+        with open(temporary_path, "wb") as f:
+            np.savez(
+                f,
+                opcodes=toolpath.opcodes,
+                flags=toolpath.flags,
+                x=toolpath.x,
+                y=toolpath.y,
+                z=toolpath.z,
+                feed=toolpath.feed,
+                metadata=np.array(json.dumps(metadata)),
+            )
+        os.replace(temporary_path, path)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Delete the least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                status = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, status.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -1,79 +1,78 @@
 from typing import List, Dict
-from .cust_types import TCoordinate, ECoordinateAxes, AxisLookup, TCoordinateAxes
+import numpy as np
+from .cust_types import TCoordinate, ECoordinateAxes, AxisIndex, AxisOrder, TCoordinateAxes
 from .plan_helpers import Helpers
-from helpers import strip_precision  # Helpers outside src
+from .toolpath import Toolpath
 
 
 class WinderMachine:
     def __init__(self, mandrel_diameter: float, verbose_output: bool = False):
         self.verbose_output = verbose_output
-        self.gcode: List[str] = []
+        self.toolpath = Toolpath()
 
         # Profiler state
         self.feed_rate_mm_per_min = 0
         self.total_time_s = 0
         self.total_tow_length_mm = 0
-        self.last_position: TCoordinateAxes = {
-            ECoordinateAxes.CARRIAGE: 0,
-            ECoordinateAxes.MANDREL: 0,
-            ECoordinateAxes.DELIVERY_HEAD: 0,
-        }
         self.mandrel_diameter = mandrel_diameter
 
+    @property
+    def last_position(self) -> TCoordinateAxes:
+        return dict(zip(AxisOrder, self.toolpath.position))
+
     def get_gcode(self) -> List[str]:
-        return self.gcode
+        return self.toolpath.get_gcode()
+
+    def get_toolpath(self) -> Toolpath:
+        return self.toolpath
 
     def add_raw_gcode(self, command: str) -> None:
-        self.gcode.append(command)
+        self.toolpath.append_raw(command)
 
     def set_feed_rate(self, feed_rate_mm_per_min: float) -> None:
         self.feed_rate_mm_per_min = feed_rate_mm_per_min
-        self.gcode.append(f"G0 F{strip_precision(feed_rate_mm_per_min)}")
+        self.toolpath.append_feed_rate(feed_rate_mm_per_min)
 
     def move(self, position: TCoordinate) -> None:
-        complete_end_position = {**self.last_position, **position}
-        do_segment_move = (
-            self.last_position[ECoordinateAxes.CARRIAGE]
-            != complete_end_position[ECoordinateAxes.CARRIAGE]
-        )
+        start_position = self.toolpath.position
+        end_position = list(start_position)
+        for axis, value in position.items():
+            end_position[AxisIndex[axis]] = value
+
+        carriage_index = AxisIndex[ECoordinateAxes.CARRIAGE]
+        do_segment_move = start_position[carriage_index] != end_position[carriage_index]
 
         if not do_segment_move:
             if self.verbose_output:
                 self.insert_comment(
                     f"Move from {Helpers.serialize_coordinate(self.last_position)} "
-                    f"to {Helpers.serialize_coordinate(complete_end_position)} as a simple move"
+                    f"to {Helpers.serialize_coordinate(dict(zip(AxisOrder, end_position)))} as a simple move"
                 )
             return self.move_segment(position)
 
         num_segments = (
-            round(
-                abs(
-                    self.last_position[ECoordinateAxes.CARRIAGE]
-                    - complete_end_position[ECoordinateAxes.CARRIAGE]
-                )
-            )
-            + 1
+            round(abs(start_position[carriage_index] - end_position[carriage_index])) + 1
         )
 
         if self.verbose_output:
             self.insert_comment(
                 f"Move from {Helpers.serialize_coordinate(self.last_position)} "
-                f"to {Helpers.serialize_coordinate(complete_end_position)} in {num_segments} segments"
+                f"to {Helpers.serialize_coordinate(dict(zip(AxisOrder, end_position)))} in {num_segments} segments"
             )
 
-        for intermediate_position in Helpers.interpolate_coordinates(
-            self.last_position, complete_end_position, num_segments
-        ):
-            self.move_segment(intermediate_position)
+        if num_segments == 1:
+            return self.move_segment(dict(zip(AxisOrder, end_position)))
+
+        self.move_segments(
+            *Helpers.interpolate_coordinate_arrays(start_position, end_position, num_segments)
+        )
 
     def set_position(self, position: TCoordinate) -> None:
-        command = "G92"
+        values = [None, None, None]
         for axis, value in position.items():
-            raw_axis = AxisLookup[axis]
-            command += f" {raw_axis}{strip_precision(value)}"
-            self.last_position[axis] = value
+            values[AxisIndex[axis]] = value
 
-        self.gcode.append(command)
+        self.toolpath.append_set_position(values)
 
     def zero_axes(self, current_angle_degrees: float) -> None:
         self.set_position(
@@ -89,7 +88,7 @@ class WinderMachine:
         self.set_position({ECoordinateAxes.MANDREL: 0})
 
     def insert_comment(self, text: str) -> None:
-        self.gcode.append(f"; {text}")
+        self.toolpath.append_comment(text)
 
     def get_gcode_time_s(self) -> float:
         return self.total_time_s
@@ -103,13 +102,14 @@ class WinderMachine:
     def move_segment(self, position: TCoordinate) -> None:
         total_distance_marlin_units_sq = 0
         tow_length_mm_sq = 0
-        command = "G0"
+        last_position = self.toolpath.position
+        values = [None, None, None]
 
         for axis, value in position.items():
-            raw_axis = AxisLookup[axis]
-            command += f" {raw_axis}{strip_precision(value)}"
+            axis_index = AxisIndex[axis]
+            values[axis_index] = value
 
-            move_component = value - self.last_position[axis]
+            move_component = value - last_position[axis_index]
             total_distance_marlin_units_sq += move_component**2
 
             if axis == ECoordinateAxes.MANDREL:
@@ -120,11 +120,39 @@ class WinderMachine:
             elif axis == ECoordinateAxes.CARRIAGE:
                 tow_length_mm_sq += move_component**2
 
-            self.last_position[axis] = value
-
         self.total_time_s += (
             total_distance_marlin_units_sq**0.5 / self.feed_rate_mm_per_min * 60
         )
         self.total_tow_length_mm += tow_length_mm_sq**0.5
 
-        self.gcode.append(command)
+        self.toolpath.append_move(values)
+
+    def move_segments(
+        self, carriage: np.ndarray, mandrel: np.ndarray, delivery_head: np.ndarray
+    ) -> None:
+        """
+        Batched equivalent of calling `move_segment` once per row of the given axis arrays.
+
+        The time and tow totals are accumulated in the same order as the per-segment path,
+        so both the G-code and the profiler totals match it exactly.
+        """
+        last_carriage, last_mandrel, last_delivery_head = self.toolpath.position
+        carriage_moves = np.diff(carriage, prepend=last_carriage)
+        mandrel_moves = np.diff(mandrel, prepend=last_mandrel)
+        delivery_head_moves = np.diff(delivery_head, prepend=last_delivery_head)
+
+        segment_times_s = (
+            np.sqrt(carriage_moves**2 + mandrel_moves**2 + delivery_head_moves**2)
+            / self.feed_rate_mm_per_min
+            * 60
+        )
+        arc_lengths_mm = mandrel_moves / 360 * self.mandrel_diameter * 3.14159
+        segment_tow_lengths_mm = np.sqrt(carriage_moves**2 + arc_lengths_mm**2)
+
+        # cumsum accumulates left to right, matching the running sums in move_segment
+        self.total_time_s = float(np.cumsum(np.append(self.total_time_s, segment_times_s))[-1])
+        self.total_tow_length_mm = float(
+            np.cumsum(np.append(self.total_tow_length_mm, segment_tow_lengths_mm))[-1]
+        )
+
+        self.toolpath.extend_moves(carriage, mandrel, delivery_head)
@@ -0,0 +1,116 @@
+from typing import List, Sequence
+import numpy as np
+from .toolpath import AXIS_INTEGER_FLAGS, AXIS_PRESENT_FLAGS, EToolpathOpcode, Toolpath
+
+
+class MachineProfile:
+    """
+    How finely the machine can position each axis, in steps per Marlin unit: steps/mm for the
+    carriage and steps/degree for the mandrel and delivery head, as in Marlin's
+    DEFAULT_AXIS_STEPS_PER_UNIT or set by M92. There is no default, since the transmissions
+    are not recorded and a guessed grid would move every coordinate off the real one.
+    """
+
+    def __init__(self, steps_per_unit: Sequence[float]):
+        self.steps_per_unit = tuple(float(steps) for steps in steps_per_unit)
+        if len(self.steps_per_unit) != 3 or min(self.steps_per_unit) <= 0:
+            raise ValueError(f"Expected positive steps per unit for X, Y and Z, not {steps_per_unit}")
+
+    @property
+    def step_sizes(self) -> List[float]:
+        return [1 / steps for steps in self.steps_per_unit]
+
+
+class QuantizeReport:
+    def __init__(self):
+        self.moves_before = 0
+        self.moves_dropped = 0
+        # Largest distance between a quantized move and the planned one, per axis in Marlin units
+        self.max_deviation = [0.0, 0.0, 0.0]
+
+
+class StepQuantizer:
+    """
+    Moves a wind's toolpaths onto the machine's step grid, one toolpath after another.
+
+    Every coordinate becomes a whole number of steps, and moves left with no steps to take on
+    any axis are dropped. Rounding errors are carried over rather than added up: each move is
+    rounded from where the plan wants the machine, not from the last rounded move, and a G92
+    declares the step nearest to where the machine really is, with the remainder carried into
+    the moves after it. No move is ever more than half a step away from its plan.
+
+    Toolpaths must be given in order, since the carried errors run from each into the next.
+    """
+
+    def __init__(self, profile: MachineProfile):
+        self.profile = profile
+        self.report = QuantizeReport()
+        # Where the machine is, in its own coordinates, and what its coordinates are off the plan's by
+        self._machine_position = [0.0, 0.0, 0.0]
+        self._carry = [0.0, 0.0, 0.0]
+
+    def quantize(self, toolpath: Toolpath) -> Toolpath:
+        """
+        The toolpath on the step grid, continuing from the toolpaths quantized before it.
+        """
+        count = len(toolpath)
+        if count == 0:
+            return toolpath
+
+        planned = (toolpath.x, toolpath.y, toolpath.z)
+        quantized = [np.empty(count, dtype=np.float64) for _ in planned]
+        is_move = toolpath.opcodes == EToolpathOpcode.MOVE
+        set_position_rows = np.flatnonzero(toolpath.opcodes == EToolpathOpcode.SET_POSITION).tolist()
+
+        run_start = 0
+        for set_position_row in set_position_rows + [count]:
+            for axis, steps in enumerate(self.profile.steps_per_unit):
+                rows = slice(run_start, set_position_row)
+                quantized[axis][rows] = np.round((planned[axis][rows] - self._carry[axis]) * steps) / steps
+                deviation = np.abs(quantized[axis][rows] + self._carry[axis] - planned[axis][rows])[is_move[rows]]
+                if len(deviation):
+                    self.report.max_deviation[axis] = max(self.report.max_deviation[axis], float(deviation.max()))
+            if set_position_row == count:
+                break
+            self._set_position(toolpath, set_position_row, quantized)
+            run_start = set_position_row + 1
+
+        # Rows hold the position after them, so a move taking no steps matches the row before it
+        previous = [
+            np.concatenate(([self._machine_position[axis]], quantized[axis][:-1])) for axis in range(3)
+        ]
+        is_zero_step = is_move & np.logical_and.reduce(
+            [quantized[axis] == previous[axis] for axis in range(3)]
+        )
+        self.report.moves_before += int(is_move.sum())
+        self.report.moves_dropped += int(is_zero_step.sum())
+        start_position = list(self._machine_position)
+        self._machine_position = [float(quantized[axis][-1]) for axis in range(3)]
+
+        flags = toolpath.flags.copy()
+        for axis, integer_flag in enumerate(AXIS_INTEGER_FLAGS):
+            # Values that rounding moved are no longer the whole numbers they were given as
+            flags[quantized[axis] != planned[axis]] &= ~integer_flag & 0xFF
+
+        kept_rows = np.flatnonzero(~is_zero_step)
+        result = toolpath.take(kept_rows)
+        result.flags[:] = flags[kept_rows]
+        result.x[:], result.y[:], result.z[:] = (column[kept_rows] for column in quantized)
+        result.start_position = start_position
+        result.position = list(self._machine_position)
+        return result
+
+    def _set_position(self, toolpath: Toolpath, row: int, quantized: List[np.ndarray]) -> None:
+        planned = (toolpath.x, toolpath.y, toolpath.z)
+        flags = int(toolpath.flags[row])
+        for axis, steps in enumerate(self.profile.steps_per_unit):
+            machine_before = quantized[axis][row - 1] if row > 0 else self._machine_position[axis]
+            if not flags & AXIS_PRESENT_FLAGS[axis]:
+                quantized[axis][row] = machine_before
+                continue
+            planned_before = planned[axis][row - 1] if row > 0 else toolpath.start_position[axis]
+            # How far the machine is from the plan, kept across the change of coordinates
+            error = machine_before + self._carry[axis] - planned_before
+            declared = planned[axis][row] + error
+            quantized[axis][row] = np.round(declared * steps) / steps
+            self._carry[axis] = declared - quantized[axis][row]
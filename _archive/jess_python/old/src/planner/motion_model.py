@@ -0,0 +1,249 @@
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from .toolpath import EToolpathOpcode, Toolpath, layer_ranges, profile_toolpath
+
+
+class MarlinMotionConfig:
+    """
+    The Marlin planner settings the time model replays a toolpath through.
+
+    Defaults are Marlin's stock Configuration.h values for a RAMPS board, in Marlin units
+    (mm for the carriage, degrees for the mandrel and delivery head).
+    """
+
+    def __init__(
+        self,
+        max_feed_rates: Sequence[float] = (300, 300, 5),
+        max_accelerations: Sequence[float] = (3000, 3000, 100),
+        travel_acceleration: float = 3000,
+        junction_deviation_mm: float = 0.013,
+        block_buffer_size: int = 16,
+        minimum_planner_speed: float = 0.05,
+        min_segment_time_s: float = 0.02,
+        baud_rate: int = 115200,
+        ack_latency_s: float = 0,
+    ):
+        # Per-axis limits in units/s and units/s^2
+        self.max_feed_rates = np.asarray(max_feed_rates, dtype=np.float64)
+        self.max_accelerations = np.asarray(max_accelerations, dtype=np.float64)
+        self.travel_acceleration = travel_acceleration
+        self.junction_deviation_mm = junction_deviation_mm
+        # How many blocks the lookahead sees, the executing block included
+        self.block_buffer_size = block_buffer_size
+        self.minimum_planner_speed = minimum_planner_speed
+        # Below this block duration Marlin slows down when its buffer runs low
+        self.min_segment_time_s = min_segment_time_s
+        # Serial link, used to find where the host cannot keep the buffer full
+        self.baud_rate = baud_rate
+        self.ack_latency_s = ack_latency_s
+
+
+class MotionTimeReport:
+    def __init__(
+        self,
+        name: str,
+        num_blocks: int,
+        feed_rate_time_s: float,
+        planner_time_s: float,
+        streamed_time_s: float,
+        link_bound_blocks: int,
+        short_blocks: int,
+        link_bound_runs: List[Tuple[int, int]],
+    ):
+        self.name = name
+        self.num_blocks = num_blocks
+        # Every move at full feed rate with infinite acceleration, as the planner's profiler
+        self.feed_rate_time_s = feed_rate_time_s
+        # Trapezoidal motion with lookahead, assuming the buffer never runs dry
+        self.planner_time_s = planner_time_s
+        # As above, but no block finishes before the host could send the next line
+        self.streamed_time_s = streamed_time_s
+        # Blocks that execute faster than their line can be sent and acknowledged
+        self.link_bound_blocks = link_bound_blocks
+        # Blocks shorter than min_segment_time_s, which Marlin stretches when starved
+        self.short_blocks = short_blocks
+        # [start, stop) toolpath row ranges of consecutive link-bound blocks, longest first
+        self.link_bound_runs = link_bound_runs
+
+
+def simulate_marlin_time(
+    toolpath: Toolpath,
+    config: Optional[MarlinMotionConfig] = None,
+    line_lengths: Optional[np.ndarray] = None,
+) -> List[MotionTimeReport]:
+    """
+    Replay a toolpath through a model of Marlin's trapezoidal planner and report per layer.
+
+    Each non-empty G0 becomes a block whose cruise speed and acceleration are capped by the
+    per-axis limits. Junction speeds follow Marlin's junction deviation rule. The lookahead
+    is modelled as Marlin runs it with a full buffer: each block must be able to come to a
+    stop by the end of the last block in the buffer. The backward and forward passes are
+    solved in closed form, as a sliding-window minimum and a running minimum over prefix sums
+    of acceleration times distance, so the whole toolpath is processed with array operations.
+
+    Args:
+        toolpath (Toolpath): The toolpath to replay.
+        config (MarlinMotionConfig, optional): Planner and link settings. Defaults to stock Marlin.
+        line_lengths (np.ndarray, optional): Bytes sent for each row. Rendered from the toolpath if omitted.
+
+    Returns:
+        List[MotionTimeReport]: One report per layer (see `layer_ranges`).
+    """
+    config = config or MarlinMotionConfig()
+    count = len(toolpath)
+
+    if line_lengths is None:
+        line_lengths = np.fromiter(
+            (len(line) for line in toolpath.iter_gcode()), dtype=np.float64, count=count
+        )
+
+    # Everything but comments goes over the wire, with a newline, and is answered by "ok\n"
+    is_sent = toolpath.opcodes != EToolpathOpcode.COMMENT
+    row_link_times_s = np.where(
+        is_sent, (line_lengths + 1 + 3) * 10 / config.baud_rate + config.ack_latency_s, 0
+    )
+
+    feed_rate_times_s, _ = profile_toolpath(toolpath, 1)
+
+    is_move = toolpath.opcodes == EToolpathOpcode.MOVE
+    deltas = np.column_stack([
+        np.where(is_move, np.diff(column, prepend=start), 0)
+        for column, start in zip((toolpath.x, toolpath.y, toolpath.z), toolpath.start_position)
+    ])
+    lengths = np.sqrt((deltas**2).sum(axis=1))
+    block_rows = np.flatnonzero(is_move & (lengths > 0))
+
+    block_times_s = _trapezoid_block_times(
+        deltas[block_rows], lengths[block_rows], toolpath.feed[block_rows] / 60, config
+    )
+
+    cumulative_link_s = np.cumsum(row_link_times_s)
+    is_short = block_times_s < config.min_segment_time_s
+
+    reports = []
+    for name, start, stop in layer_ranges(toolpath):
+        first_block, last_block = np.searchsorted(block_rows, [start, stop])
+        layer_block_rows = block_rows[first_block:last_block]
+        layer_block_times_s = block_times_s[first_block:last_block]
+
+        # Lines sent since the previous block, including empty moves Marlin drops, are
+        # charged to the next block. Lines after the layer's last block only cost link time.
+        link_before_s = cumulative_link_s[start - 1] if start > 0 else 0
+        block_link_times_s = np.diff(
+            np.concatenate(([link_before_s], cumulative_link_s[layer_block_rows]))
+        )
+        trailing_link_s = cumulative_link_s[stop - 1] - link_before_s - block_link_times_s.sum()
+        is_link_bound = block_link_times_s > layer_block_times_s
+
+        reports.append(MotionTimeReport(
+            name,
+            len(layer_block_rows),
+            float(feed_rate_times_s[start:stop].sum()),
+            float(layer_block_times_s.sum()),
+            float(np.maximum(layer_block_times_s, block_link_times_s).sum() + trailing_link_s),
+            int(is_link_bound.sum()),
+            int(is_short[first_block:last_block].sum()),
+            _runs(is_link_bound, layer_block_rows),
+        ))
+
+    return reports
+
+
+def _trapezoid_block_times(
+    deltas: np.ndarray, lengths: np.ndarray, requested_speeds: np.ndarray, config: MarlinMotionConfig
+) -> np.ndarray:
+    count = len(lengths)
+    if count == 0:
+        return np.zeros(0)
+
+    unit_vectors = deltas / lengths[:, None]
+    axis_fractions = np.abs(unit_vectors)
+
+    with np.errstate(divide="ignore"):
+        # Cap the cruise speed and acceleration so that no single axis exceeds its limit
+        nominal_speeds = np.minimum(
+            requested_speeds, (config.max_feed_rates / axis_fractions).min(axis=1)
+        )
+        accelerations = np.minimum(
+            config.travel_acceleration, (config.max_accelerations / axis_fractions).min(axis=1)
+        )
+
+    # Junction deviation: the fastest speed through the corner between consecutive blocks
+    junction_speeds_sq = np.zeros(count)
+    if count > 1:
+        cos_theta = -(unit_vectors[1:] * unit_vectors[:-1]).sum(axis=1)
+        limit_sq = np.minimum(nominal_speeds[1:], nominal_speeds[:-1]) ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sin_theta_d2 = np.sqrt(np.clip(0.5 * (1 - cos_theta), 0, 1))
+            deviation_sq = (
+                accelerations[1:] * config.junction_deviation_mm * sin_theta_d2 / (1 - sin_theta_d2)
+            )
+        deviation_sq = np.where(cos_theta < -0.999999, limit_sq, deviation_sq)
+        deviation_sq = np.where(cos_theta > 0.999999, config.minimum_planner_speed**2, deviation_sq)
+        junction_speeds_sq[1:] = np.minimum(limit_sq, deviation_sq)
+
+    # P[i] is twice the sum of acceleration * distance over blocks before i, so reaching block k
+    # from the start of block i at speed v changes v^2 by at most P[k] - P[i]
+    reach = np.concatenate(([0], np.cumsum(2 * accelerations * lengths)))
+
+    # Backward pass: the entry speed of block i must allow slowing to each later junction in
+    # the buffer, and to a stop at the end of the buffer
+    window = max(config.block_buffer_size, 1)
+    later_limits = _window_min(junction_speeds_sq + reach[:-1], window)
+    buffer_end = reach[np.minimum(np.arange(count) + window, count)]
+    backward_sq = np.minimum(later_limits, buffer_end) - reach[:-1]
+
+    # Forward pass: starting from rest, a block cannot enter faster than it was reachable
+    forward_sq = reach[:-1] + np.minimum.accumulate(
+        np.concatenate(([0], backward_sq[1:])) - reach[:-1]
+    )
+    entry_speeds = np.sqrt(np.maximum(forward_sq, 0))
+    exit_speeds = np.append(entry_speeds[1:], 0)
+
+    acceleration_distances = (nominal_speeds**2 - entry_speeds**2) / (2 * accelerations)
+    deceleration_distances = (nominal_speeds**2 - exit_speeds**2) / (2 * accelerations)
+    reaches_cruise = acceleration_distances + deceleration_distances <= lengths
+
+    peak_speeds = np.where(
+        reaches_cruise,
+        nominal_speeds,
+        np.sqrt(np.maximum((2 * accelerations * lengths + entry_speeds**2 + exit_speeds**2) / 2, 0)),
+    )
+    cruise_distances = np.where(
+        reaches_cruise, lengths - acceleration_distances - deceleration_distances, 0
+    )
+
+    return (
+        (peak_speeds - entry_speeds) / accelerations
+        + (peak_speeds - exit_speeds) / accelerations
+        + cruise_distances / nominal_speeds
+    )
+
+
+def _window_min(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Minimum of values[i:i + window] for every i, by combining power-of-two windows.
+    """
+    count = len(values)
+    span = 1
+    minimums = values
+    while span * 2 <= window:
+        shifted = np.concatenate((minimums[span:], np.full(min(span, count), np.inf)))[:count]
+        minimums = np.minimum(minimums, shifted)
+        span *= 2
+    if span < window:
+        offset = window - span
+        shifted = np.concatenate((minimums[offset:], np.full(min(offset, count), np.inf)))[:count]
+        minimums = np.minimum(minimums, shifted)
+    return minimums
+
+
+def _runs(mask: np.ndarray, rows: np.ndarray, limit: int = 5) -> List[Tuple[int, int]]:
+    """
+    Row ranges of the longest runs of consecutive True blocks.
+    """
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    longest = np.argsort(starts - stops, kind="stable")[:limit]
+    return [(int(rows[starts[run]]), int(rows[stops[run] - 1]) + 1) for run in longest]
@@ -0,0 +1,142 @@
+from typing import List, Tuple
+import numpy as np
+from .toolpath import AXIS_PRESENT_FLAGS, EToolpathOpcode, Toolpath, profile_toolpath
+
+
+class CollapseReport:
+    def __init__(
+        self,
+        lines_before: int,
+        lines_after: int,
+        time_before_s: float,
+        time_after_s: float,
+        tow_before_mm: float,
+        tow_after_mm: float,
+    ):
+        self.lines_before = lines_before
+        self.lines_after = lines_after
+        self.time_before_s = time_before_s
+        self.time_after_s = time_after_s
+        self.tow_before_mm = tow_before_mm
+        self.tow_after_mm = tow_after_mm
+
+    @property
+    def lines_removed(self) -> int:
+        return self.lines_before - self.lines_after
+
+    def merge(self, other: "CollapseReport") -> "CollapseReport":
+        return CollapseReport(
+            self.lines_before + other.lines_before,
+            self.lines_after + other.lines_after,
+            self.time_before_s + other.time_before_s,
+            self.time_after_s + other.time_after_s,
+            self.tow_before_mm + other.tow_before_mm,
+            self.tow_after_mm + other.tow_after_mm,
+        )
+
+
+def collapse_segments(
+    toolpath: Toolpath, tolerance: float, mandrel_diameter: float
+) -> Tuple[Toolpath, CollapseReport]:
+    """
+    Merge consecutive G0 moves wherever a single move reproduces them within a tolerance.
+
+    A run of moves can be replaced by one move from its first to its last point when, at every
+    point along the run, the machine running the single move at the same feed rate would be no
+    more than `tolerance` Marlin units (mm or degrees) away on any axis. Straight segmented moves
+    collapse to their endpoints, while turnarounds and delivery head blends keep their corners.
+    Moves are never merged across a non-move row (feed rate, G92, comments or raw G-code).
+
+    Args:
+        toolpath (Toolpath): The planned toolpath.
+        tolerance (float): The largest allowed deviation on any axis.
+        mandrel_diameter (float): Mandrel diameter, used to compare tow usage.
+
+    Returns:
+        Tuple[Toolpath, CollapseReport]: The collapsed toolpath and what changed.
+    """
+    positions = np.column_stack((toolpath.x, toolpath.y, toolpath.z))
+    is_move = toolpath.opcodes == EToolpathOpcode.MOVE
+    keep = ~is_move
+
+    # Runs of consecutive moves, as [start, end) row ranges
+    edges = np.diff(np.concatenate(([0], is_move.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+
+    for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+        origin = positions[run_start - 1] if run_start > 0 else np.array(toolpath.start_position)
+        points = np.vstack((origin, positions[run_start:run_end]))
+        for kept_point in _simplify_run(points, tolerance):
+            keep[run_start + kept_point - 1] = True
+
+    kept_rows = np.flatnonzero(keep)
+    collapsed = toolpath.take(kept_rows)
+
+    # Moves that now start further back must also write the axes that changed over the run
+    kept_positions = positions[kept_rows]
+    previous_positions = np.vstack((toolpath.start_position, kept_positions[:-1]))
+    is_kept_move = collapsed.opcodes == EToolpathOpcode.MOVE
+    flags = collapsed.flags
+    for axis_index, present_flag in enumerate(AXIS_PRESENT_FLAGS):
+        changed = kept_positions[:, axis_index] != previous_positions[:, axis_index]
+        flags[is_kept_move & changed] |= present_flag
+
+    times_before_s, tow_before_mm = profile_toolpath(toolpath, mandrel_diameter)
+    times_after_s, tow_after_mm = profile_toolpath(collapsed, mandrel_diameter)
+
+    return collapsed, CollapseReport(
+        len(toolpath),
+        len(collapsed),
+        float(times_before_s.sum()),
+        float(times_after_s.sum()),
+        float(tow_before_mm.sum()),
+        float(tow_after_mm.sum()),
+    )
+
+
+def _simplify_run(points: np.ndarray, tolerance: float) -> List[int]:
+    """
+    Greedily pick the points of a polyline to keep, always including the last one.
+
+    Point 0 is the position before the run and is never returned. From each kept point, the
+    furthest point that can be reached in one move is found by doubling the span until it
+    stops fitting, then bisecting.
+    """
+    lengths = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1))
+    distance_along = np.concatenate(([0], np.cumsum(lengths)))
+    last_point = len(points) - 1
+
+    def fits(anchor: int, end: int) -> bool:
+        if end - anchor < 2:
+            return True
+        inner_points = points[anchor + 1:end]
+        span = distance_along[end] - distance_along[anchor]
+        if span == 0:
+            return bool(np.abs(inner_points - points[anchor]).max() <= tolerance)
+        fraction = (distance_along[anchor + 1:end] - distance_along[anchor]) / span
+        expected = points[anchor] + fraction[:, None] * (points[end] - points[anchor])
+        return bool(np.abs(inner_points - expected).max() <= tolerance)
+
+    kept_points = []
+    anchor = 0
+    while anchor < last_point:
+        reach = anchor + 1
+        span = 2
+        while reach < last_point and fits(anchor, min(anchor + span, last_point)):
+            reach = min(anchor + span, last_point)
+            span *= 2
+
+        if reach < last_point:
+            too_far = min(anchor + span, last_point)
+            while too_far - reach > 1:
+                middle = (reach + too_far) // 2
+                if fits(anchor, middle):
+                    reach = middle
+                else:
+                    too_far = middle
+
+        kept_points.append(reach)
+        anchor = reach
+
+    return kept_points
@@ -1,5 +1,6 @@
 from .cust_types import TCoordinateAxes, ECoordinateAxes
-from typing import List
+from typing import List, Sequence, Tuple
+import numpy as np
 
 
 class Helpers:
@@ -36,3 +37,23 @@ class Helpers:
             })
 
         return coordinates
+
+    @staticmethod
+    def interpolate_coordinate_arrays(
+        start: Sequence[float], end: Sequence[float], steps: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Create evenly-spaced coordinates between two carriage/mandrel/delivery head positions,
+        as one array per axis.
+
+        Produces the same values as `interpolate_coordinates`, without building a dict per step.
+        """
+        if steps <= 1:
+            raise ValueError("Steps must be at least 2 for array interpolation")
+
+        step_indices = np.arange(steps, dtype=np.float64)
+
+        return tuple(
+            start_value + step_indices * ((end_value - start_value) / (steps - 1))
+            for start_value, end_value in zip(start, end)
+        )
@@ -1,4 +1,9 @@
-from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from itertools import islice
+import io
+import os
+from typing import Callable, List, Dict, Iterator, Optional, TextIO
 from .cust_types import (
     IWindParameters,
     IMandrelParameters,
@@ -7,76 +12,427 @@ from .cust_types import (
     THelicalLayer,
     THoopLayer,
     TSkipLayer,
+    TLayerParameters,
 )
 from .machine import WinderMachine
+from .machine_profile import MachineProfile, StepQuantizer
+from .optimize import CollapseReport, collapse_segments
+from .layer_cache import LayerCache, cache_key
+from .toolpath import Toolpath
 from helpers import rad_to_deg, deg_to_rad
+from toolpath_file import ToolpathFileWriter
 from .cust_types import ECoordinateAxes, ELayerType
 
-def planWind(windingParameters: IWindParameters, verboseOutput: bool = False) -> List[str]:
-
-    machine = WinderMachine(windingParameters["mandrelParameters"]["diameter"], verboseOutput)
+# Bump whenever a change to the planner changes the G-code or estimates it produces for a
+# layer, so that layers cached by older versions are planned again
+PLANNER_VERSION = 1
+
+def planWind(
+    windingParameters: IWindParameters,
+    verboseOutput: bool = False,
+    collapseTolerance: Optional[float] = None,
+    jobs: int = 1,
+    layerCache: Optional[LayerCache] = None,
+    machineProfile: Optional[MachineProfile] = None,
+) -> List[str]:
+    return list(streamWind(
+        windingParameters, verboseOutput, collapseTolerance, jobs=jobs, layerCache=layerCache,
+        machineProfile=machineProfile,
+    ))
+
+def writeWind(
+    windingParameters: IWindParameters,
+    sink: TextIO,
+    verboseOutput: bool = False,
+    collapseTolerance: Optional[float] = None,
+    chunkLines: int = 65536,
+    layerCallback: Optional[Callable[[Toolpath], None]] = None,
+    jobs: int = 1,
+    layerCache: Optional[LayerCache] = None,
+    machineProfile: Optional[MachineProfile] = None,
+) -> int:
+    """
+    Plan a wind and write its G-code to a file-like sink in chunks of `chunkLines` lines.
+
+    Lines are separated by newlines with no trailing newline, like "\\n".join(planWind(...)).
+    Returns the number of lines written.
+    """
+    lines = streamWind(
+        windingParameters, verboseOutput, collapseTolerance, layerCallback, jobs, layerCache, machineProfile
+    )
+    numLines = 0
 
-    headerParameters = {
+    while True:
+        chunk = list(islice(lines, chunkLines))
+        if not chunk:
+            break
+        if numLines > 0:
+            sink.write("\n")
+        sink.write("\n".join(chunk))
+        sink.flush()
+        numLines += len(chunk)
+
+    return numLines
+
+def writeWindToolpath(
+    windingParameters: IWindParameters,
+    path: str,
+    verboseOutput: bool = False,
+    collapseTolerance: Optional[float] = None,
+    layerCallback: Optional[Callable[[Toolpath], None]] = None,
+    jobs: int = 1,
+    layerCache: Optional[LayerCache] = None,
+    machineProfile: Optional[MachineProfile] = None,
+) -> int:
+    """
+    Plan a wind and write it to a binary toolpath file (see `toolpath_file`).
+
+    Returns the number of rows written, which is the number of lines its G-code would have.
+    """
+    with ToolpathFileWriter(path, windHeaderParameters(windingParameters)) as writer:
+        for toolpath in streamWindToolpaths(
+            windingParameters, verboseOutput, collapseTolerance, layerCallback, jobs, layerCache, machineProfile
+        ):
+            writer.append(toolpath)
+    return writer.num_rows
+
+def streamWind(
+    windingParameters: IWindParameters,
+    verboseOutput: bool = False,
+    collapseTolerance: Optional[float] = None,
+    layerCallback: Optional[Callable[[Toolpath], None]] = None,
+    jobs: int = 1,
+    layerCache: Optional[LayerCache] = None,
+    machineProfile: Optional[MachineProfile] = None,
+) -> Iterator[str]:
+    """
+    Plan a wind, yielding G-code lines as soon as each layer has been planned.
+
+    See `streamWindToolpaths` for how layers are planned.
+    """
+    for toolpath in streamWindToolpaths(
+        windingParameters, verboseOutput, collapseTolerance, layerCallback, jobs, layerCache, machineProfile
+    ):
+        yield from toolpath.iter_gcode()
+
+def windHeaderParameters(windingParameters: IWindParameters) -> Dict:
+    """
+    The parameters written to the header, which the plotter reads back.
+    """
+    return {
         "mandrel": windingParameters["mandrelParameters"],
         "tow": windingParameters["towParameters"],
     }
-    machine.insertComment(f"Parameters {headerParameters}")
-    machine.addRawGCode("G0 X0 Y0 Z0")
-    machine.setFeedRate(windingParameters["defaultFeedRate"])
 
-    encounteredTerminalLayer = False
-    layerIndex = 0
-    cumulativeTimeS = 0
-    cumulativeTowUseM = 0
+def streamWindToolpaths(
+    windingParameters: IWindParameters,
+    verboseOutput: bool = False,
+    collapseTolerance: Optional[float] = None,
+    layerCallback: Optional[Callable[[Toolpath], None]] = None,
+    jobs: int = 1,
+    layerCache: Optional[LayerCache] = None,
+    machineProfile: Optional[MachineProfile] = None,
+) -> Iterator[Toolpath]:
+    """
+    Plan a wind, yielding the header toolpath and then each layer's toolpath once planned.
+
+    Only one layer is held in memory at a time, however many layers the wind has. When
+    `collapseTolerance` is given, each layer's segmented moves are merged within that deviation
+    (see `collapse_segments`) before being written. `layerCallback` is handed each layer's
+    final toolpath, starting with its layer comment, just before it is yielded.
+
+    With `jobs` above 1, layers are planned in that many worker processes (0 uses every core)
+    and yielded in order as they complete. Each layer then stays in memory until it is yielded.
+    Layers already in `layerCache` are read from it instead of being planned again.
+
+    With a `machineProfile`, every toolpath is moved onto the machine's step grid and cleared of
+    moves that take no steps (see `StepQuantizer`) after leaving the cache and before
+    `layerCallback` sees it, since the rounding carried over runs from one layer into the next.
+    """
 
-    for layer in windingParameters["layers"]:
-        if encounteredTerminalLayer:
-            print("WARNING: Attempting to plan a layer after a terminal layer, aborting...")
-            break
+    machine = WinderMachine(windingParameters["mandrelParameters"]["diameter"], verboseOutput)
+    toolpath = machine.get_toolpath()
 
-        layerComment = f"Layer {layerIndex + 1} of {len(windingParameters["layers"])}: {layer.windType}"
-        print(layerComment)
-        machine.insertComment(layerComment)
+    machine.insert_comment(f"Parameters {windHeaderParameters(windingParameters)}")
+    machine.add_raw_gcode("G0 X0 Y0 Z0")
+    machine.set_feed_rate(windingParameters["defaultFeedRate"])
 
-        if layer.windType == ELayerType.HOOP:
-            planHoopLayer(machine, {
-                "parameters": layer,
-                "mandrelParameters": windingParameters["mandrelParameters"],
-                "towParameters": windingParameters["towParameters"],
-            })
-            encounteredTerminalLayer = encounteredTerminalLayer or layer.terminal
+    quantizer = None if machineProfile is None else StepQuantizer(machineProfile)
+    if quantizer is not None:
+        toolpath = quantizer.quantize(toolpath)
 
-        elif layer.windType == ELayerType.HELICAL:
-            planHelicalLayer(machine, {
-                "parameters": layer,
-                "mandrelParameters": windingParameters["mandrelParameters"],
-                "towParameters": windingParameters["towParameters"],
-            })
+    yield toolpath
+
+    mandrelParameters = IMandrelParameters(**windingParameters["mandrelParameters"])
+    towParameters = ITowParameters(**windingParameters["towParameters"])
+    layers = [buildLayer(layer) for layer in windingParameters["layers"]]
+
+    # Nothing is planned after a terminal hoop layer
+    numPlannedLayers = len(layers)
+    for layerIndex, layer in enumerate(layers):
+        if layer.windType == ELayerType.HOOP and layer.terminal:
+            numPlannedLayers = layerIndex + 1
+            break
 
-        elif layer.windType == ELayerType.SKIP:
-            planSkipLayer(machine, {
+    layerJobs = [
+        LayerJob(
+            f"Layer {layerIndex + 1} of {len(layers)}: {layer.windType.value}",
+            {
                 "parameters": layer,
-                "mandrelParameters": windingParameters["mandrelParameters"],
-                "towParameters": windingParameters["towParameters"],
-            })
+                "mandrelParameters": mandrelParameters,
+                "towParameters": towParameters,
+            },
+            windingParameters["defaultFeedRate"],
+            verboseOutput,
+            collapseTolerance,
+        )
+        for layerIndex, layer in enumerate(layers[:numPlannedLayers])
+    ]
 
-        layerIndex += 1
+    cumulativeTimeS = 0
+    cumulativeTowUseM = 0
+    collapseReport: Optional[CollapseReport] = None
 
-        print(f"Layer time estimate: {machine.getGCodeTimeS() - cumulativeTimeS} seconds")
-        print(f"Layer tow required: {machine.getTowLengthM() - cumulativeTowUseM} meters")
+    for plannedLayer in mapLayerJobs(layerJobs, jobs, layerCache):
+        print(plannedLayer.layerComment)
+        print(plannedLayer.output, end="")
 
-        cumulativeTimeS = machine.getGCodeTimeS()
-        cumulativeTowUseM = machine.getTowLengthM()
+        print(f"Layer time estimate: {plannedLayer.timeS} seconds")
+        print(f"Layer tow required: {plannedLayer.towLengthM} meters")
+
+        cumulativeTimeS += plannedLayer.timeS
+        cumulativeTowUseM += plannedLayer.towLengthM
+
+        if plannedLayer.collapseReport is not None:
+            layerCollapseReport = plannedLayer.collapseReport
+            print(
+                f"Collapsed segments: removed {layerCollapseReport.lines_removed} "
+                f"of {layerCollapseReport.lines_before} lines"
+            )
+            collapseReport = (
+                layerCollapseReport if collapseReport is None
+                else collapseReport.merge(layerCollapseReport)
+            )
+
+        layerToolpath = plannedLayer.toolpath
+        if quantizer is not None:
+            layerToolpath = quantizer.quantize(layerToolpath)
+
+        if layerCallback is not None:
+            layerCallback(layerToolpath)
 
         print("-" * 80)
 
+        yield layerToolpath
+
+    if numPlannedLayers < len(layers):
+        print("WARNING: Attempting to plan a layer after a terminal layer, aborting...")
+
     print(f"\nTotal time estimate: {cumulativeTimeS} seconds")
     print(f"Total tow required: {cumulativeTowUseM} meters\n")
 
-    return machine.getGCode()
+    if collapseReport is not None:
+        print(
+            f"Collapsed segments: removed {collapseReport.lines_removed} "
+            f"of {collapseReport.lines_before} lines"
+        )
+        print(
+            f"Time estimate changed by {collapseReport.time_after_s - collapseReport.time_before_s} seconds, "
+            f"tow required by {(collapseReport.tow_after_mm - collapseReport.tow_before_mm) / 1000} meters\n"
+        )
 
-def planHoopLayer(machine: WinderMachine, layerParameters: Dict) -> None:
+    if quantizer is not None:
+        quantizeReport = quantizer.report
+        print(
+            f"Quantized to the step grid: dropped {quantizeReport.moves_dropped} "
+            f"of {quantizeReport.moves_before} moves, which took no steps"
+        )
+        print(
+            "Largest deviation from the plan: "
+            + ", ".join(
+                f"{letter} {deviation:.4f} ({deviation * steps:.2f} steps)"
+                for letter, deviation, steps in zip(
+                    "XYZ", quantizeReport.max_deviation, machineProfile.steps_per_unit
+                )
+            )
+            + "\n"
+        )
 
+class LayerJob:
+    def __init__(
+        self,
+        layerComment: str,
+        layerParameters: Dict,
+        feedRate: float,
+        verboseOutput: bool,
+        collapseTolerance: Optional[float],
+    ):
+        self.layerComment = layerComment
+        self.layerParameters = layerParameters
+        self.feedRate = feedRate
+        self.verboseOutput = verboseOutput
+        self.collapseTolerance = collapseTolerance
+
+class PlannedLayer:
+    def __init__(
+        self,
+        layerComment: str,
+        toolpath: Toolpath,
+        timeS: float,
+        towLengthM: float,
+        output: str,
+        collapseReport: Optional[CollapseReport],
+    ):
+        self.layerComment = layerComment
+        self.toolpath = toolpath
+        self.timeS = timeS
+        self.towLengthM = towLengthM
+        # Anything the layer planner printed, replayed in layer order
+        self.output = output
+        self.collapseReport = collapseReport
+
+def planLayerJob(job: LayerJob) -> PlannedLayer:
+    """
+    Plan one layer on its own machine, starting at the origin with the default feed rate.
+
+    Every layer that can be followed by another one ends by redefining the machine position as
+    the origin (zero_axes, or the G92 of a skip layer), and a helical layer with an invalid
+    pattern plans no moves at all, so this is exactly the state the previous layer leaves.
+    """
+    machine = WinderMachine(job.layerParameters["mandrelParameters"].diameter, job.verboseOutput)
+    toolpath = machine.get_toolpath()
+    machine.feed_rate_mm_per_min = job.feedRate
+    toolpath.feed_rate = job.feedRate
+
+    machine.insert_comment(job.layerComment)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        planLayer(machine, job.layerParameters)
+
+    collapseReport = None
+    if job.collapseTolerance is not None:
+        toolpath, collapseReport = collapse_segments(
+            toolpath, job.collapseTolerance, machine.mandrel_diameter
+        )
+
+    return PlannedLayer(
+        job.layerComment,
+        toolpath,
+        machine.get_gcode_time_s(),
+        machine.get_tow_length_m(),
+        output.getvalue(),
+        collapseReport,
+    )
+
+def layerCacheKey(job: LayerJob) -> str:
+    """
+    Key of a layer's planned output. The layer comment is left out, since it is only the
+    layer's position in the wind, so that adding or removing layers keeps the others cached.
+    """
+    return cache_key({
+        "plannerVersion": PLANNER_VERSION,
+        "layer": job.layerParameters["parameters"],
+        "mandrel": job.layerParameters["mandrelParameters"],
+        "tow": job.layerParameters["towParameters"],
+        "feedRate": job.feedRate,
+        "verboseOutput": job.verboseOutput,
+        "collapseTolerance": job.collapseTolerance,
+    })
+
+def loadCachedLayer(layerCache: LayerCache, job: LayerJob) -> Optional[PlannedLayer]:
+    cached = layerCache.load(layerCacheKey(job))
+    if cached is None:
+        return None
+
+    toolpath, data = cached
+    toolpath.text[0] = job.layerComment
+    collapseReport = data["collapseReport"]
+    return PlannedLayer(
+        job.layerComment,
+        toolpath,
+        data["timeS"],
+        data["towLengthM"],
+        data["output"],
+        None if collapseReport is None else CollapseReport(**collapseReport),
+    )
+
+def storeCachedLayer(layerCache: LayerCache, job: LayerJob, plannedLayer: PlannedLayer) -> None:
+    collapseReport = plannedLayer.collapseReport
+    layerCache.store(layerCacheKey(job), plannedLayer.toolpath, {
+        "timeS": plannedLayer.timeS,
+        "towLengthM": plannedLayer.towLengthM,
+        "output": plannedLayer.output,
+        "collapseReport": None if collapseReport is None else vars(collapseReport),
+    })
+
+def mapLayerJobs(
+    layerJobs: List[LayerJob], jobs: int = 1, layerCache: Optional[LayerCache] = None
+) -> Iterator[PlannedLayer]:
+    """
+    Plan layers in order, in `jobs` worker processes when that is more than one.
+
+    Layers found in `layerCache` are loaded instead of planned, and newly planned ones are
+    added to it.
+    """
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    def loadLayer(job: LayerJob) -> Optional[PlannedLayer]:
+        return None if layerCache is None else loadCachedLayer(layerCache, job)
+
+    def storeLayer(job: LayerJob, plannedLayer: PlannedLayer) -> None:
+        if layerCache is not None:
+            storeCachedLayer(layerCache, job, plannedLayer)
+
+    if jobs <= 1:
+        for job in layerJobs:
+            plannedLayer = loadLayer(job)
+            if plannedLayer is None:
+                plannedLayer = planLayerJob(job)
+                storeLayer(job, plannedLayer)
+            yield plannedLayer
+        return
+
+    cachedLayers = [loadLayer(job) for job in layerJobs]
+    missingJobs = [job for job, cachedLayer in zip(layerJobs, cachedLayers) if cachedLayer is None]
+    if not missingJobs:
+        yield from cachedLayers
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(missingJobs))) as executor:
+        plannedLayers = executor.map(planLayerJob, missingJobs)
+        for job, plannedLayer in zip(layerJobs, cachedLayers):
+            if plannedLayer is None:
+                plannedLayer = next(plannedLayers)
+                storeLayer(job, plannedLayer)
+            yield plannedLayer
+
+def buildLayer(layer: Dict) -> TLayerParameters:
+    """
+    Turn a layer definition from a .wind file into its layer parameters object.
+    """
+    layerClasses = {
+        ELayerType.HOOP: THoopLayer,
+        ELayerType.HELICAL: THelicalLayer,
+        ELayerType.SKIP: TSkipLayer,
+    }
+    windType = ELayerType(layer["windType"])
+    return layerClasses[windType](**{key: value for key, value in layer.items() if key != "windType"})
+
+def planLayer(machine: WinderMachine, layerParameters: Dict) -> None:
+    windType = layerParameters["parameters"].windType
+
+    if windType == ELayerType.HOOP:
+        planHoopLayer(machine, layerParameters)
+    elif windType == ELayerType.HELICAL:
+        planHelicalLayer(machine, layerParameters)
+    elif windType == ELayerType.SKIP:
+        planSkipLayer(machine, layerParameters)
+
+def hoopLayerGeometry(layerParameters: Dict) -> Dict[str, float]:
+    """
+    Derive the delivery head angle and mandrel positions of a hoop layer.
+    """
     lockDegrees = 180
 
     windAngle = 90 - rad_to_deg(
@@ -90,6 +446,25 @@ def planHoopLayer(machine: WinderMachine, layerParameters: Dict) -> None:
     nearMandrelPositionDegrees = farLockPositionDegrees + (mandrelRotations * 360)
     nearLockPositionDegrees = nearMandrelPositionDegrees + lockDegrees
 
+    return {
+        "lockDegrees": lockDegrees,
+        "windAngle": windAngle,
+        "farMandrelPositionDegrees": farMandrelPositionDegrees,
+        "farLockPositionDegrees": farLockPositionDegrees,
+        "nearMandrelPositionDegrees": nearMandrelPositionDegrees,
+        "nearLockPositionDegrees": nearLockPositionDegrees,
+    }
+
+def planHoopLayer(machine: WinderMachine, layerParameters: Dict) -> None:
+
+    geometry = hoopLayerGeometry(layerParameters)
+    lockDegrees = geometry["lockDegrees"]
+    windAngle = geometry["windAngle"]
+    farMandrelPositionDegrees = geometry["farMandrelPositionDegrees"]
+    farLockPositionDegrees = geometry["farLockPositionDegrees"]
+    nearMandrelPositionDegrees = geometry["nearMandrelPositionDegrees"]
+    nearLockPositionDegrees = geometry["nearLockPositionDegrees"]
+
     machine.move({
         ECoordinateAxes.CARRIAGE: 0,
         ECoordinateAxes.MANDREL: lockDegrees,
@@ -117,14 +492,14 @@ def planHoopLayer(machine: WinderMachine, layerParameters: Dict) -> None:
         ECoordinateAxes.MANDREL: nearLockPositionDegrees,
         ECoordinateAxes.DELIVERY_HEAD: 0,
     })
-    machine.zeroAxes(nearLockPositionDegrees)
-
-def planHelicalLayer(machine: WinderMachine, layerParameters: Dict) -> None:
+    machine.zero_axes(nearLockPositionDegrees)
 
+def helicalLayerGeometry(layerParameters: Dict) -> Dict[str, float]:
+    """
+    Derive the circuit count, pattern layout and per-pass mandrel rotations of a helical layer.
+    """
     deliveryHeadPassStartAngle = -10
-    leadOutDegrees = layerParameters["parameters"].leadOutDegrees
     windLeadInMM = layerParameters["parameters"].leadInMM
-    lockDegrees = layerParameters["parameters"].lockDegrees
     deliveryHeadAngleDegrees = -1 * (90 - layerParameters["parameters"].windAngle)
     mandrelCircumference = 3.14159 * layerParameters["mandrelParameters"].diameter
     towArcLength = (
@@ -132,7 +507,7 @@ def planHelicalLayer(machine: WinderMachine, layerParameters: Dict) -> None:
         (deg_to_rad(layerParameters["parameters"].windAngle))
     )
     numCircuits = int(mandrelCircumference / towArcLength)
-    patternStepDegrees = 360 * (1 / numCircuits)
+    patternStepDegrees = 360 * (1 / numCircuits) if numCircuits > 0 else 0
     passRotationMM = layerParameters["mandrelParameters"].windLength * (
         deg_to_rad(layerParameters["parameters"].windAngle)
     )
@@ -145,6 +520,33 @@ def planHelicalLayer(machine: WinderMachine, layerParameters: Dict) -> None:
         layerParameters["mandrelParameters"].windLength - windLeadInMM
     )
 
+    return {
+        "deliveryHeadPassStartAngle": deliveryHeadPassStartAngle,
+        "deliveryHeadAngleDegrees": deliveryHeadAngleDegrees,
+        "numCircuits": numCircuits,
+        "patternStepDegrees": patternStepDegrees,
+        "passRotationDegrees": passRotationDegrees,
+        "numberOfPatterns": numberOfPatterns,
+        "leadInDegrees": leadInDegrees,
+        "mainPassDegrees": mainPassDegrees,
+    }
+
+def planHelicalLayer(machine: WinderMachine, layerParameters: Dict) -> None:
+
+    geometry = helicalLayerGeometry(layerParameters)
+    deliveryHeadPassStartAngle = geometry["deliveryHeadPassStartAngle"]
+    leadOutDegrees = layerParameters["parameters"].leadOutDegrees
+    windLeadInMM = layerParameters["parameters"].leadInMM
+    lockDegrees = layerParameters["parameters"].lockDegrees
+    deliveryHeadAngleDegrees = geometry["deliveryHeadAngleDegrees"]
+    numCircuits = geometry["numCircuits"]
+    patternStepDegrees = geometry["patternStepDegrees"]
+    passRotationDegrees = geometry["passRotationDegrees"]
+    patternNumber = layerParameters["parameters"].patternNumber
+    numberOfPatterns = geometry["numberOfPatterns"]
+    leadInDegrees = geometry["leadInDegrees"]
+    mainPassDegrees = geometry["mainPassDegrees"]
+
     passParameters = [
         {
             "deliveryHeadSign": 1,
@@ -201,7 +603,7 @@ def planHelicalLayer(machine: WinderMachine, layerParameters: Dict) -> None:
         ECoordinateAxes.DELIVERY_HEAD: 0,
     })
 
-    machine.zeroAxes(mandrelPositionDegrees)
+    machine.zero_axes(mandrelPositionDegrees)
 
 def planSkipLayer(machine: WinderMachine, layerParameters: Dict) -> None:
     machine.move({
@@ -209,4 +611,4 @@ def planSkipLayer(machine: WinderMachine, layerParameters: Dict) -> None:
         ECoordinateAxes.MANDREL: layerParameters["parameters"].mandrelRotation,
         ECoordinateAxes.DELIVERY_HEAD: 0,
     })
-    machine.setPosition({ECoordinateAxes.MANDREL: 0})
+    machine.set_position({ECoordinateAxes.MANDREL: 0})
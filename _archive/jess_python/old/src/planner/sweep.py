@@ -0,0 +1,227 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, product
+from typing import Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+import csv
+import json
+import os
+from .cust_types import IMandrelParameters, ITowParameters, IWindParameters, ELayerType
+from .estimate import estimateHelicalLayer
+from .planner import buildLayer
+
+# Helical layer fields that can be swept, in the order they appear in the results
+SWEEP_FIELDS = ("windAngle", "patternNumber", "leadInMM", "lockDegrees", "leadOutDegrees")
+
+# Fields the planner counts with, which only take whole numbers
+SWEEP_INTEGER_FIELDS = ("patternNumber",)
+
+# Objectives to rank by, smallest first, and the SweepPoint attribute each one reads
+SWEEP_OBJECTIVES = {
+    "time": "timeS",
+    "tow": "towLengthM",
+}
+
+
+class SweepPoint:
+    def __init__(
+        self,
+        parameters: Dict[str, float],
+        numCircuits: Optional[int],
+        patternValid: bool,
+        timeS: float,
+        towLengthM: float,
+    ):
+        self.parameters = parameters
+        self.numCircuits = numCircuits
+        self.patternValid = patternValid
+        self.timeS = timeS
+        self.towLengthM = towLengthM
+
+    def asRow(self) -> Dict:
+        return {
+            **self.parameters,
+            "numCircuits": self.numCircuits,
+            "patternValid": self.patternValid,
+            "timeS": self.timeS,
+            "towLengthM": self.towLengthM,
+        }
+
+
+def parseSweepValues(spec: str, integer: bool = False) -> List[float]:
+    """
+    Parse a sweep axis: "start:stop:step" (stop included), "a,b,c", or a single value.
+
+    Values are ints when every number in the spec is written as one. With `integer`, every
+    value must be a whole number, and is given as an int however it was written.
+    """
+    values = _parseSweepNumbers(spec)
+    if not integer:
+        return values
+
+    wholeValues = []
+    for value in values:
+        if not float(value).is_integer():
+            raise ValueError(f"Expected whole numbers, got {value} in '{spec}'")
+        wholeValues.append(int(value))
+    return wholeValues
+
+
+def _parseSweepNumbers(spec: str) -> List[float]:
+    def parseNumber(token: str) -> float:
+        token = token.strip()
+        try:
+            return int(token)
+        except ValueError:
+            return float(token)
+
+    if ":" in spec:
+        parts = [parseNumber(token) for token in spec.split(":")]
+        if len(parts) != 3:
+            raise ValueError(f"Expected start:stop:step, got '{spec}'")
+        start, stop, step = parts
+        if step <= 0:
+            raise ValueError(f"Sweep step must be positive, got {step}")
+        # A little slack so float steps still reach the stop value
+        count = int((stop - start) / step + 1e-9) + 1
+        if all(isinstance(part, int) for part in parts):
+            return [start + index * step for index in range(count)]
+        return [round(start + index * step, 10) for index in range(count)]
+
+    return [parseNumber(token) for token in spec.split(",") if token.strip()]
+
+
+def sweepHelicalLayer(
+    windingParameters: IWindParameters,
+    grid: Dict[str, Sequence[float]],
+    objective: str = "time",
+    layerIndex: Optional[int] = None,
+    jobs: int = 1,
+    chunkSize: int = 4096,
+) -> List[SweepPoint]:
+    """
+    Estimate a helical layer for every combination of the given parameter values.
+
+    Fields missing from `grid` keep the value of the swept layer, which is the wind's layer at
+    `layerIndex` or its first helical layer. Each point is costed with `estimateHelicalLayer`,
+    so nothing is planned. Points are spread over `jobs` worker processes (0 uses every core)
+    in chunks of `chunkSize`.
+
+    Args:
+        windingParameters (IWindParameters): The wind definition, as loaded from a .wind file.
+        grid (Dict[str, Sequence[float]]): Values to try for some of SWEEP_FIELDS.
+        objective (str, optional): Key of SWEEP_OBJECTIVES to rank by. Defaults to "time".
+        layerIndex (int, optional): Index of the helical layer to start from.
+        jobs (int, optional): Number of worker processes. Defaults to 1.
+        chunkSize (int, optional): Points per task handed to a worker. Defaults to 4096.
+
+    Returns:
+        List[SweepPoint]: Every point, valid patterns first, each group ranked by the objective.
+    """
+    if objective not in SWEEP_OBJECTIVES:
+        raise ValueError(f"Unknown objective '{objective}', expected one of {list(SWEEP_OBJECTIVES)}")
+    unknownFields = set(grid) - set(SWEEP_FIELDS)
+    if unknownFields:
+        raise ValueError(f"Cannot sweep {sorted(unknownFields)}, expected some of {list(SWEEP_FIELDS)}")
+
+    baseLayer = _sweptLayerDefinition(windingParameters, layerIndex)
+    axes = [grid.get(field, [baseLayer[field]]) for field in SWEEP_FIELDS]
+
+    chunks = (
+        (baseLayer, windingParameters["mandrelParameters"], windingParameters["towParameters"],
+         windingParameters["defaultFeedRate"], combinations)
+        for combinations in _batched(product(*axes), chunkSize)
+    )
+
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    points: List[SweepPoint] = []
+    if jobs <= 1:
+        for chunk in chunks:
+            points.extend(estimateSweepChunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for chunkPoints in executor.map(estimateSweepChunk, chunks):
+                points.extend(chunkPoints)
+
+    objectiveAttribute = SWEEP_OBJECTIVES[objective]
+    points.sort(key=lambda point: (not point.patternValid, getattr(point, objectiveAttribute)))
+    return points
+
+
+def estimateSweepChunk(
+    chunk: Tuple[Dict, Dict, Dict, float, List[Tuple[float, ...]]]
+) -> List[SweepPoint]:
+    """
+    Estimate a batch of sweep points. Runs in the worker processes.
+    """
+    baseLayer, mandrelDefinition, towDefinition, feedRate, combinations = chunk
+    mandrelParameters = IMandrelParameters(**mandrelDefinition)
+    towParameters = ITowParameters(**towDefinition)
+
+    points = []
+    for combination in combinations:
+        parameters = dict(zip(SWEEP_FIELDS, combination))
+        layer = buildLayer({**baseLayer, **parameters})
+        try:
+            estimate = estimateHelicalLayer({
+                "parameters": layer,
+                "mandrelParameters": mandrelParameters,
+                "towParameters": towParameters,
+            }, feedRate)
+        except ZeroDivisionError:
+            # A zero wind angle or pattern number has no pattern at all
+            points.append(SweepPoint(parameters, None, False, float("inf"), float("inf")))
+            continue
+
+        if not estimate.patternValid:
+            # The planner skips these layers, so they cost nothing but wind nothing either
+            points.append(SweepPoint(parameters, estimate.numCircuits, False, float("inf"), float("inf")))
+            continue
+
+        points.append(SweepPoint(
+            parameters, estimate.numCircuits, True, estimate.timeS, estimate.towLengthM
+        ))
+    return points
+
+
+def writeSweepCsv(points: List[SweepPoint], sink: TextIO) -> None:
+    writer = csv.DictWriter(
+        sink, fieldnames=[*SWEEP_FIELDS, "numCircuits", "patternValid", "timeS", "towLengthM"]
+    )
+    writer.writeheader()
+    for point in points:
+        writer.writerow(point.asRow())
+
+
+def writeSweepJson(points: List[SweepPoint], sink: TextIO) -> None:
+    # Infinite costs of invalid points are written as null, which JSON can represent
+    rows = [
+        {key: None if value == float("inf") else value for key, value in point.asRow().items()}
+        for point in points
+    ]
+    json.dump(rows, sink, indent=2)
+
+
+def _sweptLayerDefinition(windingParameters: IWindParameters, layerIndex: Optional[int]) -> Dict:
+    layers = windingParameters["layers"]
+    if layerIndex is None:
+        helicalIndices = [
+            index for index, layer in enumerate(layers) if layer["windType"] == ELayerType.HELICAL.value
+        ]
+        if not helicalIndices:
+            raise ValueError("The wind has no helical layer to sweep")
+        layerIndex = helicalIndices[0]
+
+    layer = layers[layerIndex]
+    if layer["windType"] != ELayerType.HELICAL.value:
+        raise ValueError(f"Layer {layerIndex + 1} is a {layer['windType']} layer, not a helical layer")
+    return layer
+
+
+def _batched(iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
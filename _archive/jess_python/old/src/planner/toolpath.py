@@ -0,0 +1,368 @@
+from enum import IntEnum
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from gcode_format import ENumberStyle, format_g0_lines, format_number
+
+
+class EToolpathOpcode(IntEnum):
+    MOVE = 0
+    SET_POSITION = 1
+    FEED_RATE = 2
+    COMMENT = 3
+    RAW = 4
+
+
+# Bits of the per-row flags column. The first three mark which axes appear in the emitted
+# command, the rest mark values that were given as ints so they are written back without a
+# trailing ".0", exactly as the string-based planner used to write them.
+AXIS_PRESENT_FLAGS = (1, 2, 4)
+AXIS_INTEGER_FLAGS = (8, 16, 32)
+FEED_INTEGER_FLAG = 64
+ALL_AXES_PRESENT = 1 | 2 | 4
+
+AXIS_LETTERS = ("X", "Y", "Z")
+
+TOptionalPosition = Sequence[Optional[float]]
+
+
+class Toolpath:
+    """
+    Columnar store of planned commands.
+
+    Every row holds an opcode, a flags bitmask, the complete machine position after the row
+    and the feed rate in effect for it. Comment and raw text lives in a side table keyed by
+    row index. The columns grow in whole chunks, and G-code text is only produced on demand.
+    """
+
+    def __init__(self, chunk_size: int = 65536):
+        self.chunk_size = chunk_size
+        self.length = 0
+        self.capacity = 0
+        self._opcodes = np.empty(0, dtype=np.uint8)
+        self._flags = np.empty(0, dtype=np.uint8)
+        self._x = np.empty(0, dtype=np.float64)
+        self._y = np.empty(0, dtype=np.float64)
+        self._z = np.empty(0, dtype=np.float64)
+        self._feed = np.empty(0, dtype=np.float64)
+        self.text: Dict[int, str] = {}
+
+        # Modal state after the last row, kept across `clear`
+        self.position: List[float] = [0, 0, 0]
+        self.feed_rate: float = 0
+        # Position before the first row, the origin of the first move
+        self.start_position: List[float] = [0, 0, 0]
+
+    @classmethod
+    def from_columns(
+        cls,
+        opcodes: np.ndarray,
+        flags: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray,
+        feed: np.ndarray,
+        text: Dict[int, str],
+        chunk_size: int = 65536,
+        copy: bool = True,
+    ) -> "Toolpath":
+        """
+        Rebuild a toolpath from its columns, taking the modal state from the last row.
+
+        With `copy` off the columns are used as they are, e.g. as views of a memory-mapped
+        file. They are only copied if the toolpath grows.
+        """
+        toolpath = cls(chunk_size)
+        count = len(opcodes)
+        if copy:
+            toolpath._reserve(count)
+            toolpath._opcodes[:count] = opcodes
+            toolpath._flags[:count] = flags
+            toolpath._x[:count] = x
+            toolpath._y[:count] = y
+            toolpath._z[:count] = z
+            toolpath._feed[:count] = feed
+        else:
+            toolpath._opcodes, toolpath._flags = opcodes, flags
+            toolpath._x, toolpath._y, toolpath._z, toolpath._feed = x, y, z, feed
+            toolpath.length = toolpath.capacity = count
+        toolpath.text = dict(text)
+        if count:
+            toolpath.position = [float(x[-1]), float(y[-1]), float(z[-1])]
+            toolpath.feed_rate = float(feed[-1])
+        return toolpath
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def opcodes(self) -> np.ndarray:
+        return self._opcodes[:self.length]
+
+    @property
+    def flags(self) -> np.ndarray:
+        return self._flags[:self.length]
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._x[:self.length]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._y[:self.length]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self._z[:self.length]
+
+    @property
+    def feed(self) -> np.ndarray:
+        return self._feed[:self.length]
+
+    def nbytes(self) -> int:
+        """
+        Memory held by the column arrays, including unused capacity.
+        """
+        return sum(
+            column.nbytes
+            for column in (self._opcodes, self._flags, self._x, self._y, self._z, self._feed)
+        )
+
+    def clear(self) -> None:
+        """
+        Drop all rows while keeping the modal position and feed rate.
+        """
+        self.length = 0
+        self.text = {}
+        self.start_position = list(self.position)
+
+    def _reserve(self, count: int) -> int:
+        start = self.length
+        required = start + count
+        # Read-only columns, as mapped from a file, are copied before anything is written
+        if required > self.capacity or not self._opcodes.flags.writeable:
+            # Grow by whole chunks, at least half the current capacity at a time
+            growth = max(required - self.capacity, self.capacity // 2, 1)
+            new_capacity = self.capacity + -(-growth // self.chunk_size) * self.chunk_size
+            for name in ("_opcodes", "_flags", "_x", "_y", "_z", "_feed"):
+                old_column = getattr(self, name)
+                new_column = np.empty(new_capacity, dtype=old_column.dtype)
+                new_column[:start] = old_column[:start]
+                setattr(self, name, new_column)
+            self.capacity = new_capacity
+        self.length = required
+        return start
+
+    def _append_row(self, opcode: EToolpathOpcode, flags: int, text: Optional[str] = None) -> int:
+        row = self._reserve(1)
+        self._opcodes[row] = opcode
+        self._flags[row] = flags
+        self._x[row], self._y[row], self._z[row] = self.position
+        self._feed[row] = self.feed_rate
+        if text is not None:
+            self.text[row] = text
+        return row
+
+    def _apply_position(self, position: TOptionalPosition) -> int:
+        flags = 0
+        for axis_index, value in enumerate(position):
+            if value is None:
+                continue
+            flags |= AXIS_PRESENT_FLAGS[axis_index]
+            if isinstance(value, int):
+                flags |= AXIS_INTEGER_FLAGS[axis_index]
+            self.position[axis_index] = value
+        return flags
+
+    def append_move(self, position: TOptionalPosition) -> None:
+        """
+        Add a G0 move. Axes given as None keep their modal value and are not written.
+        """
+        self._append_row(EToolpathOpcode.MOVE, self._apply_position(position))
+
+    def append_set_position(self, position: TOptionalPosition) -> None:
+        """
+        Add a G92 that redefines the current position of the given axes.
+        """
+        self._append_row(EToolpathOpcode.SET_POSITION, self._apply_position(position))
+
+    def append_feed_rate(self, feed_rate: float) -> None:
+        self.feed_rate = feed_rate
+        self._append_row(
+            EToolpathOpcode.FEED_RATE, FEED_INTEGER_FLAG if isinstance(feed_rate, int) else 0
+        )
+
+    def append_comment(self, text: str) -> None:
+        self._append_row(EToolpathOpcode.COMMENT, 0, text)
+
+    def append_raw(self, command: str) -> None:
+        self._append_row(EToolpathOpcode.RAW, 0, command)
+
+    def extend_moves(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> None:
+        """
+        Add one full three-axis G0 move per element of the given float arrays.
+        """
+        count = len(x)
+        if count == 0:
+            return
+        start = self._reserve(count)
+        end = start + count
+        self._opcodes[start:end] = EToolpathOpcode.MOVE
+        self._flags[start:end] = ALL_AXES_PRESENT
+        self._x[start:end] = x
+        self._y[start:end] = y
+        self._z[start:end] = z
+        self._feed[start:end] = self.feed_rate
+        self.position = [float(x[-1]), float(y[-1]), float(z[-1])]
+
+    def extend(self, other: "Toolpath") -> None:
+        """
+        Append all rows of another toolpath and take over its modal state.
+        """
+        count = len(other)
+        if count:
+            start = self._reserve(count)
+            end = start + count
+            self._opcodes[start:end] = other.opcodes
+            self._flags[start:end] = other.flags
+            self._x[start:end] = other.x
+            self._y[start:end] = other.y
+            self._z[start:end] = other.z
+            self._feed[start:end] = other.feed
+            for row, text in other.text.items():
+                self.text[start + row] = text
+        self.position = list(other.position)
+        self.feed_rate = other.feed_rate
+
+    def take(self, rows: np.ndarray) -> "Toolpath":
+        """
+        Build a new toolpath from the given rows, in ascending order, with the same modal state.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        taken = Toolpath(self.chunk_size)
+        start = taken._reserve(len(rows))
+        end = start + len(rows)
+        taken._opcodes[start:end] = self.opcodes[rows]
+        taken._flags[start:end] = self.flags[rows]
+        taken._x[start:end] = self.x[rows]
+        taken._y[start:end] = self.y[rows]
+        taken._z[start:end] = self.z[rows]
+        taken._feed[start:end] = self.feed[rows]
+        if self.text:
+            text_rows = np.fromiter(self.text.keys(), dtype=np.int64, count=len(self.text))
+            new_rows = np.searchsorted(rows, text_rows)
+            for row, new_row in zip(text_rows.tolist(), new_rows.tolist()):
+                if new_row < len(rows) and rows[new_row] == row:
+                    taken.text[new_row] = self.text[row]
+        taken.start_position = list(self.start_position)
+        taken.position = list(self.position)
+        taken.feed_rate = self.feed_rate
+        return taken
+
+    def _format_row(self, row: int, digits: int, style: ENumberStyle) -> str:
+        opcode = self._opcodes[row]
+        if opcode == EToolpathOpcode.COMMENT:
+            return f"; {self.text[row]}"
+        if opcode == EToolpathOpcode.RAW:
+            return self.text[row]
+
+        flags = int(self._flags[row])
+        if opcode == EToolpathOpcode.FEED_RATE:
+            feed_rate = float(self._feed[row])
+            if flags & FEED_INTEGER_FLAG:
+                feed_rate = int(feed_rate)
+            return f"G0 F{format_number(feed_rate, digits, style)}"
+
+        command = "G92" if opcode == EToolpathOpcode.SET_POSITION else "G0"
+        values = (self._x[row], self._y[row], self._z[row])
+        for axis_index, letter in enumerate(AXIS_LETTERS):
+            if not flags & AXIS_PRESENT_FLAGS[axis_index]:
+                continue
+            value = float(values[axis_index])
+            if flags & AXIS_INTEGER_FLAGS[axis_index]:
+                value = int(value)
+            command += f" {letter}{format_number(value, digits, style)}"
+        return command
+
+    def iter_gcode(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        digits: int = 6,
+        style: ENumberStyle = ENumberStyle.SHORTEST,
+    ) -> Iterator[str]:
+        """
+        Render rows [start, stop) as G-code lines.
+
+        Runs of full three-axis float moves are formatted in bulk, everything else row by row.
+        """
+        stop = self.length if stop is None else min(stop, self.length)
+        if start >= stop:
+            return
+
+        is_bulk_row = (self.opcodes[start:stop] == EToolpathOpcode.MOVE) & (
+            self.flags[start:stop] == ALL_AXES_PRESENT
+        )
+        run_start = start
+        for special_row in (np.flatnonzero(~is_bulk_row) + start).tolist() + [stop]:
+            if special_row > run_start:
+                yield from format_g0_lines(
+                    self._x[run_start:special_row],
+                    self._y[run_start:special_row],
+                    self._z[run_start:special_row],
+                    digits,
+                    style,
+                )
+            if special_row < stop:
+                yield self._format_row(special_row, digits, style)
+            run_start = special_row + 1
+
+    def get_gcode(self, digits: int = 6, style: ENumberStyle = ENumberStyle.SHORTEST) -> List[str]:
+        return list(self.iter_gcode(digits=digits, style=style))
+
+
+def profile_toolpath(toolpath: Toolpath, mandrel_diameter: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the duration (s) and tow length (mm) of every row of a toolpath.
+
+    Uses the same model as the planner's profiler: each move runs at the feed rate in effect,
+    and the tow follows the straight line between carriage position and mandrel arc length.
+    Rows that are not moves take no time and use no tow.
+    """
+    is_move = toolpath.opcodes == EToolpathOpcode.MOVE
+
+    carriage_moves, mandrel_moves, delivery_head_moves = (
+        np.where(is_move, np.diff(column, prepend=start), 0)
+        for column, start in zip((toolpath.x, toolpath.y, toolpath.z), toolpath.start_position)
+    )
+
+    move_lengths = np.sqrt(carriage_moves**2 + mandrel_moves**2 + delivery_head_moves**2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Moves that go nowhere take no time, even before any feed rate is set
+        row_times_s = np.where(is_move & (move_lengths > 0), move_lengths / toolpath.feed * 60, 0)
+    arc_lengths_mm = mandrel_moves / 360 * mandrel_diameter * 3.14159
+    row_tow_lengths_mm = np.sqrt(carriage_moves**2 + arc_lengths_mm**2)
+
+    return row_times_s, row_tow_lengths_mm
+
+
+def layer_ranges(toolpath: Toolpath) -> List[Tuple[str, int, int]]:
+    """
+    Split a toolpath into the [start, stop) row ranges of its layers.
+
+    Layers start at the planner's "Layer i of n: type" comments. Rows before the first layer
+    comment form a "Preamble" range.
+    """
+    starts = [
+        (row, text) for row, text in sorted(toolpath.text.items())
+        if toolpath.opcodes[row] == EToolpathOpcode.COMMENT and text.startswith("Layer ")
+    ]
+
+    ranges = []
+    previous_row, previous_name = 0, "Preamble"
+    for row, text in starts:
+        if row > previous_row:
+            ranges.append((previous_name, previous_row, row))
+        previous_row, previous_name = row, text
+    if len(toolpath) > previous_row:
+        ranges.append((previous_name, previous_row, len(toolpath)))
+    return ranges
@@ -0,0 +1,252 @@
+from typing import Dict, List, Optional
+import numpy as np
+from planner.cust_types import IMandrelParameters, ITowParameters
+from planner.toolpath import EToolpathOpcode, Toolpath, layer_ranges
+
+# Hoop and helical layers both lay two plies: one pass out along the mandrel and one back.
+# A terminal hoop layer stops at the far end, after one.
+PLIES_PER_LAYER = 2
+
+
+class LayerCoverage:
+    def __init__(self, name: str, tow_counts: np.ndarray, nominal_tow_count: float = PLIES_PER_LAYER):
+        self.name = name
+        # Tows deposited on each (axial, angular) cell by this layer, fractional at tow edges
+        self.tow_counts = tow_counts
+        self.nominal_tow_count = nominal_tow_count
+
+    @property
+    def gap_map(self) -> np.ndarray:
+        """
+        Cells short of the nominal ply count by more than half a tow.
+        """
+        return self.tow_counts < self.nominal_tow_count - 0.5
+
+    @property
+    def overlap_map(self) -> np.ndarray:
+        """
+        Cells over the nominal ply count by more than half a tow.
+        """
+        return self.tow_counts > self.nominal_tow_count + 0.5
+
+    @property
+    def gap_fraction(self) -> float:
+        return float(self.gap_map.mean())
+
+    @property
+    def coverage_fraction(self) -> float:
+        return 1 - self.gap_fraction
+
+    @property
+    def overlap_fraction(self) -> float:
+        return float(self.overlap_map.mean())
+
+
+def nominal_ply_count(carriage_positions: np.ndarray) -> int:
+    """
+    Plies a layer is meant to lay, given the carriage position before its first move and after
+    each of its moves.
+
+    Every pass along the mandrel lays one ply, up to `PLIES_PER_LAYER`: a helical layer makes
+    many passes but its circuits make up two plies between them.
+    """
+    directions = np.sign(np.diff(carriage_positions))
+    directions = directions[directions != 0]
+    passes = 1 + int(np.count_nonzero(directions[1:] != directions[:-1]))
+    return min(passes, PLIES_PER_LAYER)
+
+
+class CoverageSimulator:
+    """
+    Rasterizes the tow laid down by a toolpath onto the unwrapped mandrel surface.
+
+    The grid spans the wind length axially and a full turn of the mandrel, in cells of
+    `axial_resolution_mm` by `angular_resolution_degrees`. Every move lays a band of the tow
+    width centred on its path across the unwrapped surface. The band is sampled on a
+    sub-cell lattice and each sample adds its share of a tow to the cells around it, so
+    partially covered cells get fractional tow counts. Material beyond the ends of the wind
+    length is not tracked.
+
+    Toolpaths are added in winding order, one layer or a whole program at a time. G92 rows
+    are followed, so the mandrel keeps its physical orientation across layers.
+    """
+
+    def __init__(
+        self,
+        mandrel_parameters: IMandrelParameters,
+        tow_parameters: ITowParameters,
+        axial_resolution_mm: float = 1.0,
+        angular_resolution_degrees: float = 1.0,
+        end_zone_mm: Optional[float] = None,
+        samples_per_cell: float = 2,
+        max_samples: int = 1 << 21,
+    ):
+        self.mandrel_parameters = mandrel_parameters
+        self.tow_parameters = tow_parameters
+        self.circumference_mm = np.pi * mandrel_parameters.diameter
+
+        self.num_axial_cells = int(np.ceil(mandrel_parameters.windLength / axial_resolution_mm))
+        self.num_angular_cells = int(round(360 / angular_resolution_degrees))
+        self.axial_cell_mm = axial_resolution_mm
+        self.angular_cell_mm = self.circumference_mm / self.num_angular_cells
+
+        # Thickness at the turnarounds is reported over this far in from each end
+        self.end_zone_mm = tow_parameters.width if end_zone_mm is None else end_zone_mm
+
+        # Sample the band at no more than half a cell in either direction
+        self.sample_step_mm = min(self.axial_cell_mm, self.angular_cell_mm) / samples_per_cell
+        self.num_width_samples = max(int(np.ceil(tow_parameters.width / self.sample_step_mm)), 1)
+        self.max_samples = max_samples
+
+        self.layers: List[LayerCoverage] = []
+        self.tow_counts = np.zeros((self.num_axial_cells, self.num_angular_cells))
+        # Physical minus commanded carriage and mandrel position, changed by every G92
+        self.position_offset = np.zeros(2)
+
+    @property
+    def axial_centres_mm(self) -> np.ndarray:
+        return (np.arange(self.num_axial_cells) + 0.5) * self.axial_cell_mm
+
+    @property
+    def thickness_mm(self) -> np.ndarray:
+        return self.tow_counts * self.tow_parameters.thickness
+
+    def add_toolpath(self, toolpath: Toolpath) -> List[LayerCoverage]:
+        """
+        Lay down every move of a toolpath and return the coverage of each layer in it.
+        """
+        commanded = np.column_stack((toolpath.x, toolpath.y))
+        previous = np.vstack((toolpath.start_position[:2], commanded[:-1]))
+
+        # A G92 redefines the commanded position without moving anything
+        is_set_position = (toolpath.opcodes == EToolpathOpcode.SET_POSITION)[:, None]
+        offsets = self.position_offset + np.cumsum(
+            np.where(is_set_position, previous - commanded, 0), axis=0
+        )
+        physical = commanded + offsets
+        physical_previous = np.vstack((
+            np.asarray(toolpath.start_position[:2]) + self.position_offset, physical[:-1]
+        ))
+        if len(toolpath):
+            self.position_offset = offsets[-1]
+
+        is_move = toolpath.opcodes == EToolpathOpcode.MOVE
+        degrees_to_mm = self.circumference_mm / 360
+
+        added_layers = []
+        for name, start, stop in layer_ranges(toolpath):
+            move_rows = np.flatnonzero(is_move[start:stop]) + start
+            if len(move_rows) == 0:
+                continue
+
+            tow_counts = np.zeros_like(self.tow_counts)
+            self._deposit(
+                tow_counts,
+                physical_previous[move_rows, 0],
+                physical_previous[move_rows, 1] * degrees_to_mm,
+                physical[move_rows, 0],
+                physical[move_rows, 1] * degrees_to_mm,
+            )
+            self.tow_counts += tow_counts
+            added_layers.append(LayerCoverage(name, tow_counts, nominal_ply_count(
+                np.concatenate(([physical_previous[move_rows[0], 0]], physical[move_rows, 0]))
+            )))
+
+        self.layers.extend(added_layers)
+        return added_layers
+
+    def _deposit(
+        self,
+        tow_counts: np.ndarray,
+        start_axial_mm: np.ndarray,
+        start_arc_mm: np.ndarray,
+        end_axial_mm: np.ndarray,
+        end_arc_mm: np.ndarray,
+    ) -> None:
+        axial_moves = end_axial_mm - start_axial_mm
+        arc_moves = end_arc_mm - start_arc_mm
+        lengths = np.sqrt(axial_moves**2 + arc_moves**2)
+        has_length = lengths > 0
+        start_axial_mm, start_arc_mm = start_axial_mm[has_length], start_arc_mm[has_length]
+        axial_moves, arc_moves, lengths = axial_moves[has_length], arc_moves[has_length], lengths[has_length]
+
+        width = self.tow_parameters.width
+        width_offsets = (np.arange(self.num_width_samples) + 0.5) / self.num_width_samples * width - width / 2
+        cell_area = self.axial_cell_mm * self.angular_cell_mm
+
+        samples_per_move = np.ceil(lengths / self.sample_step_mm).astype(np.int64)
+        sample_ends = np.cumsum(samples_per_move)
+        batch_size = max(self.max_samples // self.num_width_samples, 1)
+
+        first_move = 0
+        while first_move < len(lengths):
+            # As many whole moves as fit in a batch, and always at least one
+            samples_before = sample_ends[first_move] - samples_per_move[first_move]
+            last_move = max(
+                int(np.searchsorted(sample_ends, samples_before + batch_size, side="right")),
+                first_move + 1,
+            )
+            moves = slice(first_move, last_move)
+            counts = samples_per_move[moves]
+
+            # Sample centres along each move, then spread across the tow width
+            move_of_sample = np.repeat(np.arange(len(counts)), counts)
+            sample_index = np.arange(len(move_of_sample)) - np.repeat(np.cumsum(counts) - counts, counts)
+            fractions = (sample_index + 0.5) / counts[move_of_sample]
+
+            move_lengths = lengths[moves][move_of_sample]
+            axial_directions = axial_moves[moves][move_of_sample] / move_lengths
+            arc_directions = arc_moves[moves][move_of_sample] / move_lengths
+            centre_axial = start_axial_mm[moves][move_of_sample] + fractions * axial_moves[moves][move_of_sample]
+            centre_arc = start_arc_mm[moves][move_of_sample] + fractions * arc_moves[moves][move_of_sample]
+
+            sample_axial = centre_axial[:, None] - width_offsets[None, :] * arc_directions[:, None]
+            sample_arc = centre_arc[:, None] + width_offsets[None, :] * axial_directions[:, None]
+
+            # Each sample stands for its patch of tow, as a share of one cell, and is split
+            # bilinearly between the four cells around it to avoid aliasing at the tow edges
+            sample_weights = np.broadcast_to(
+                (move_lengths / counts[move_of_sample] * width / self.num_width_samples / cell_area)[:, None],
+                sample_axial.shape,
+            )
+            axial_positions = sample_axial / self.axial_cell_mm - 0.5
+            angular_positions = sample_arc / self.angular_cell_mm - 0.5
+            lower_axial_cells = np.floor(axial_positions)
+            lower_angular_cells = np.floor(angular_positions)
+            axial_fractions = axial_positions - lower_axial_cells
+            angular_fractions = angular_positions - lower_angular_cells
+            lower_axial_cells = lower_axial_cells.astype(np.int64)
+            lower_angular_cells = lower_angular_cells.astype(np.int64)
+
+            for axial_step, axial_weights in ((0, 1 - axial_fractions), (1, axial_fractions)):
+                axial_cells = lower_axial_cells + axial_step
+                in_grid = (axial_cells >= 0) & (axial_cells < self.num_axial_cells)
+                for angular_step, angular_weights in ((0, 1 - angular_fractions), (1, angular_fractions)):
+                    angular_cells = (lower_angular_cells + angular_step) % self.num_angular_cells
+                    tow_counts += np.bincount(
+                        (axial_cells * self.num_angular_cells + angular_cells)[in_grid],
+                        weights=(sample_weights * axial_weights * angular_weights)[in_grid],
+                        minlength=tow_counts.size,
+                    ).reshape(tow_counts.shape)
+
+            first_move = last_move
+
+    def end_zone_thickness_mm(self) -> Dict[str, Dict[str, float]]:
+        """
+        Mean and maximum total thickness in the near and far turnaround zones and in between.
+        """
+        centres = self.axial_centres_mm
+        zones = {
+            "near": centres < self.end_zone_mm,
+            "far": centres > self.mandrel_parameters.windLength - self.end_zone_mm,
+        }
+        zones["cylinder"] = ~(zones["near"] | zones["far"])
+
+        thickness = self.thickness_mm
+        return {
+            name: {
+                "mean": float(thickness[in_zone].mean()) if in_zone.any() else 0.0,
+                "max": float(thickness[in_zone].max()) if in_zone.any() else 0.0,
+            }
+            for name, in_zone in zones.items()
+        }
@@ -1,8 +1,18 @@
 from io import BytesIO
+import numpy as np
 from PIL import Image, ImageDraw
-from typing import List, Dict, Optional
-from .plot_helpers import generate_coordinates
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple, Union
+from .plot_helpers import join_segments, split_wraps
+from gcode_parser import ParsedGcode, parse_gcode_lines
+from toolpath_file import ToolpathFile, read_program
 from planner.cust_types import IMandrelParameters, ITowParameters
+from planner.toolpath import EToolpathOpcode, Toolpath
+
+# Tows are drawn as a dark outline with a lighter core
+TOW_OUTER_COLOR = "rgb(73, 0, 168)"
+TOW_INNER_COLOR = "rgb(252, 211, 3)"
+TOW_INNER_WIDTH_FRACTION = 0.75
 
 
 class WindParameters:
@@ -21,65 +31,85 @@ def plot_gcode(gcode: List[str]) -> Optional[BytesIO]:
     Returns:
         Optional[BytesIO]: A PNG image stream if successful, or None if invalid.
     """
-    # Check for a header in the first line
-    header_line_parts = gcode[0].split(" ")
-    if not (header_line_parts[0] == ";" and header_line_parts[1] == "Parameters"):
+    parsed = parse_gcode(gcode)
+    if parsed is None:
+        return None
+
+    return plot_toolpath(*parsed)
+
+
+def parse_gcode(gcode: List[str]) -> Optional[Tuple[Toolpath, WindParameters]]:
+    """
+    Read the moves and winding parameters of a planned G-code program.
+
+    Args:
+        gcode (List[str]): A list of G-code strings.
+
+    Returns:
+        Optional[Tuple[Toolpath, WindParameters]]: The moves and the header parameters, or None
+            if the header is missing.
+    """
+    return plot_inputs(parse_gcode_lines(gcode))
+
+
+def load_gcode(file: Path) -> Optional[Tuple[Toolpath, WindParameters]]:
+    """
+    Like `parse_gcode`, but reads a G-code or binary toolpath file directly.
+    """
+    return plot_inputs(read_program(file))
+
+
+def plot_inputs(parsed: Union[ParsedGcode, ToolpathFile]) -> Optional[Tuple[Toolpath, WindParameters]]:
+    if parsed.header is None:
         print("Did not find header comment in the first line")
         return None
+    return parsed.toolpath, WindParameters(**parsed.header)
+
+
+def plot_toolpath(toolpath: Toolpath, winding_parameters: WindParameters) -> BytesIO:
+    """
+    Plot the moves of a planned toolpath onto a canvas.
 
-    # Parse the winding parameters
-    winding_parameters = WindParameters(
-        **eval(" ".join(header_line_parts[2:]))
-    )  # Ensure input is sanitized in real-world usage
+    Args:
+        toolpath (Toolpath): The planned toolpath.
+        winding_parameters (WindParameters): Mandrel and tow parameters, as found in the header.
 
+    Returns:
+        BytesIO: A PNG image stream.
+    """
     # Create the canvas
     canvas_width = int(winding_parameters.mandrel["windLength"])
     canvas_height = 360
     canvas = Image.new("RGB", (canvas_width, canvas_height), "white")
     draw = ImageDraw.Draw(canvas)
 
-    x_coord, y_coord = 0, 0
-
-    for line in gcode:
-        line_parts = line.split(" ")
-        if line_parts[0] == ";":
-            # Comment, skip processing
-            continue
-
-        if line_parts[0] != "G0":
-            print(f"Unknown G-code line: '{line}', skipping")
-            continue
-
-        next_x_coord = x_coord
-        next_y_coord = y_coord
-
-        for coordinate in line_parts[1:]:
-            if coordinate[0] == "X":
-                next_x_coord = float(coordinate[1:])
-            if coordinate[0] == "Y":
-                next_y_coord = float(coordinate[1:])
-
-        for segment in generate_coordinates(
-            {"x": x_coord, "y": y_coord}, {"x": next_x_coord, "y": next_y_coord}
-        ):
-            # Draw the outer layer
-            draw.line(
-                [(point["x"], point["y"]) for point in segment],
-                fill="rgb(73, 0, 168)",
-                width=int(winding_parameters.tow["width"]),
-            )
-            # Draw the inner layer
-            draw.line(
-                [(point["x"], point["y"]) for point in segment],
-                fill="rgb(252, 211, 3)",
-                width=int(winding_parameters.tow["width"] * 0.75),
-            )
-
-        x_coord = next_x_coord
-        y_coord = next_y_coord
+    for polyline in join_segments(toolpath_segments(toolpath)):
+        # Draw the outer layer
+        draw.line(
+            polyline,
+            fill=TOW_OUTER_COLOR,
+            width=int(winding_parameters.tow["width"]),
+        )
+        # Draw the inner layer
+        draw.line(
+            polyline,
+            fill=TOW_INNER_COLOR,
+            width=int(winding_parameters.tow["width"] * TOW_INNER_WIDTH_FRACTION),
+        )
 
     # Save the canvas to a PNG stream
     output_stream = BytesIO()
     canvas.save(output_stream, format="PNG")
     output_stream.seek(0)
     return output_stream
+
+
+def toolpath_segments(toolpath: Toolpath) -> np.ndarray:
+    """
+    Screen-space segments of every move in a toolpath, split at mandrel wraps.
+    """
+    is_move = toolpath.opcodes == EToolpathOpcode.MOVE
+    start_x = np.concatenate(([toolpath.start_position[0]], toolpath.x[:-1]))[is_move]
+    start_y = np.concatenate(([toolpath.start_position[1]], toolpath.y[:-1]))[is_move]
+    segments, _ = split_wraps(start_x, start_y, toolpath.x[is_move], toolpath.y[is_move])
+    return segments
@@ -1,44 +1,115 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import numpy as np
 
 
-def generate_coordinates(start: Dict[str, float], end: Dict[str, float]) -> List[List[Dict[str, float]]]:
+def split_wraps(
+    start_x: np.ndarray, start_y: np.ndarray, end_x: np.ndarray, end_y: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Turn two machine coordinate endpoints into a set of screen-space line segments.
+    Split a batch of moves into screen-space segments that each stay within one mandrel turn.
+
+    Every move is cut wherever its mandrel coordinate crosses a multiple of 360 degrees, all
+    moves at once. Each piece is then drawn in the turn that contains its midpoint, so seam
+    points land exactly on y = 0 and y = 360, and a move ending exactly on a multiple of 360
+    is not cut at all.
 
     Args:
-        start (Dict[str, float]): Starting point with 'x' and 'y' coordinates.
-        end (Dict[str, float]): Ending point with 'x' and 'y' coordinates.
+        start_x (np.ndarray): Carriage position at the start of each move.
+        start_y (np.ndarray): Mandrel angle at the start of each move.
+        end_x (np.ndarray): Carriage position at the end of each move.
+        end_y (np.ndarray): Mandrel angle at the end of each move.
 
     Returns:
-        List[List[Dict[str, float]]]: List of line segments in screen-space coordinates.
+        Tuple[np.ndarray, np.ndarray]: The segments as an (n, 2, 2) array of
+            [[x0, y0], [x1, y1]] endpoints in travel order, and the index of the move each
+            segment belongs to.
+    """
+    start_x, start_y, end_x, end_y = (
+        np.asarray(values, dtype=np.float64) for values in (start_x, start_y, end_x, end_y)
+    )
+
+    # Seams strictly between the ends of each move, as multiples of 360
+    lowest_turn = np.floor(np.minimum(start_y, end_y) / 360)
+    highest_turn = np.ceil(np.maximum(start_y, end_y) / 360)
+    num_seams = np.maximum(highest_turn - lowest_turn - 1, 0).astype(np.int64)
+
+    # Each move contributes its start point, its seams in travel order, and its end point
+    num_points = num_seams + 2
+    move_of_point = np.repeat(np.arange(len(start_y)), num_points)
+    point_index = np.arange(len(move_of_point)) - np.repeat(np.cumsum(num_points) - num_points, num_points)
+
+    is_increasing = (end_y > start_y)[move_of_point]
+    seam_turn = np.where(
+        is_increasing,
+        lowest_turn[move_of_point] + point_index,
+        highest_turn[move_of_point] - point_index,
+    )
+    point_y = seam_turn * 360
+    is_start = point_index == 0
+    is_end = point_index == num_points[move_of_point] - 1
+    point_y = np.where(is_start, start_y[move_of_point], point_y)
+    point_y = np.where(is_end, end_y[move_of_point], point_y)
+
+    move_y = (end_y - start_y)[move_of_point]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fractions = np.where(move_y != 0, (point_y - start_y[move_of_point]) / move_y, 0)
+    point_x = start_x[move_of_point] + fractions * (end_x - start_x)[move_of_point]
+    point_x = np.where(is_end, end_x[move_of_point], point_x)
+
+    # Pair every point with the next one of the same move
+    segment_starts = np.flatnonzero(~is_end)
+    segments = np.empty((len(segment_starts), 2, 2))
+    segments[:, 0, 0] = point_x[segment_starts]
+    segments[:, 1, 0] = point_x[segment_starts + 1]
+
+    # Draw each piece in the turn its midpoint falls in
+    first_y = point_y[segment_starts]
+    second_y = point_y[segment_starts + 1]
+    turn_offsets = np.floor((first_y + second_y) / 2 / 360) * 360
+    segments[:, 0, 1] = first_y - turn_offsets
+    segments[:, 1, 1] = second_y - turn_offsets
+
+    return segments, move_of_point[segment_starts]
+
+
+def join_segments(segments: np.ndarray) -> List[List[float]]:
     """
-    # Are both endpoints in the same modulo? If so, mod360 and return
-    if int(start["y"] // 360) == int(end["y"] // 360):
-        return [[
-            {"x": start["x"], "y": start["y"] % 360},
-            {"x": end["x"], "y": end["y"] % 360},
-        ]]
+    Chain consecutive segments that share an endpoint into polylines.
+
+    Args:
+        segments (np.ndarray): An (n, 2, 2) array of segment endpoints, as from `split_wraps`.
 
-    # If not, calculate the intersection point between the ray and the relevant edge
-    slope = (end["y"] - start["y"]) / (end["x"] - start["x"])
+    Returns:
+        List[List[float]]: One flat [x0, y0, x1, y1, ...] point list per polyline, in order.
+    """
+    if len(segments) == 0:
+        return []
 
-    current_segment_end_y = 0
-    next_segment_start_y = 360 * (start["y"] // 360)
-    next_segment_start_y_adj = -0.001  # TODO: Refactor to avoid edge-case adjustment
+    # A new polyline starts wherever a segment does not begin where the previous one ended
+    is_break = np.any(segments[1:, 0] != segments[:-1, 1], axis=1)
+    run_starts = np.concatenate(([0], np.flatnonzero(is_break) + 1))
+    run_ends = np.append(run_starts[1:], len(segments))
 
-    if end["y"] > start["y"]:
-        current_segment_end_y = 360
-        next_segment_start_y = 360 * ((start["y"] // 360) + 1)
-        next_segment_start_y_adj = 0.001
+    polylines = []
+    for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+        points = np.vstack((segments[run_start, 0], segments[run_start:run_end, 1]))
+        polylines.append(points.ravel().tolist())
+    return polylines
 
-    current_segment_end_x = start["x"] + ((next_segment_start_y - start["y"]) * (1 / slope))
 
+def generate_coordinates(start: Dict[str, float], end: Dict[str, float]) -> List[List[Dict[str, float]]]:
+    """
+    Turn two machine coordinate endpoints into a set of screen-space line segments.
+
+    Args:
+        start (Dict[str, float]): Starting point with 'x' and 'y' coordinates.
+        end (Dict[str, float]): Ending point with 'x' and 'y' coordinates.
+
+    Returns:
+        List[List[Dict[str, float]]]: List of line segments in screen-space coordinates.
+    """
+    segments, _ = split_wraps([start["x"]], [start["y"]], [end["x"]], [end["y"]])
     return [
-        [
-            {"x": start["x"], "y": start["y"] % 360},
-            {"x": current_segment_end_x, "y": current_segment_end_y},
-        ]
-    ] + generate_coordinates(
-        {"x": current_segment_end_x, "y": next_segment_start_y + next_segment_start_y_adj},
-        end,
-    )
+        [{"x": x, "y": y} for x, y in segment]
+        for segment in segments.tolist()
+    ]
@@ -0,0 +1,263 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import hashlib
+import math
+import os
+import numpy as np
+from PIL import Image, ImageDraw
+from .plot import (
+    TOW_INNER_COLOR,
+    TOW_INNER_WIDTH_FRACTION,
+    TOW_OUTER_COLOR,
+    WindParameters,
+    toolpath_segments,
+)
+from .plot_helpers import join_segments
+from planner.toolpath import Toolpath
+
+
+class TilePyramid:
+    """
+    Multi-resolution tiles of a toolpath plot, for previewing and zooming long mandrels.
+
+    Zoom 0 fits the whole plot in one tile, and every zoom level doubles the resolution up to
+    `max_zoom`, which draws `pixels_per_mm` along the mandrel and `pixels_per_degree` around
+    it. Tiles are square, `tile_size` pixels on a side, and addressed by (zoom, column, row)
+    from the top left. At one pixel per mm and per degree the full resolution level matches
+    `plot_toolpath`.
+
+    Rendered tiles are kept as PNG bytes in a small in-memory cache, and in `cache_dir` when
+    one is given. Cached tiles are keyed by a hash of the segments and render settings, so a
+    changed toolpath never reuses stale tiles.
+    """
+
+    def __init__(
+        self,
+        segments: np.ndarray,
+        wind_length_mm: float,
+        tow_width_mm: float,
+        pixels_per_mm: float = 1.0,
+        pixels_per_degree: Optional[float] = None,
+        tile_size: int = 256,
+        cache_dir: Optional[Path] = None,
+        memory_cache_tiles: int = 256,
+    ):
+        self.segments = segments
+        self.tow_width_mm = tow_width_mm
+        self.pixels_per_mm = pixels_per_mm
+        self.pixels_per_degree = pixels_per_mm if pixels_per_degree is None else pixels_per_degree
+        self.tile_size = tile_size
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.memory_cache_tiles = memory_cache_tiles
+        self._memory_cache: "OrderedDict[Tuple[int, int, int], bytes]" = OrderedDict()
+
+        self.width_px = max(math.ceil(wind_length_mm * self.pixels_per_mm), 1)
+        self.height_px = max(math.ceil(360 * self.pixels_per_degree), 1)
+        self.max_zoom = max(math.ceil(math.log2(max(self.width_px, self.height_px) / tile_size)), 0)
+
+        # Segments sorted by their left edge, so a tile only looks at a narrow band of them
+        x = segments[:, :, 0]
+        y = segments[:, :, 1]
+        self._min_x, self._max_x = x.min(axis=1), x.max(axis=1)
+        self._min_y, self._max_y = y.min(axis=1), y.max(axis=1)
+        self._order = np.argsort(self._min_x, kind="stable")
+        self._sorted_min_x = self._min_x[self._order]
+        self._max_width_mm = float((self._max_x - self._min_x).max()) if len(segments) else 0.0
+
+        settings = f"{self.pixels_per_mm},{self.pixels_per_degree},{tile_size},{tow_width_mm},{self.width_px}"
+        self.content_key = hashlib.sha256(segments.tobytes() + settings.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_toolpath(
+        cls, toolpath: Toolpath, winding_parameters: WindParameters, **kwargs
+    ) -> "TilePyramid":
+        return cls(
+            toolpath_segments(toolpath),
+            winding_parameters.mandrel["windLength"],
+            winding_parameters.tow["width"],
+            **kwargs,
+        )
+
+    def scale(self, zoom: int) -> Tuple[float, float]:
+        """
+        Pixels per mm and per degree at a zoom level.
+        """
+        factor = 2.0 ** (zoom - self.max_zoom)
+        return self.pixels_per_mm * factor, self.pixels_per_degree * factor
+
+    def grid_size(self, zoom: int) -> Tuple[int, int]:
+        """
+        Number of tile columns and rows at a zoom level.
+        """
+        factor = 2.0 ** (zoom - self.max_zoom)
+        return (
+            max(math.ceil(self.width_px * factor / self.tile_size), 1),
+            max(math.ceil(self.height_px * factor / self.tile_size), 1),
+        )
+
+    def tiles(self, zoom: int) -> List[Tuple[int, int, int]]:
+        columns, rows = self.grid_size(zoom)
+        return [(zoom, column, row) for row in range(rows) for column in range(columns)]
+
+    def _cache_path(self, zoom: int, column: int, row: int) -> Path:
+        return self.cache_dir / self.content_key / str(zoom) / f"{column}_{row}.png"
+
+    def _remember(self, tile: Tuple[int, int, int], png: bytes) -> None:
+        self._memory_cache[tile] = png
+        self._memory_cache.move_to_end(tile)
+        while len(self._memory_cache) > self.memory_cache_tiles:
+            self._memory_cache.popitem(last=False)
+
+    def cached_tile(self, zoom: int, column: int, row: int) -> Optional[bytes]:
+        tile = (zoom, column, row)
+        if tile in self._memory_cache:
+            self._memory_cache.move_to_end(tile)
+            return self._memory_cache[tile]
+
+        if self.cache_dir is not None:
+            path = self._cache_path(zoom, column, row)
+            if path.exists():
+                png = path.read_bytes()
+                self._remember(tile, png)
+                return png
+        return None
+
+    def store_tile(self, zoom: int, column: int, row: int, png: bytes) -> None:
+        self._remember((zoom, column, row), png)
+        if self.cache_dir is not None:
+            path = self._cache_path(zoom, column, row)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+            temporary_path.write_bytes(png)
+            os.replace(temporary_path, path)
+
+    def get_tile(self, zoom: int, column: int, row: int) -> bytes:
+        """
+        PNG bytes of one tile, from the cache when it has been rendered before.
+        """
+        png = self.cached_tile(zoom, column, row)
+        if png is None:
+            png = self.render_tile(zoom, column, row)
+            self.store_tile(zoom, column, row, png)
+        return png
+
+    def render_tile(self, zoom: int, column: int, row: int) -> bytes:
+        """
+        Draw one tile, without touching the cache.
+        """
+        scale_x, scale_y = self.scale(zoom)
+        outer_width = max(int(self.tow_width_mm * scale_x), 1)
+        inner_width = max(int(self.tow_width_mm * TOW_INNER_WIDTH_FRACTION * scale_x), 1)
+
+        # The tile's extent in mm and degrees, grown by the stroke so edge lines are not cut
+        margin_px = outer_width / 2 + 1
+        left = (column * self.tile_size - margin_px) / scale_x
+        right = ((column + 1) * self.tile_size + margin_px) / scale_x
+        top = (row * self.tile_size - margin_px) / scale_y
+        bottom = ((row + 1) * self.tile_size + margin_px) / scale_y
+
+        first = np.searchsorted(self._sorted_min_x, left - self._max_width_mm, side="left")
+        last = np.searchsorted(self._sorted_min_x, right, side="right")
+        candidates = self._order[first:last]
+        visible = (
+            (self._max_x[candidates] >= left)
+            & (self._min_y[candidates] <= bottom)
+            & (self._max_y[candidates] >= top)
+        )
+        # Back in travel order, so the strokes stack as they do in the full plot
+        visible_segments = np.sort(candidates[visible])
+
+        tile_segments = self.segments[visible_segments].copy()
+        tile_segments[:, :, 0] = tile_segments[:, :, 0] * scale_x - column * self.tile_size
+        tile_segments[:, :, 1] = tile_segments[:, :, 1] * scale_y - row * self.tile_size
+
+        canvas = Image.new("RGB", (self.tile_size, self.tile_size), "white")
+        draw = ImageDraw.Draw(canvas)
+        for polyline in join_segments(tile_segments):
+            draw.line(polyline, fill=TOW_OUTER_COLOR, width=outer_width)
+            # Once zoomed out far enough both strokes are a pixel wide, so only the outer shows
+            if inner_width < outer_width:
+                draw.line(polyline, fill=TOW_INNER_COLOR, width=inner_width)
+
+        output_stream = BytesIO()
+        canvas.save(output_stream, format="PNG")
+        return output_stream.getvalue()
+
+    def render_levels(
+        self, max_zoom: Optional[int] = None, jobs: int = 1
+    ) -> Iterator[Tuple[int, int, int, bytes]]:
+        """
+        Render every tile from the overview down to `max_zoom`, coarsest level first.
+
+        Tiles missing from the cache are rendered in `jobs` worker processes (0 uses every
+        core). Yields (zoom, column, row, png) as each level completes.
+        """
+        max_zoom = self.max_zoom if max_zoom is None else min(max_zoom, self.max_zoom)
+        if jobs <= 0:
+            jobs = os.cpu_count() or 1
+
+        executor = None
+        try:
+            for zoom in range(max_zoom + 1):
+                tiles = self.tiles(zoom)
+                pngs = [self.cached_tile(*tile) for tile in tiles]
+                missing_tiles = [tile for tile, png in zip(tiles, pngs) if png is None]
+
+                if len(missing_tiles) > 1 and jobs > 1 and executor is None:
+                    executor = ProcessPoolExecutor(
+                        max_workers=jobs, initializer=_set_worker_pyramid, initargs=(self,)
+                    )
+                if executor is not None:
+                    rendered = executor.map(_render_worker_tile, missing_tiles)
+                else:
+                    rendered = (self.render_tile(*tile) for tile in missing_tiles)
+                rendered_pngs = dict(zip(missing_tiles, rendered))
+
+                for tile, png in zip(tiles, pngs):
+                    if png is None:
+                        png = rendered_pngs[tile]
+                        self.store_tile(*tile, png)
+                    yield (*tile, png)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def __getstate__(self):
+        # Workers only render, so they do not need the parent's cached tiles
+        state = dict(self.__dict__)
+        state["_memory_cache"] = OrderedDict()
+        return state
+
+
+# The pyramid each worker process renders from, sent once when the worker starts
+_worker_pyramid: Optional[TilePyramid] = None
+
+
+def _set_worker_pyramid(pyramid: TilePyramid) -> None:
+    global _worker_pyramid
+    _worker_pyramid = pyramid
+
+
+def _render_worker_tile(tile: Tuple[int, int, int]) -> bytes:
+    return _worker_pyramid.render_tile(*tile)
+
+
+def write_tile_pyramid(
+    pyramid: TilePyramid, output_dir: Path, max_zoom: Optional[int] = None, jobs: int = 1
+) -> int:
+    """
+    Write a pyramid as output_dir/{zoom}/{column}_{row}.png, coarsest level first.
+
+    Returns the number of tiles written.
+    """
+    output_dir = Path(output_dir)
+    num_tiles = 0
+    for zoom, column, row, png in pyramid.render_levels(max_zoom, jobs):
+        path = output_dir / str(zoom) / f"{column}_{row}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(png)
+        num_tiles += 1
+    return num_tiles
@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Union
+from gcode_format import format_number
+
+JOURNAL_SUFFIX = ".journal"
+
+# Moves Marlin may have acknowledged but not yet run when it stops, one full planner buffer.
+# Checkpoints this close to the last acknowledged command are not trusted as completed.
+UNEXECUTED_COMMANDS = 16
+
+# Checkpoints kept in memory, comfortably more than fit in the sender's queue
+CHECKPOINT_HISTORY = 4096
+
+
+class ProgramCheckpoint:
+    """
+    A point in a program where a run can start again, with the modal state in effect there.
+    """
+
+    def __init__(
+        self,
+        command_index: int,
+        source_line: int,
+        label: str,
+        position: List[float],
+        feed_rate: Optional[float],
+    ):
+        # Commands, comments and blank lines excluded, before the checkpoint
+        self.command_index = command_index
+        # 1-based line of the program the next command is on
+        self.source_line = source_line
+        self.label = label
+        # Where the machine is at the checkpoint, in the coordinates the last G92 set up
+        self.position = position
+        self.feed_rate = feed_rate
+
+    def preamble(self) -> List[str]:
+        """
+        Commands that restore the checkpoint's modal state on a machine standing at its position.
+        """
+        x, y, z = (format_number(value) for value in self.position)
+        commands = [f"G92 X{x} Y{y} Z{z}"]
+        if self.feed_rate is not None:
+            commands.append(f"G0 F{format_number(self.feed_rate)}")
+        return commands
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "command_index": self.command_index,
+            "source_line": self.source_line,
+            "label": self.label,
+            "position": self.position,
+            "feed_rate": self.feed_rate,
+        }
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "ProgramCheckpoint":
+        return cls(**values)
+
+
+class CheckpointTracker:
+    """
+    Follows a program's modal state as its commands are read, noting checkpoints on the way.
+
+    Iterating yields the program's commands, without comments or blank lines, like
+    `gcode_parser.strip_comments`. Each layer starts a checkpoint, named by its "; Layer"
+    comment, and so does every pass: wherever the carriage turns around.
+
+    With a `start_index`, the commands before it are read only for their modal state, and the
+    checkpoint's preamble is yielded in their place. `on_layer` is called with each "; Layer"
+    comment's text as the layer's commands start to be read, skipping layers before the start.
+    """
+
+    def __init__(
+        self,
+        lines: Iterable[str],
+        start_index: int = 0,
+        on_layer: Optional[Callable[[str], None]] = None,
+    ):
+        self.lines = lines
+        self.start_index = start_index
+        self.on_layer = on_layer
+        self.position = [0.0, 0.0, 0.0]
+        self.feed_rate: Optional[float] = None
+        # Commands yielded ahead of the program's own, when starting from a checkpoint
+        self.preamble_length = 0
+        self.start_checkpoint: Optional[ProgramCheckpoint] = None
+
+        self._checkpoints: Deque[ProgramCheckpoint] = deque(maxlen=CHECKPOINT_HISTORY)
+        # Iteration runs in the feeding thread and lookups in the sender's
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[str]:
+        command_index = 0
+        layer_label: Optional[str] = None
+        is_layer_start = False
+        pass_number = 0
+        carriage_direction = 0
+
+        for source_line, line in enumerate(self.lines, start=1):
+            command, _, comment = line.partition(";")
+            command = command.strip()
+            if comment.strip().startswith("Layer "):
+                layer_label = comment.strip()
+                is_layer_start = True
+                pass_number = 0
+                carriage_direction = 0
+                if self.on_layer is not None and command_index >= self.start_index:
+                    self.on_layer(layer_label)
+            if not command:
+                continue
+
+            words = command.split()
+            code = words[0].upper()
+            target = list(self.position)
+            feed_rate = self.feed_rate
+            # Only motion and G92 set the modal state, and other commands' words need not be
+            # numbers, as in "M117 X axis homed"
+            for word in words[1:] if code in ("G0", "G1", "G92") else ():
+                try:
+                    value = float(word[1:])
+                except ValueError:
+                    continue
+                letter = word[0].upper()
+                if letter in "XYZ":
+                    target["XYZ".index(letter)] = value
+                elif letter == "F" and code != "G92":
+                    feed_rate = value
+
+            if is_layer_start:
+                self._add_checkpoint(command_index, source_line, layer_label)
+                is_layer_start = False
+            if code in ("G0", "G1"):
+                direction = (target[0] > self.position[0]) - (target[0] < self.position[0])
+                if direction != 0 and carriage_direction != 0 and direction != carriage_direction:
+                    pass_number += 1
+                    self._add_checkpoint(
+                        command_index, source_line, f"{layer_label or 'Program'}, pass {pass_number + 1}"
+                    )
+                if direction != 0:
+                    carriage_direction = direction
+
+            if command_index == self.start_index and self.start_index > 0:
+                self.start_checkpoint = ProgramCheckpoint(
+                    command_index, source_line, "Start", list(self.position), self.feed_rate
+                )
+                preamble = self.start_checkpoint.preamble()
+                self.preamble_length = len(preamble)
+                yield from preamble
+
+            if code in ("G0", "G1", "G92"):
+                self.position = target
+            self.feed_rate = feed_rate
+            if command_index >= self.start_index:
+                yield command
+            command_index += 1
+
+    def _add_checkpoint(self, command_index: int, source_line: int, label: str):
+        checkpoint = ProgramCheckpoint(command_index, source_line, label, list(self.position), self.feed_rate)
+        with self._lock:
+            # A layer's first pass starts where the layer does, and keeps the layer's name
+            if self._checkpoints and self._checkpoints[-1].command_index == command_index:
+                return
+            self._checkpoints.append(checkpoint)
+
+    def program_index(self, commands_completed: int) -> int:
+        """
+        Program commands completed, given how many commands yielded the machine has accepted.
+        """
+        return self.start_index + max(commands_completed - self.preamble_length, 0)
+
+    def latest_checkpoint(self, commands_completed: int) -> Optional[ProgramCheckpoint]:
+        """
+        The last checkpoint the machine has surely run past, or None if there is none yet.
+        """
+        if commands_completed <= self.preamble_length:
+            return None
+        completed_index = self.program_index(commands_completed) - UNEXECUTED_COMMANDS
+        with self._lock:
+            for checkpoint in reversed(self._checkpoints):
+                if checkpoint.command_index <= completed_index:
+                    return checkpoint
+        return None
+
+
+def program_identity(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    What a journal remembers about its program, to refuse resuming a different one.
+    """
+    status = os.stat(path)
+    return {"program": str(Path(path).resolve()), "size": status.st_size, "mtime": status.st_mtime}
+
+
+class RunJournal:
+    """
+    Durable record of how far a run got, written as a sender metrics sink.
+
+    Every snapshot appends a JSON line with the program commands completed and the latest
+    checkpoint the machine has surely run past, and is synced to disk before the next.
+    """
+
+    def __init__(self, path: Union[str, Path], program_path: Union[str, Path], tracker: CheckpointTracker):
+        self.path = Path(path)
+        self.tracker = tracker
+        self._checkpoint: Optional[ProgramCheckpoint] = None
+        self._file = open(self.path, "a")
+        self._append({"started": time.time(), "start_index": tracker.start_index, **program_identity(program_path)})
+
+    def _append(self, entry: Dict[str, Any]):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def write(self, snapshot: Dict[str, Any]):
+        checkpoint = self.tracker.latest_checkpoint(snapshot["commands_completed"])
+        if checkpoint is not None:
+            self._checkpoint = checkpoint
+        self._append({
+            "time": snapshot["timestamp"],
+            "commands_completed": self.tracker.program_index(snapshot["commands_completed"]),
+            "checkpoint": None if self._checkpoint is None else self._checkpoint.to_dict(),
+        })
+
+    def finish(self):
+        """
+        Mark the run as having sent its whole program, so that it is not resumed.
+        """
+        self._append({"finished": time.time()})
+
+    def close(self):
+        self._file.close()
+
+
+def read_resume_checkpoint(
+    journal_path: Union[str, Path], program_path: Union[str, Path]
+) -> Optional[ProgramCheckpoint]:
+    """
+    The checkpoint the last run in a journal got to, or None if it got to none.
+
+    A run started from the beginning forgets the checkpoints of the runs before it, and one
+    resumed carries on from theirs.
+
+    Raises:
+        ValueError: If the journal is for another program, the program changed since, or the
+            last run finished it.
+    """
+    identity = None
+    checkpoint = None
+    is_finished = False
+    with open(journal_path, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short when the host went down
+                continue
+            if "started" in entry:
+                identity = {key: entry[key] for key in ("program", "size", "mtime")}
+                is_finished = False
+                if entry.get("start_index", 0) == 0:
+                    checkpoint = None
+            elif "finished" in entry:
+                is_finished = True
+            elif entry.get("checkpoint") is not None:
+                checkpoint = ProgramCheckpoint.from_dict(entry["checkpoint"])
+
+    if identity != program_identity(program_path):
+        raise ValueError(f"'{journal_path}' is not a journal of '{program_path}' as it is now")
+    if is_finished:
+        raise ValueError(f"the last run in '{journal_path}' finished '{program_path}'")
+    return checkpoint
@@ -0,0 +1,185 @@
+import bisect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+# Upper bounds of the latency histogram's buckets in seconds, roughly logarithmic from a fast
+# serial round trip up to a long move blocking a full planner buffer. The last bucket is open.
+LATENCY_BUCKETS_S = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+
+
+class LatencyHistogram:
+    """
+    Counts of latencies in fixed buckets, with their count, sum and extremes.
+
+    Quantiles are estimated as the upper bound of the bucket they fall in, or the largest
+    latency seen if that is lower, so they are never below the true value and never above it
+    by more than one bucket.
+    """
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS_S):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum_s = 0.0
+        self.min_s: Optional[float] = None
+        self.max_s: Optional[float] = None
+
+    def add(self, latency_s: float):
+        self.counts[bisect.bisect_left(self.bounds, latency_s)] += 1
+        self.count += 1
+        self.sum_s += latency_s
+        self.min_s = latency_s if self.min_s is None else min(self.min_s, latency_s)
+        self.max_s = latency_s if self.max_s is None else max(self.max_s, latency_s)
+
+    @property
+    def mean_s(self) -> float:
+        return self.sum_s / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                # No latency was above the largest seen, whatever the bucket's bound
+                return min(self.bounds[index], self.max_s) if index < len(self.bounds) else self.max_s
+        return self.max_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_s": self.mean_s,
+            "min_s": self.min_s,
+            "max_s": self.max_s,
+            "p50_s": self.quantile(0.5),
+            "p90_s": self.quantile(0.9),
+            "p99_s": self.quantile(0.99),
+            "buckets": [
+                [bound, count] for bound, count in zip(list(self.bounds) + ["+Inf"], self.counts)
+            ],
+        }
+
+
+class JsonLinesMetricsFile:
+    """
+    Appends every metrics snapshot to a file as one line of JSON.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = open(self.path, "a")
+
+    def write(self, snapshot: Dict[str, Any]):
+        self._file.write(json.dumps(snapshot) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class MetricsEndpoint:
+    """
+    Serves the latest metrics snapshot over HTTP on the local machine.
+
+    "/metrics" has the Prometheus text format, and any other path the snapshot as JSON.
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1"):
+        self.latest: Dict[str, Any] = {}
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = prometheus_text(endpoint.latest).encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                else:
+                    body = json.dumps(endpoint.latest).encode("utf-8")
+                    content_type = "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Scrapes are not worth a line on the console each
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def write(self, snapshot: Dict[str, Any]):
+        self.latest = snapshot
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def prometheus_text(snapshot: Dict[str, Any]) -> str:
+    """
+    Render a metrics snapshot in the Prometheus text exposition format.
+
+    Numeric fields become gauges named "winder_sender_<field>", and the latency histogram a
+    histogram named "winder_sender_ack_latency_seconds".
+    """
+    lines = []
+    for name, value in snapshot.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE winder_sender_{name} gauge")
+        lines.append(f"winder_sender_{name} {value}")
+
+    latency = snapshot.get("ack_latency")
+    if latency:
+        name = "winder_sender_ack_latency_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in latency["buckets"]:
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {latency['mean_s'] * latency['count']}")
+        lines.append(f"{name}_count {latency['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize_metrics(snapshot: Dict[str, Any]) -> List[str]:
+    """
+    Describe a job's final metrics snapshot in a few lines, ending with which side of the
+    serial link held the job back.
+    """
+    latency = snapshot["ack_latency"]
+    lines = [
+        f"Sent {snapshot['commands_acknowledged']} commands in {snapshot['elapsed_s']:.1f} seconds: "
+        f"{snapshot['commands_per_second']:.1f} commands/s, {snapshot['bytes_per_second']:.0f} bytes/s "
+        f"({snapshot['mode']})",
+        f"Send to 'ok' latency: mean {latency['mean_s'] * 1000:.1f} ms, p50 {latency['p50_s'] * 1000:.1f} ms, "
+        f"p90 {latency['p90_s'] * 1000:.1f} ms, p99 {latency['p99_s'] * 1000:.1f} ms, "
+        f"max {(latency['max_s'] or 0) * 1000:.1f} ms",
+        f"Commands in flight: mean {snapshot['mean_in_flight']:.2f}, max {snapshot['max_in_flight']}",
+        f"Busy for {snapshot['busy_s']:.1f} seconds, paused for {snapshot['paused_s']:.1f} seconds",
+        f"Marlin's queue ran empty {snapshot['marlin_drained_events']} times with commands waiting, "
+        f"the sender ran out of commands {snapshot['host_starved_events']} times",
+    ]
+    if snapshot["resent_lines"]:
+        lines.append(f"Resent {snapshot['resent_lines']} lines at Marlin's request")
+
+    # With the window full, a command's "ok" takes about as long as the commands ahead of it
+    # take to cross the link, unless Marlin is holding them back
+    acknowledged = max(snapshot["commands_acknowledged"], 1)
+    link_bound_latency_s = 2 * max(snapshot["mean_in_flight"], 1) * snapshot["wire_s_per_command"]
+    if snapshot["mode"] == "stop-and-wait":
+        lines.append("Bottleneck: stop-and-wait, every command waits a serial round trip")
+    elif snapshot["host_starved_events"] > 0.1 * acknowledged:
+        lines.append("Bottleneck: the host, which could not supply commands fast enough")
+    elif latency["mean_s"] > link_bound_latency_s:
+        lines.append("Bottleneck: the controller, which acknowledged commands slower than the link carried them")
+    else:
+        lines.append("Bottleneck: the serial link, Marlin acknowledged commands as fast as they arrived")
+    return lines
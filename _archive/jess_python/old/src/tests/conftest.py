@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules import each other from src, as they do when run from there
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
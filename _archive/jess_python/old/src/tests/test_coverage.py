@@ -0,0 +1,35 @@
+import io
+import json
+import os
+from contextlib import redirect_stdout
+from pathlib import Path
+from planner.cust_types import IMandrelParameters, ITowParameters
+from planner.planner import writeWind
+from plotter.coverage import CoverageSimulator
+
+BASE_WIND_PATH = Path(__file__).resolve().parent.parent / "input.json"
+
+
+def simulate(wind):
+    simulator = CoverageSimulator(
+        IMandrelParameters(**wind["mandrelParameters"]),
+        ITowParameters(**wind["towParameters"]),
+        axial_resolution_mm=2,
+        angular_resolution_degrees=2,
+    )
+    with open(os.devnull, "w") as sink, redirect_stdout(io.StringIO()):
+        writeWind(wind, sink, layerCallback=simulator.add_toolpath)
+    return simulator.layers
+
+
+def test_hoop_layers_cover_the_mandrel_with_their_plies():
+    wind = json.loads(BASE_WIND_PATH.read_text())
+    wind["layers"] = [{"windType": "hoop", "terminal": False}, {"windType": "hoop", "terminal": True}]
+    hoop, terminal_hoop = simulate(wind)
+
+    assert hoop.nominal_tow_count == 2
+    # A terminal hoop layer stops after its first pass, so lays a single ply
+    assert terminal_hoop.nominal_tow_count == 1
+    for layer in (hoop, terminal_hoop):
+        assert layer.coverage_fraction > 0.99
+        assert layer.overlap_fraction < 0.01
@@ -0,0 +1,46 @@
+from gcode_compact import GcodeCompactor
+
+
+def compact_all(commands, **options):
+    return list(GcodeCompactor(**options).compact_lines(commands))
+
+
+def test_moves_keep_only_what_changed():
+    assert compact_all(["G0 X1.00001 Y2 Z3 F6000", "G0 X1 Y2.5 Z3 F6000", "G0 X1 Y2.5 Z3"]) == [
+        "G0 X1 Y2 Z3 F6000",
+        "G0 Y2.5",
+        "G0",
+    ]
+    assert compact_all(["G0 X1 Y2 Z3", "G0 X1 Y2 Z3", "G1 X2"], drop_noops=True, modal=True) == [
+        "G0 X1 Y2 Z3",
+        "G1 X2",
+    ]
+
+
+def test_g92_with_axes_is_sent_and_followed():
+    assert compact_all(["G0 X5 Y5 Z0", "G92 X0.12345", "G0 X0.12345 Y5 Z0"]) == [
+        "G0 X5 Y5 Z0",
+        "G92 X0.12345",
+        "G0",
+    ]
+
+
+def test_commands_that_may_move_the_machine_forget_its_position():
+    for command in ["G92", "G28 X", "M400", "G92 E0"]:
+        assert compact_all(["G0 X5 Y5 F600", command, "G0 X5 Y5 F600"]) == [
+            "G0 X5 Y5 F600",
+            command,
+            "G0 X5 Y5 F600",
+        ]
+
+
+def test_relative_moves_are_sent_as_they_are():
+    assert compact_all(["G0 X1 Y1", "G91", "G0 X1", "G0 X1", "G90", "G0 X1 Y1", "G0 X1 Y1"]) == [
+        "G0 X1 Y1",
+        "G91",
+        "G0 X1",
+        "G0 X1",
+        "G90",
+        "G0 X1 Y1",
+        "G0",
+    ]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from gcode_format import ENumberStyle, format_g0_lines, format_number, format_numbers
+from helpers import strip_precision
+
+EDGE_VALUES = [
+    0.0, -0.0, 1.0, -1.0, 180, 0.5, 2.5, -2.5,
+    # Ties at the sixth place and just either side of them
+    1.0000005, 2.0000015, -3.0000025, 0.1234565, np.nextafter(1.0000005, 2), np.nextafter(1.0000005, 0),
+    # Small values that round to zero, some from below
+    1e-7, -1e-7, 4.9e-7, -4.9e-7, 5e-7, -5e-7,
+    # Small values repr writes in exponent notation
+    1e-5, -1e-5, 1.5e-5, 9.99e-5, 0.0001, 0.00012345,
+    # Large values, up to where the float spacing is coarser than the last digit
+    123456.789012, 1e9 + 0.1234565, 1e12, 1e15 + 0.5, 1e17, -1e17, 1.7976931348623157e308,
+]
+
+
+def reference(value: float, digits: int, style: ENumberStyle) -> str:
+    """
+    The text the planner wrote before the bulk formatter: strip_precision in an f-string, and
+    plain fixed-point formatting for the other styles.
+    """
+    if style == ENumberStyle.SHORTEST:
+        return f"{strip_precision(value, digits)}"
+    fixed = f"{value:.{digits}f}"
+    if style == ENumberStyle.FIXED:
+        return fixed
+    if "." in fixed:
+        fixed = fixed.rstrip("0").rstrip(".")
+    return "0" if fixed == "-0" else fixed
+
+
+def sample_values() -> np.ndarray:
+    random = np.random.default_rng(4)
+    return np.concatenate((
+        np.array(EDGE_VALUES, dtype=np.float64),
+        random.uniform(-1000, 1000, 2000),
+        random.uniform(-1, 1, 500) * 10.0 ** random.integers(-9, 16, 500),
+        # Exact ties at every number of places
+        random.integers(-10**6, 10**6, 500) / 10**6 + 5e-7,
+    ))
+
+
+@pytest.mark.parametrize("style", list(ENumberStyle))
+@pytest.mark.parametrize("digits", [0, 2, 3, 6])
+def test_format_number_matches_reference(style: ENumberStyle, digits: int):
+    for value in sample_values().tolist():
+        assert format_number(value, digits, style) == reference(value, digits, style), value
+
+
+@pytest.mark.parametrize("style", list(ENumberStyle))
+@pytest.mark.parametrize("digits", [0, 2, 3, 6])
+def test_format_numbers_matches_format_number(style: ENumberStyle, digits: int):
+    values = sample_values()
+    expected = [format_number(value, digits, style) for value in values.tolist()]
+    assert format_numbers(values, digits, style) == expected
+
+
+@pytest.mark.parametrize("style", list(ENumberStyle))
+def test_format_g0_lines_matches_old_lines(style: ENumberStyle):
+    values = sample_values()
+    x, y, z = values, np.roll(values, 1), np.roll(values, 2)
+    expected = [
+        f"G0 X{reference(a, 6, style)} Y{reference(b, 6, style)} Z{reference(c, 6, style)}"
+        for a, b, c in zip(x.tolist(), y.tolist(), z.tolist())
+    ]
+    assert format_g0_lines(x, y, z, 6, style) == expected
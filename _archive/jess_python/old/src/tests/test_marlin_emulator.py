@@ -0,0 +1,101 @@
+import time
+import pytest
+
+pytest.importorskip("pty")
+
+from marlin_emulator import MarlinEmulator, MarlinEmulatorThread
+from marlin_port import MarlinPort
+from sender_metrics import summarize_metrics
+
+# Commands the sender adds around a job: line number resets and the pause and resume
+SENDER_COMMANDS = ("M110 N0", "M0", "M108")
+
+
+def program(count: int):
+    return [f"G0 X{index} Y{index * 2} Z0" for index in range(1, count + 1)]
+
+
+def executed_program(emulator: MarlinEmulator):
+    return [command for command in emulator.executed_commands if command not in SENDER_COMMANDS]
+
+
+@pytest.fixture
+def connect():
+    """
+    Start an emulated Marlin and connect a `MarlinPort` to it, closing both afterwards.
+    """
+    opened = []
+
+    def connect(emulator: MarlinEmulator, **port_options) -> MarlinPort:
+        emulator_thread = MarlinEmulatorThread(emulator)
+        marlin = MarlinPort(emulator_thread.open(), **port_options)
+        opened.append((marlin, emulator_thread))
+        marlin.initialize()
+        return marlin
+
+    yield connect
+
+    for marlin, emulator_thread in opened:
+        marlin.reset()
+        emulator_thread.close()
+
+
+def test_stop_and_wait_runs_every_command_in_order(connect):
+    emulator = MarlinEmulator(time_scale=0, seed=1, record_commands=True)
+    marlin = connect(emulator)
+    commands = program(200)
+
+    assert marlin.send_lines(commands)
+    marlin.wait_until_done()
+
+    assert executed_program(emulator) == commands
+    snapshot = marlin.metrics_snapshot()
+    assert snapshot["mode"] == "stop-and-wait"
+    assert snapshot["commands_completed"] == len(commands)
+    assert snapshot["max_in_flight"] == 1
+
+
+def test_streaming_recovers_from_corrupted_lines(connect):
+    emulator = MarlinEmulator(time_scale=0, error_rate=0.05, seed=3, record_commands=True)
+    marlin = connect(emulator, streaming=True)
+    commands = program(1000)
+
+    # A generator, as run_gcode feeds it, so only part of the job is ever queued
+    assert marlin.send_lines(command for command in commands)
+    marlin.wait_until_done()
+
+    assert emulator.stats.injected_errors > 0
+    assert executed_program(emulator) == commands
+    snapshot = marlin.metrics_snapshot()
+    assert snapshot["resent_lines"] > 0
+    assert snapshot["commands_completed"] == len(commands)
+    assert snapshot["max_in_flight"] > 1
+    assert summarize_metrics(snapshot)[-1].startswith("Bottleneck:")
+
+
+def test_pause_holds_the_machine_until_resumed(connect):
+    # Moves take real time, so the job is still running when it is paused
+    emulator = MarlinEmulator(time_scale=0.02, block_buffer_size=2, seed=1, record_commands=True)
+    marlin = connect(emulator, streaming=True)
+    commands = program(300)
+    for command in commands:
+        marlin.queue_command(command)
+
+    time.sleep(0.3)
+    marlin.pause()
+    deadline = time.monotonic() + 10
+    while marlin.sender.state.value != "paused":
+        assert time.monotonic() < deadline, "the machine never paused"
+        time.sleep(0.02)
+
+    moves_when_paused = emulator.stats.moves_executed
+    time.sleep(0.3)
+    assert emulator.stats.moves_executed == moves_when_paused
+    assert moves_when_paused < len(commands)
+
+    marlin.resume()
+    marlin.wait_until_done()
+
+    assert emulator.stats.pauses == 1
+    assert executed_program(emulator) == commands
+    assert marlin.metrics_snapshot()["paused_s"] > 0
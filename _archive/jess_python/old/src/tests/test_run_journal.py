@@ -0,0 +1,86 @@
+import pytest
+from run_journal import CheckpointTracker, RunJournal, read_resume_checkpoint
+
+PROGRAM = [
+    "; Parameters {}",
+    "G0 F6000",
+    "; Layer 1 of 2: hoop",
+    "G0 X10 Y90 Z0",
+    "G0 X0 Y180 Z0",
+    "",
+    "; Layer 2 of 2: helical",
+    "G0 X20 Y270 Z45",
+    "G0 X5 Y360 Z0 ; back",
+]
+
+
+def test_tracker_yields_commands_without_comments():
+    tracker = CheckpointTracker(PROGRAM)
+    assert list(tracker) == ["G0 F6000", "G0 X10 Y90 Z0", "G0 X0 Y180 Z0", "G0 X20 Y270 Z45", "G0 X5 Y360 Z0"]
+    assert tracker.position == [5.0, 360.0, 0.0]
+    assert tracker.feed_rate == 6000.0
+
+
+def test_tracker_announces_layers_from_the_start():
+    layers = []
+    list(CheckpointTracker(PROGRAM, on_layer=layers.append))
+    assert layers == ["Layer 1 of 2: hoop", "Layer 2 of 2: helical"]
+
+    layers = []
+    commands = list(CheckpointTracker(PROGRAM, start_index=3, on_layer=layers.append))
+    assert layers == ["Layer 2 of 2: helical"]
+    assert commands == ["G92 X0.0 Y180.0 Z0.0", "G0 F6000.0", "G0 X20 Y270 Z45", "G0 X5 Y360 Z0"]
+
+
+def test_tracker_reads_only_motion_for_the_modal_state():
+    tracker = CheckpointTracker(["G0 X1 Y2 Z3 F600", "M117 X axis homed", "G4 P500", "M400", "G1 X4"])
+    assert list(tracker) == ["G0 X1 Y2 Z3 F600", "M117 X axis homed", "G4 P500", "M400", "G1 X4"]
+    assert tracker.position == [4.0, 2.0, 3.0]
+    assert tracker.feed_rate == 600.0
+
+
+def journal_run(journal_path, program_path, start_index, commands_completed, is_finished=False):
+    tracker = CheckpointTracker(program_path.read_text().split("\n"), start_index)
+    list(tracker)
+    journal = RunJournal(journal_path, program_path, tracker)
+    journal.write({"timestamp": 0.0, "commands_completed": commands_completed})
+    if is_finished:
+        journal.finish()
+    journal.close()
+
+
+@pytest.fixture
+def long_program(tmp_path):
+    # Enough commands per layer that checkpoints clear the moves Marlin may not have run yet
+    lines = []
+    for layer in range(3):
+        lines.append(f"; Layer {layer + 1} of 3: hoop")
+        lines += [f"G0 X{index % 2 * 10} Y{index * 10} Z0" for index in range(40)]
+    program_path = tmp_path / "wind.gcode"
+    program_path.write_text("\n".join(lines))
+    return program_path
+
+
+def test_resume_starts_from_the_last_runs_checkpoint(tmp_path, long_program):
+    journal_path = tmp_path / "wind.gcode.journal"
+    journal_run(journal_path, long_program, 0, 60)
+    checkpoint = read_resume_checkpoint(journal_path, long_program)
+    assert checkpoint.label.startswith("Layer 2 of 3")
+
+    # A resumed run carries on from the checkpoint it was resumed from
+    journal_run(journal_path, long_program, checkpoint.command_index, 0)
+    assert read_resume_checkpoint(journal_path, long_program).to_dict() == checkpoint.to_dict()
+
+    # A new run from the beginning forgets the old run's checkpoints
+    journal_run(journal_path, long_program, 0, 5)
+    assert read_resume_checkpoint(journal_path, long_program) is None
+
+
+def test_finished_run_is_not_resumed(tmp_path, long_program):
+    journal_path = tmp_path / "wind.gcode.journal"
+    journal_run(journal_path, long_program, 0, 120, is_finished=True)
+    with pytest.raises(ValueError, match="finished"):
+        read_resume_checkpoint(journal_path, long_program)
+
+    journal_run(journal_path, long_program, 0, 50)
+    assert read_resume_checkpoint(journal_path, long_program) is not None
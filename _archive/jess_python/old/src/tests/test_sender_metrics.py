@@ -0,0 +1,22 @@
+import random
+from sender_metrics import LatencyHistogram
+
+
+def test_quantiles_never_exceed_the_largest_latency():
+    histogram = LatencyHistogram()
+    for latency_s in (0.011, 0.012, 0.013):
+        histogram.add(latency_s)
+    assert histogram.quantile(0.5) == histogram.quantile(0.99) == histogram.max_s == 0.013
+
+
+def test_quantiles_are_ordered_and_bound_the_true_values():
+    rng = random.Random(1)
+    latencies = sorted(rng.lognormvariate(-4, 1) for _ in range(1000))
+    histogram = LatencyHistogram()
+    for latency_s in latencies:
+        histogram.add(latency_s)
+
+    p50, p90, p99 = (histogram.quantile(q) for q in (0.5, 0.9, 0.99))
+    assert histogram.min_s <= p50 <= p90 <= p99 <= histogram.max_s
+    for q, estimate in ((0.5, p50), (0.9, p90), (0.99, p99)):
+        assert estimate >= latencies[int(q * len(latencies)) - 1]
@@ -0,0 +1,20 @@
+import pytest
+from planner.sweep import parseSweepValues
+
+
+def test_ranges_include_the_stop_value():
+    assert parseSweepValues("1:3:1") == [1, 2, 3]
+    assert parseSweepValues("50:51:0.5") == [50, 50.5, 51]
+    assert parseSweepValues("30, 45") == [30, 45]
+
+
+def test_integer_fields_are_parsed_as_ints():
+    values = parseSweepValues("2.0,3", integer=True)
+    assert values == [2, 3]
+    assert all(isinstance(value, int) for value in values)
+
+
+@pytest.mark.parametrize("spec", ["2.5", "1:3:0.5"])
+def test_integer_fields_reject_fractions(spec: str):
+    with pytest.raises(ValueError, match="whole numbers"):
+        parseSweepValues(spec, integer=True)
@@ -0,0 +1,230 @@
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Union
+import json
+import struct
+import numpy as np
+from gcode_parser import ParsedGcode, parse_gcode_file
+from planner.toolpath import Toolpath
+
+# A binary toolpath file is laid out as
+#
+#   prefix    magic, format version, header length, row count, trailer offset and length
+#   header    JSON wind parameters, padded with spaces to a multiple of 8 bytes
+#   records   one packed TOOLPATH_RECORD_DTYPE record per toolpath row
+#   trailer   JSON comment and raw text by row, feed rate changes and start position
+#
+# The prefix is rewritten when the file is closed, so rows can be appended as they are
+# planned without knowing how many there will be.
+TOOLPATH_FILE_MAGIC = b"FWTOOLP\x00"
+TOOLPATH_FILE_VERSION = 1
+TOOLPATH_FILE_SUFFIX = ".fwtp"
+
+_PREFIX = struct.Struct("<8sIIQQQ")
+
+# The feed rate only changes at a few rows, so it lives in the trailer instead of every record
+TOOLPATH_RECORD_DTYPE = np.dtype([
+    ("opcode", "u1"),
+    ("flags", "u1"),
+    ("x", "<f8"),
+    ("y", "<f8"),
+    ("z", "<f8"),
+])
+
+
+class ToolpathFile:
+    def __init__(self, toolpath: Toolpath, header: Optional[Dict[str, Any]]):
+        self.toolpath = toolpath
+        # The wind parameters, as in the "; Parameters {...}" line of the G-code
+        self.header = header
+
+    @property
+    def num_lines(self) -> int:
+        # Every row is one line of G-code
+        return len(self.toolpath)
+
+
+class ToolpathFileWriter:
+    """
+    Writes toolpaths to a binary toolpath file, one after another, as one long toolpath.
+
+    Use as a context manager, or call `close` to finish the file.
+    """
+
+    def __init__(self, path: Union[str, Path], header: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.num_rows = 0
+        self._text: Dict[str, str] = {}
+        self._feed_changes: List[List[float]] = []
+        self._feed_rate: Optional[float] = None
+        self._start_position: Optional[List[float]] = None
+
+        header_json = json.dumps(header).encode("utf-8")
+        header_json += b" " * (-len(header_json) % 8)
+        self._header_length = len(header_json)
+
+        self._file = open(self.path, "wb")
+        self._file.write(_PREFIX.pack(TOOLPATH_FILE_MAGIC, TOOLPATH_FILE_VERSION, 0, 0, 0, 0))
+        self._file.write(header_json)
+
+    def __enter__(self) -> "ToolpathFileWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def append(self, toolpath: Toolpath) -> None:
+        if self._start_position is None:
+            self._start_position = list(toolpath.start_position)
+
+        count = len(toolpath)
+        records = np.empty(count, dtype=TOOLPATH_RECORD_DTYPE)
+        records["opcode"] = toolpath.opcodes
+        records["flags"] = toolpath.flags
+        records["x"] = toolpath.x
+        records["y"] = toolpath.y
+        records["z"] = toolpath.z
+        records.tofile(self._file)
+
+        for row, text in toolpath.text.items():
+            self._text[str(self.num_rows + row)] = text
+
+        # Rows where the feed rate differs from the row before
+        feed = toolpath.feed
+        if count:
+            previous_feed = np.concatenate(([np.nan if self._feed_rate is None else self._feed_rate], feed[:-1]))
+            for row in np.flatnonzero(feed != previous_feed).tolist():
+                self._feed_changes.append([self.num_rows + row, float(feed[row])])
+            self._feed_rate = float(feed[-1])
+
+        self.num_rows += count
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+
+        trailer = json.dumps({
+            "text": self._text,
+            "feed_changes": self._feed_changes,
+            "start_position": self._start_position or [0, 0, 0],
+        }).encode("utf-8")
+        trailer_offset = self._file.tell()
+        self._file.write(trailer)
+
+        self._file.seek(0)
+        self._file.write(_PREFIX.pack(
+            TOOLPATH_FILE_MAGIC,
+            TOOLPATH_FILE_VERSION,
+            self._header_length,
+            self.num_rows,
+            trailer_offset,
+            len(trailer),
+        ))
+        self._file.close()
+
+
+def write_toolpath_file(
+    path: Union[str, Path], toolpath: Toolpath, header: Optional[Dict[str, Any]] = None
+) -> None:
+    with ToolpathFileWriter(path, header) as writer:
+        writer.append(toolpath)
+
+
+def is_toolpath_file(path: Union[str, Path]) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(TOOLPATH_FILE_MAGIC)) == TOOLPATH_FILE_MAGIC
+
+
+def read_toolpath_file(path: Union[str, Path]) -> ToolpathFile:
+    """
+    Map a binary toolpath file into memory.
+
+    The opcode, flags and position columns of the toolpath are read-only views of the mapped
+    records, so nothing is read until it is used. Only the feed rate column is built, from
+    the feed rate changes in the trailer.
+
+    Raises:
+        ValueError: If the file is not a binary toolpath file, or is from a newer version.
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size or prefix[:len(TOOLPATH_FILE_MAGIC)] != TOOLPATH_FILE_MAGIC:
+            raise ValueError(f"'{path}' is not a binary toolpath file")
+        _, version, header_length, num_rows, trailer_offset, trailer_length = _PREFIX.unpack(prefix)
+        if version != TOOLPATH_FILE_VERSION:
+            raise ValueError(f"Unsupported toolpath file version {version}")
+        if trailer_offset == 0:
+            raise ValueError(f"'{path}' was not closed properly")
+
+        header = json.loads(f.read(header_length))
+        f.seek(trailer_offset)
+        trailer = json.loads(f.read(trailer_length))
+
+    records_offset = _PREFIX.size + header_length
+    if num_rows:
+        records = np.memmap(path, dtype=TOOLPATH_RECORD_DTYPE, mode="r", offset=records_offset, shape=(num_rows,))
+    else:
+        records = np.empty(0, dtype=TOOLPATH_RECORD_DTYPE)
+
+    # Each feed rate holds from the row it changes at until the next change
+    feed = np.zeros(num_rows)
+    feed_changes = trailer["feed_changes"]
+    if feed_changes:
+        change_rows, feed_rates = (np.asarray(column) for column in zip(*feed_changes))
+        run_lengths = np.diff(np.append(change_rows.astype(np.int64), num_rows))
+        feed[int(change_rows[0]):] = np.repeat(feed_rates, run_lengths)
+
+    toolpath = Toolpath.from_columns(
+        records["opcode"],
+        records["flags"],
+        records["x"],
+        records["y"],
+        records["z"],
+        feed,
+        {int(row): text for row, text in trailer["text"].items()},
+        copy=False,
+    )
+    toolpath.start_position = trailer["start_position"]
+    return ToolpathFile(toolpath, header)
+
+
+def read_program(path: Union[str, Path]) -> Union[ToolpathFile, ParsedGcode]:
+    """
+    Read a planned program from either a binary toolpath file or a G-code file.
+
+    Both results have the toolpath, the header parameters and the number of G-code lines.
+    """
+    if is_toolpath_file(path):
+        return read_toolpath_file(path)
+    return parse_gcode_file(path)
+
+
+def iter_program_lines(path: Union[str, Path], chunk_rows: int = 65536) -> Iterator[str]:
+    """
+    The G-code lines of a planned program, read only as they are needed.
+
+    G-code files are read line by line, and binary toolpaths rendered `chunk_rows` rows at a
+    time from the mapped file, so the first line is ready at once whatever the size.
+    """
+    if is_toolpath_file(path):
+        toolpath = read_toolpath_file(path).toolpath
+        for start in range(0, len(toolpath), chunk_rows):
+            yield from toolpath.iter_gcode(start, start + chunk_rows)
+        return
+
+    with open(path, "r") as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def export_gcode(toolpath: Toolpath, sink: TextIO, chunk_rows: int = 65536) -> int:
+    """
+    Write a toolpath as G-code, in chunks of `chunk_rows` rows.
+
+    Lines are separated by newlines with no trailing newline, like the planner's output.
+    Returns the number of lines written.
+    """
+    for start in range(0, len(toolpath), chunk_rows):
+        if start > 0:
+            sink.write("\n")
+        sink.write("\n".join(toolpath.iter_gcode(start, start + chunk_rows)))
+    return len(toolpath)